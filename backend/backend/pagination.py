@@ -0,0 +1,226 @@
+# pagination.py - Pagination par curseur (keyset) des listes de l'API, comptage estimé des grandes tables
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Au-delà de ce nombre de lignes, le total affiché est l'estimation du planificateur
+SEUIL_COMPTAGE_EXACT = 10000
+
+
+def estimer_nombre(queryset):
+    """Nombre de lignes estimé par le planificateur (EXPLAIN), None si la base n'en donne pas
+
+    Sans filtre, PostgreSQL répond à partir de pg_class.reltuples ; avec filtres, à partir
+    des statistiques des colonnes. Aucune ligne n'est lue. SQLite n'estime rien : None.
+    """
+    connexion = connections[queryset.db]
+    if connexion.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connexion.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def compter(queryset, seuil=SEUIL_COMPTAGE_EXACT):
+    """(nombre de lignes, estimé ?) : comptage exact sous le seuil, estimation au-dessus
+
+    Quand le planificateur annonce plus de `seuil` lignes, un COUNT borné à seuil + 1
+    lignes vérifie qu'il ne se trompe pas sur une petite sélection : le coût reste
+    plafonné et un résultat réellement sous le seuil est toujours exact.
+    """
+    estimation = estimer_nombre(queryset)
+    if estimation is None or estimation <= seuil:
+        return queryset.count(), False
+    borne = queryset.order_by()[:seuil + 1].count()
+    if borne <= seuil:
+        return borne, False
+    return max(estimation, borne), True
+
+
+class PaginateurEstime(Paginator):
+    """Paginator Django (admin) dont le total vient de compter() plutôt que d'un COUNT(*)
+
+    À associer à show_full_result_count = False, sinon l'admin recompte toute la table
+    pour afficher « x sur N ».
+    """
+    seuil = SEUIL_COMPTAGE_EXACT
+    estime = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        nombre, self.estime = compter(self.object_list, self.seuil)
+        return nombre
+
+
+class CurseurPagination(BasePagination):
+    """Pagination par curseur (keyset) sur la clé de tri de la liste
+
+    Le coût d'une page reste constant quelle que soit la taille de la table : le curseur
+    enregistre les valeurs de toutes les colonnes de tri de la dernière ligne vue, et se
+    traduit par un WHERE sur la clé de tri (indexée), jamais par un OFFSET. `ordering`
+    doit se terminer par une colonne unique et non nulle (id).
+
+    Autonome : ne s'appuie sur aucun nom privé de CursorPagination (DRF). Pages de
+    page_size lignes par défaut, ?page_size=N jusqu'à max_page_size. Le curseur ne compte
+    jamais ; ?total=1 ajoute le nombre de lignes (estimé au-delà de SEUIL_COMPTAGE_EXACT,
+    voir compter()).
+    """
+    ordering = ('-id',)
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    total_query_param = 'total'
+    invalid_cursor_message = 'Curseur invalide'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, inverse = self.decoder_curseur(request)
+
+        ordre = [self._inverser(champ) for champ in self.ordering] if inverse else list(self.ordering)
+        lignes = queryset.order_by(*ordre)
+        if position is not None:
+            try:
+                lignes = lignes.filter(self._filtre_position(position, inverse))
+            except (TypeError, ValueError, ValidationError):
+                # Valeur de position impossible à convertir vers le type de la colonne
+                raise NotFound(self.invalid_cursor_message)
+
+        # Une ligne de plus pour savoir s'il existe une page au-delà
+        resultats = list(lignes[:self.page_size + 1])
+        page = resultats[:self.page_size]
+        au_dela = len(resultats) > len(page)
+        if inverse:
+            # Page lue à rebours depuis la position : remise dans l'ordre de la liste
+            page.reverse()
+            self.derniere_vue = page[-1] if page else None
+            self.premiere_vue = page[0] if page and au_dela else None
+        else:
+            self.derniere_vue = page[-1] if page and au_dela else None
+            self.premiere_vue = page[0] if page and position is not None else None
+
+        self.total = None
+        if request.query_params.get(self.total_query_param) in ('1', 'true'):
+            self.total = compter(queryset)
+        return page
+
+    @staticmethod
+    def _inverser(champ):
+        return champ[1:] if champ.startswith('-') else f'-{champ}'
+
+    def _filtre_position(self, valeurs, inverse):
+        """Lignes strictement après la position dans l'ordre parcouru (comparaison de tuples)
+
+        (a, b, id) après (x, y, z) : a > x OU (a = x ET b > y) OU (a = x ET b = y ET id > z),
+        chaque > devenant < pour une colonne décroissante. La borne a >= x en tête laisse
+        l'index sur la première colonne délimiter le parcours.
+        """
+        filtre, egalite = Q(), Q()
+        for champ, valeur in zip(self.ordering, valeurs):
+            attribut = champ.lstrip('-')
+            decroissant = champ.startswith('-') != inverse
+            filtre |= egalite & Q(**{f"{attribut}__{'lt' if decroissant else 'gt'}": valeur})
+            egalite &= Q(**{attribut: valeur})
+        premier = self.ordering[0]
+        decroissant = premier.startswith('-') != inverse
+        return Q(**{f"{premier.lstrip('-')}__{'lte' if decroissant else 'gte'}": valeurs[0]}) & filtre
+
+    def position(self, instance):
+        """Valeurs de toutes les colonnes de tri de la ligne (unique grâce à la dernière)"""
+        valeurs = []
+        for champ in self.ordering:
+            attribut = champ.lstrip('-')
+            valeur = instance[attribut] if isinstance(instance, dict) else getattr(instance, attribut)
+            valeurs.append(str(valeur))
+        return valeurs
+
+    def decoder_curseur(self, request):
+        """(position, sens inverse) du curseur de la requête ; (None, False) sans curseur"""
+        curseur = request.query_params.get(self.cursor_query_param)
+        if not curseur:
+            return None, False
+        try:
+            donnees = json.loads(base64.urlsafe_b64decode(curseur.encode()).decode())
+            position, inverse = donnees['p'], bool(donnees.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, inverse
+
+    def encoder_curseur(self, position, inverse=False):
+        donnees = json.dumps({'p': position, 'r': int(inverse)}, separators=(',', ':'))
+        curseur = base64.urlsafe_b64encode(donnees.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, curseur)
+
+    def get_next_link(self):
+        if self.derniere_vue is None:
+            return None
+        return self.encoder_curseur(self.position(self.derniere_vue))
+
+    def get_previous_link(self):
+        if self.premiere_vue is None:
+            return None
+        return self.encoder_curseur(self.position(self.premiere_vue), inverse=True)
+
+    def get_paginated_response(self, data):
+        contenu = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.total is not None:
+            contenu['total'], contenu['total_estime'] = self.total
+        return Response(contenu)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CommandePagination(CurseurPagination):
+    ordering = ('-date_commande', '-id')
+
+
+class VentePagination(CurseurPagination):
+    ordering = ('-date_vente', '-id')
+
+
+class AffectationPagination(CurseurPagination):
+    ordering = ('-date_debut', '-id')
+
+
+class StockPagination(CurseurPagination):
+    ordering = ('id',)
+
+
+class FranchisePagination(CurseurPagination):
+    ordering = ('-created_at', '-id')
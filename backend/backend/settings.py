@@ -109,6 +109,18 @@ DATABASES = {
     }
 }
 
+# Cache des données de référence (entrepôts, produits, catégories, stocks)
+# Mémoire locale par défaut ; avec plusieurs processus, préférer un backend partagé
+# (CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache, CACHE_LOCATION=/chemin)
+# pour que l'invalidation faite par un processus soit vue par les autres.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'drivncook'),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 300)),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -168,6 +180,14 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/") 
 
+# Rapports PDF de ventes : cache disque (hors MEDIA_ROOT, non servi directement)
+RAPPORTS_PDF_DIR = os.getenv('RAPPORTS_PDF_DIR', os.path.join(BASE_DIR, 'var', 'rapports'))
+# True si la commande traiter_rapports_pdf tourne comme worker dédié ; sinon rendu en
+# tâche de fond dans le processus web
+RAPPORTS_PDF_WORKER_EXTERNE = os.getenv('RAPPORTS_PDF_WORKER_EXTERNE', '') == 'True'
+# Durée de conservation des PDF (et des tâches terminées) avant nettoyage
+RAPPORTS_PDF_CONSERVATION_JOURS = int(os.getenv('RAPPORTS_PDF_CONSERVATION_JOURS', '30'))
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'\
     
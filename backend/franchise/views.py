@@ -7,6 +7,7 @@ from rest_framework.views import APIView
 from .serializers import ContactSerializer
 from gestion_camions.models import Franchise
 from .serializers import FranchiseSerializer, UserSerializer, FranchiseUserRegistrationSerializer
+from backend.pagination import FranchisePagination
 
 User = get_user_model()
 
@@ -15,6 +16,7 @@ class FranchiseListCreateView(generics.ListCreateAPIView):
     queryset = Franchise.objects.all().select_related('user')
     serializer_class = FranchiseSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    pagination_class = FranchisePagination
     
     def get_queryset(self):
         """Filtrage par statut si spécifié"""
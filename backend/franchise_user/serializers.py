@@ -1,6 +1,8 @@
 # serializers.py - Espace Franchisé DRIV'N COOK
 
 from rest_framework import serializers
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from django.contrib.auth.models import User
 from gestion_camions.models import (
     Franchise, Camion, CommandeFranchise, DetailCommande, 
@@ -163,26 +165,41 @@ class AffectationEmplacementSerializer(serializers.ModelSerializer):
                     'emplacement': f"Votre franchise n'est pas autorisée à utiliser l'emplacement '{emplacement.nom_emplacement}'"
                 })
             
-            # 🎯 Vérifier les conflits de dates/horaires
-            date_debut = data.get('date_debut')
-            if date_debut and data.get('statut', 'programme') in ['programme', 'en_cours']:
-                conflits = AffectationEmplacement.objects.filter(
-                    emplacement=emplacement,
-                    date_debut=date_debut,
-                    statut__in=['programme', 'en_cours']
-                )
-                
-                # En modification, exclure l'instance actuelle
-                if self.instance:
-                    conflits = conflits.exclude(pk=self.instance.pk)
-                
-                if conflits.exists():
-                    conflit = conflits.first()
+            # 🎯 Vérifier les recouvrements de dates/horaires (emplacement et camion)
+            affectation = AffectationEmplacement(
+                pk=self.instance.pk if self.instance else None,
+                camion=camion,
+                emplacement=emplacement,
+                **{
+                    champ: data.get(champ, getattr(self.instance, champ, None))
+                    for champ in ['date_debut', 'date_fin', 'horaire_debut', 'horaire_fin']
+                },
+                statut=data.get('statut', getattr(self.instance, 'statut', 'programme'))
+            )
+            erreur = affectation.erreur_periode()
+            if erreur:
+                raise serializers.ValidationError({'date_fin': erreur})
+            
+            if affectation.date_debut and affectation.statut in AffectationEmplacement.STATUTS_ACTIFS:
+                conflit = affectation.conflits().select_related('camion', 'emplacement').first()
+                if conflit:
                     raise serializers.ValidationError({
-                        'date_debut': f"Conflit : emplacement déjà occupé le {date_debut} par le camion {conflit.camion.numero_camion}"
+                        'date_debut': affectation.message_conflit(conflit)
                     })
         
         return data
+    
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+    
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
 
 class MaintenanceCamionSerializer(serializers.ModelSerializer):
     """Maintenances des camions (lecture seule pour le franchisé)"""
@@ -365,29 +382,16 @@ class MesCommandeCreateSerializer(serializers.ModelSerializer):
         """Création d'une commande multi-entrepôts avec ses détails"""
         details_data = validated_data.pop('details')
         
-        # Créer la commande sans entrepôt fixe
-        commande = CommandeFranchise.objects.create(**validated_data)
-        
-        for detail_data in details_data:
-            try:
-                produit = Produit.objects.get(id=detail_data['produit'])
-                entrepot_livraison = Entrepot.objects.get(id=detail_data['entrepot_livraison'])
-            except (Produit.DoesNotExist, Entrepot.DoesNotExist):
-                raise serializers.ValidationError(
-                    f"Produit ou entrepôt introuvable : {detail_data}"
-                )
+        with transaction.atomic():
+            # Créer la commande sans entrepôt fixe
+            commande = CommandeFranchise.objects.create(**validated_data)
             
-            DetailCommande.objects.create(
-                commande=commande,
-                produit=produit,
-                entrepot_livraison=entrepot_livraison,
-                quantite_commandee=detail_data['quantite_commandee'],
-                prix_unitaire=produit.prix_unitaire
-            )
+            # Lignes insérées en bloc, montants recalculés une seule fois
+            try:
+                commande.ajouter_details(details_data)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages)
         
-        # Calcul final des montants
-        commande.calculer_montants()
-        commande.save()
         return commande
 
 
@@ -504,31 +508,15 @@ class MesCommandeUpdateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         
-        # Supprimer les anciens détails
-        instance.details.all().delete()
-        
-        # Créer les nouveaux détails
-        for detail_data in details_data:
-            try:
-                produit = Produit.objects.get(id=detail_data['produit'])
-                entrepot_livraison = Entrepot.objects.get(id=detail_data['entrepot_livraison'])
-            except (Produit.DoesNotExist, Entrepot.DoesNotExist):
-                raise serializers.ValidationError(
-                    f"Produit ou entrepôt introuvable : {detail_data}"
-                )
+        with transaction.atomic():
+            # Supprimer les anciens détails
+            instance.details.all().delete()
             
-            DetailCommande.objects.create(
-                commande=instance,
-                produit=produit,
-                entrepot_livraison=entrepot_livraison,
-                quantite_commandee=detail_data['quantite_commandee'],
-                prix_unitaire=produit.prix_unitaire
-            )
-        
-       
-        instance.refresh_from_db()  # Recharger l'instance depuis la DB
-        instance.calculer_montants()  # Recalculer les montants
-        instance.save()  # Sauvegarder les nouveaux montants
+            # Créer les nouveaux détails en bloc (montants recalculés une seule fois)
+            try:
+                instance.ajouter_details(details_data)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages)
         
         return instance
 # 🎯 NOUVEAU : Serializer pour les commandes complètes (lecture)
@@ -18,6 +18,9 @@ from .views import (
     StockMultiEntrepotListView,
     dashboard_stats,
     rapport_ventes_mensuel,
+    rapport_ventes_demander,
+    rapport_ventes_tache,
+    rapport_ventes_tache_pdf,
 )
 
 
@@ -36,6 +39,9 @@ urlpatterns = [
     path('ventes/<int:pk>/', VenteFranchiseDetailView.as_view(), name='ventes-detail'),
     path('dashboard/stats/', dashboard_stats, name='dashboard-stats'),
     path('rapports/ventes/', rapport_ventes_mensuel, name='rapport-ventes-mensuel'),
+    path('rapports/ventes/taches/', rapport_ventes_demander, name='rapport-ventes-demander'),
+    path('rapports/ventes/taches/<int:pk>/', rapport_ventes_tache, name='rapport-ventes-tache'),
+    path('rapports/ventes/taches/<int:pk>/pdf/', rapport_ventes_tache_pdf, name='rapport-ventes-tache-pdf'),
     
     path('mes-commandes/', 
          MesCommandesListCreateView.as_view(), 
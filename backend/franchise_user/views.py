@@ -6,12 +6,14 @@ from rest_framework.response import Response
 from django.db.models import Sum
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import PermissionDenied
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from rest_framework import serializers
+from gestion_camions.cache import CacheReferenceMixin
+from backend.pagination import AffectationPagination, CommandePagination, VentePagination
 from gestion_camions.models import (
     Camion, CommandeFranchise, Franchise,
     VenteFranchise, Entrepot, StockEntrepot,
-    AffectationEmplacement, Emplacement, MaintenanceCamion, DetailCommande
+    AffectationEmplacement, Emplacement, MaintenanceCamion, DetailCommande, TableauDeBord
 )
 
 from .serializers import (
@@ -155,6 +157,7 @@ class AffectationEmplacementListCreateView(generics.ListCreateAPIView):
     """Affectations d'emplacements du franchisé"""
     serializer_class = AffectationEmplacementSerializer
     permission_classes = [IsFranchiseOwner]
+    pagination_class = AffectationPagination
     
     def get_queryset(self):
         return AffectationEmplacement.objects.filter(
@@ -239,11 +242,12 @@ class MaintenanceCamionListView(generics.ListAPIView):
 
 # ========== GESTION DES ENTREPÔTS ET STOCKS ==========
 
-class EntrepotListView(generics.ListAPIView):
+class EntrepotListView(CacheReferenceMixin, generics.ListAPIView):
     """Liste des entrepôts disponibles"""
     serializer_class = EntrepotSerializer
     permission_classes = [IsFranchiseOwner]
     queryset = Entrepot.objects.filter(statut='actif')
+    ressources_cache = ['entrepots']
 
 class StockEntrepotListView(generics.ListAPIView):
     """Consultation des stocks par entrepôt"""
@@ -266,6 +270,7 @@ class StockEntrepotListView(generics.ListAPIView):
 class MesCommandesListCreateView(generics.ListCreateAPIView):
     """Liste et création des commandes multi-entrepôts pour le franchisé connecté"""
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CommandePagination
     
     def get_queryset(self):
         # Vérifier que l'utilisateur est un franchisé
@@ -287,15 +292,9 @@ class MesCommandesListCreateView(generics.ListCreateAPIView):
         
         # Filtre par conformité 80/20
         conforme_80_20 = self.request.query_params.get('conforme_80_20')
-        if conforme_80_20 is not None:
-            # Appliquer le filtre après avoir récupéré les objets
-            # car la conformité est calculée dynamiquement
-            queryset_list = list(queryset)
-            if conforme_80_20 == 'false':
-                queryset_list = [cmd for cmd in queryset_list if not cmd.respecte_regle_80_20()[0]]
-            elif conforme_80_20 == 'true':
-                queryset_list = [cmd for cmd in queryset_list if cmd.respecte_regle_80_20()[0]]
-            return queryset_list
+        if conforme_80_20 in ('true', 'false'):
+            # La conformité est stockée (et indexée) sur la commande
+            queryset = queryset.filter(conforme_80_20=(conforme_80_20 == 'true'))
         
         return queryset.order_by('-date_commande')
     
@@ -526,10 +525,11 @@ class MesDetailCommandeDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 
 # ========== VUE POUR LES STOCKS MULTI-ENTREPÔTS ==========
-class StockMultiEntrepotListView(generics.ListAPIView):
+class StockMultiEntrepotListView(CacheReferenceMixin, generics.ListAPIView):
     """Consultation des stocks d'un produit dans tous les entrepôts"""
     serializer_class = StockMultiEntrepotSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ressources_cache = ['stocks', 'produits', 'entrepots']
     
     def get_queryset(self):
         """Retourne les produits avec leurs stocks dans différents entrepôts"""
@@ -582,6 +582,7 @@ class StockMultiEntrepotListView(generics.ListAPIView):
 class VenteFranchiseListCreateView(generics.ListCreateAPIView):
     """Saisie et consultation des ventes quotidiennes"""
     permission_classes = [IsFranchiseOwner]
+    pagination_class = VentePagination
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -636,82 +637,78 @@ def dashboard_stats(request):
     """Statistiques pour le tableau de bord du franchisé"""
     franchise = request.user.franchise
     
-    # Statistiques des camions
-    camions_total = Camion.objects.filter(franchise=franchise).count()
-    camions_actifs = Camion.objects.filter(
-        franchise=franchise, 
-        statut__in=['disponible', 'attribue']
-    ).count()
-    
-    # 🎯 AJOUTÉ : Statistiques des emplacements
-    emplacements_autorises = Emplacement.objects.filter(
-        franchises_autorisees=franchise
-    ).count()
-    
-    # Statistiques des commandes
-    commandes_en_cours = CommandeFranchise.objects.filter(
-        franchise=franchise,
-        statut__in=['en_attente', 'validee', 'preparee']
-    ).count()
-    
-    # Statistiques des ventes (30 derniers jours)
-    date_limite = datetime.now().date() - timedelta(days=30)
-    ventes_30j = VenteFranchise.objects.filter(
-        franchise=franchise,
-        date_vente__gte=date_limite
-    ).aggregate(
-        total_ca=Sum('chiffre_affaires_jour'),
-        total_redevance=Sum('redevance_due')
-    )
-    
-    # Affectations actives
-    affectations_actives = AffectationEmplacement.objects.filter(
-        camion__franchise=franchise,
-        statut='en_cours'
-    ).count()
-    
-    # 🎯 AJOUTÉ : Affectations programmées
-    affectations_programmees = AffectationEmplacement.objects.filter(
-        camion__franchise=franchise,
-        statut='programme'
-    ).count()
+    # Compteurs pré-calculés (une ligne, recalculée seulement après une écriture)
+    tableau = TableauDeBord.obtenir(franchise)
     
     return Response({
         'camions': {
-            'total': camions_total,
-            'actifs': camions_actifs
+            'total': tableau.camions_total,
+            'actifs': tableau.camions_actifs
         },
         # 🎯 AJOUTÉ : Section emplacements
         'emplacements': {
-            'autorises': emplacements_autorises,
-            'affectations_actives': affectations_actives,
-            'affectations_programmees': affectations_programmees
+            'autorises': tableau.emplacements_autorises,
+            'affectations_actives': tableau.affectations_actives,
+            'affectations_programmees': tableau.affectations_programmees
         },
-        'commandes_en_cours': commandes_en_cours,
+        'commandes_en_cours': tableau.commandes_en_cours,
         'ventes_30j': {
-            'chiffre_affaires': ventes_30j['total_ca'] or 0,
-            'redevance_due': ventes_30j['total_redevance'] or 0
+            'chiffre_affaires': tableau.chiffre_affaires_30j,
+            'redevance_due': tableau.redevance_30j
         },
-        'affectations_actives': affectations_actives  # 🎯 Gardé pour compatibilité
+        'affectations_actives': tableau.affectations_actives  # 🎯 Gardé pour compatibilité
     })
      
     
 # Rapport de ventes mensuel en PDF
-from django.http import HttpResponse
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from io import BytesIO
-from datetime import datetime
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from gestion_camions.models import TacheRapportPDF
+from gestion_camions.rapports import (
+    demander_rapport, executer_tache, nom_fichier_rapport, pdf_ventes_mensuel, relancer_si_bloquee,
+    ventes_du_mois
+)
 
 
+def _mois_demande(mois):
+    """Premier jour du mois YYYY-MM, None si le format est invalide"""
+    try:
+        annee, mois_num = mois.split('-')
+        return date(int(annee), int(mois_num), 1)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _reponse_pdf(tache):
+    response = FileResponse(
+        open(tache.chemin, 'rb'),
+        as_attachment=True,
+        filename=nom_fichier_rapport(tache.franchise, tache.mois),
+        content_type='application/pdf'
+    )
+    return response
+
+
+def _etat_tache(request, tache):
+    return {
+        'id': tache.id,
+        'mois': f"{tache.mois:%Y-%m}",
+        'statut': tache.statut,
+        'erreur': tache.erreur,
+        'url_statut': request.build_absolute_uri(reverse('rapport-ventes-tache', args=[tache.id])),
+        'url_pdf': request.build_absolute_uri(reverse('rapport-ventes-tache-pdf', args=[tache.id])),
+    }
+
 
 @api_view(['GET'])
 @permission_classes([IsFranchiseOwner])
 def rapport_ventes_mensuel(request):
-    """Rapport de ventes mensuel en PDF"""
+    """Rapport de ventes mensuel en PDF (téléchargement direct)
+    
+    Servi depuis le cache disque s'il a déjà été produit pour les mêmes données ; sinon
+    rendu dans la requête puis mis en cache. Pour un rendu en tâche de fond, utiliser
+    POST rapports/ventes/taches/ puis suivre le statut.
+    """
     franchise = request.user.franchise
     mois = request.query_params.get('mois')  # Format: YYYY-MM
     
@@ -721,203 +718,69 @@ def rapport_ventes_mensuel(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    try:
-        annee, mois_num = mois.split('-')
-        annee, mois_num = int(annee), int(mois_num)
-    except ValueError:
+    premier_jour = _mois_demande(mois)
+    if premier_jour is None:
         return Response(
             {'error': 'Format de mois invalide (format: YYYY-MM)'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Récupérer les ventes du mois
-    ventes = VenteFranchise.objects.filter(
-        franchise=franchise,
-        date_vente__year=annee,
-        date_vente__month=mois_num
-    ).order_by('date_vente')
-    
-    # Calculer les totaux
-    total_ca = ventes.aggregate(Sum('chiffre_affaires_jour'))['chiffre_affaires_jour__sum'] or 0
-    total_redevance = ventes.aggregate(Sum('redevance_due'))['redevance_due__sum'] or 0
-    
-    # Nom du mois en français
-    mois_noms = [
-        '', 'Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
-        'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre'
-    ]
-    
-    # Générer le PDF
-    buffer = BytesIO()
-    
-    # Configuration du document
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
-    )
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        textColor=colors.HexColor('#3b82f6'),
-        alignment=1  # Centré
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=20,
-        textColor=colors.HexColor('#666666'),
-        alignment=1
-    )
+    tache = demander_rapport(franchise, premier_jour, planifier=False)
+    if not tache.disponible and not executer_tache(tache):
+        # Déjà en cours de rendu ailleurs : rendu direct, sans attendre
+        pdf = pdf_ventes_mensuel(franchise, premier_jour, ventes_du_mois(franchise, premier_jour))
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{nom_fichier_rapport(franchise, premier_jour)}"'
+        return response
     
-    normal_style = styles['Normal']
-    
-    # Contenu du PDF
-    story = []
-    
-    # Titre
-    story.append(Paragraph("RAPPORT MENSUEL DE VENTES", title_style))
-    story.append(Paragraph(f"DRIV'N COOK - {franchise.nom_franchise}", subtitle_style))
-    story.append(Spacer(1, 20))
-    
-    # Informations de la franchise
-    franchise_data = [
-        ['Franchise:', franchise.nom_franchise],
-        ['Propriétaire:', f"{franchise.user.first_name} {franchise.user.last_name}"],
-        ['Adresse:', f"{franchise.adresse}, {franchise.code_postal} {franchise.ville}"],
-        ['Période:', f"{mois_noms[mois_num]} {annee}"],
-        ['Date de génération:', datetime.now().strftime("%d/%m/%Y à %H:%M")],
-    ]
-    
-    franchise_table = Table(franchise_data, colWidths=[4*cm, 12*cm])
-    franchise_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8fafc')),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    
-    story.append(franchise_table)
-    story.append(Spacer(1, 20))
-    
-    # Résumé des ventes
-    story.append(Paragraph("RÉSUMÉ DU MOIS", styles['Heading2']))
-    story.append(Spacer(1, 10))
-    
-    resume_data = [
-        ['Nombre de jours d\'activité:', str(ventes.count())],
-        ['Chiffre d\'affaires total:', f"{total_ca:,.2f} €"],
-        ['Redevances dues (4%):', f"{total_redevance:,.2f} €"],
-        ['Moyenne journalière:', f"{(total_ca / ventes.count() if ventes.count() > 0 else 0):,.2f} €"],
-    ]
-    
-    resume_table = Table(resume_data, colWidths=[8*cm, 8*cm])
-    resume_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e0f2fe')),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bae6fd')),
-        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-    ]))
-    
-    story.append(resume_table)
-    story.append(Spacer(1, 30))
-    
-    # Détail des ventes
-    if ventes.exists():
-        story.append(Paragraph("DÉTAIL DES VENTES", styles['Heading2']))
-        story.append(Spacer(1, 10))
-        
-        # En-têtes du tableau
-        ventes_data = [['Date', 'Chiffre d\'affaires', 'Transactions', 'Redevance due']]
-        
-        # Données des ventes
-        for vente in ventes:
-            ventes_data.append([
-                vente.date_vente.strftime("%d/%m/%Y"),
-                f"{vente.chiffre_affaires_jour:,.2f} €",
-                str(vente.nombre_transactions),
-                f"{vente.redevance_due:,.2f} €"
-            ])
-        
-        # Ligne de total
-        ventes_data.append([
-            'TOTAL',
-            f"{total_ca:,.2f} €",
-            str(sum(v.nombre_transactions for v in ventes)),
-            f"{total_redevance:,.2f} €"
-        ])
-        
-        ventes_table = Table(ventes_data, colWidths=[3*cm, 4*cm, 3*cm, 4*cm])
-        ventes_table.setStyle(TableStyle([
-            # En-tête
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            
-            # Corps du tableau
-            ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -2), 9),
-            ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
-            
-            # Ligne de total
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, -1), (-1, -1), 10),
-            
-            # Grille et espacement
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            
-            # Alternance de couleurs
-            ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#f9fafb')]),
-        ]))
-        
-        story.append(ventes_table)
-    else:
-        story.append(Paragraph("Aucune vente enregistrée pour cette période.", normal_style))
-    
-    # Générer le PDF
-    doc.build(story)
-    
-    # Nom du fichier
-    filename = f"rapport_ventes_{franchise.nom_franchise.replace(' ', '_')}_{mois}.pdf"
-    
-    # Préparer la réponse
-    pdf = buffer.getvalue()
-    buffer.close()
+    if tache.statut == 'erreur':
+        return Response(
+            {'error': 'Erreur lors de la génération du rapport PDF'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return _reponse_pdf(tache)
+
+
+@api_view(['POST'])
+@permission_classes([IsFranchiseOwner])
+def rapport_ventes_demander(request):
+    """Met en file le rendu du rapport du mois (body ou query : mois=YYYY-MM)
     
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    response['Content-Length'] = len(pdf)
+    202 tant que le PDF est en préparation, 200 s'il est déjà disponible.
+    """
+    premier_jour = _mois_demande(request.data.get('mois') or request.query_params.get('mois'))
+    if premier_jour is None:
+        return Response(
+            {'error': 'Paramètre mois requis (format: YYYY-MM)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    return response
\ No newline at end of file
+    tache = demander_rapport(request.user.franchise, premier_jour)
+    return Response(
+        _etat_tache(request, tache),
+        status=status.HTTP_200_OK if tache.disponible else status.HTTP_202_ACCEPTED
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsFranchiseOwner])
+def rapport_ventes_tache(request, pk):
+    """Statut d'une tâche de rapport PDF (remise en file si elle est bloquée)"""
+    tache = get_object_or_404(TacheRapportPDF, pk=pk, franchise=request.user.franchise)
+    relancer_si_bloquee(tache)
+    return Response(_etat_tache(request, tache))
+
+
+@api_view(['GET'])
+@permission_classes([IsFranchiseOwner])
+def rapport_ventes_tache_pdf(request, pk):
+    """PDF produit par une tâche terminée"""
+    tache = get_object_or_404(
+        TacheRapportPDF.objects.select_related('franchise'), pk=pk, franchise=request.user.franchise
+    )
+    if not tache.disponible:
+        return Response(
+            {'error': 'Rapport pas encore disponible', 'statut': tache.statut},
+            status=status.HTTP_409_CONFLICT
+        )
+    return _reponse_pdf(tache)
\ No newline at end of file
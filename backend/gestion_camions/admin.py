@@ -1,18 +1,59 @@
 # admin.py - DRIV'N COOK Administration personnalisée CORRIGÉE
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.html import format_html
 from django.utils import timezone
 from django.urls import reverse
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, Q, Exists, OuterRef, Prefetch, Subquery
 from decimal import Decimal
+from backend.pagination import PaginateurEstime
 from . import models
 
+def queryset_libelles(modele):
+    """Lignes affichées par les widgets d'autocomplétion : ce que lit leur __str__, en une requête"""
+    if modele is models.Franchise:
+        return models.Franchise.objects.select_related('user')
+    if modele is models.CommandeFranchise:
+        return models.CommandeFranchise.objects.select_related('franchise').avec_nombre_entrepots()
+    return modele._default_manager.all()
+
+
 class CustomAdminMixin:
+    # Recherche des widgets d'autocomplétion : préfixes sur les colonnes indexées en UPPER()
+    # (migration 0015), plutôt que les icontains de search_fields qui parcourent la table
+    champs_recherche_autocompletion = None
+
     class Media:
         css = {
             'all': ('admin/css/custom.css',)
         }
 
+    def est_autocompletion(self, request):
+        """Requête du widget d'autocomplétion d'un autre formulaire (pas de colonnes de liste)"""
+        return getattr(request.resolver_match, 'url_name', None) == 'autocomplete'
+
+    def get_search_fields(self, request):
+        if self.champs_recherche_autocompletion and self.est_autocompletion(request):
+            return self.champs_recherche_autocompletion
+        return super().get_search_fields(request)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request) and 'queryset' not in kwargs:
+            kwargs['queryset'] = queryset_libelles(db_field.related_model)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request) and 'queryset' not in kwargs:
+            kwargs['queryset'] = queryset_libelles(db_field.related_model)
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
+class FranchiseListFilter(admin.RelatedFieldListFilter):
+    """Filtre par franchise : libellés (nom + franchisé) chargés en une requête"""
+    def field_choices(self, field, request, model_admin):
+        return [
+            (franchise.pk, str(franchise))
+            for franchise in models.Franchise.objects.select_related('user').order_by('nom_franchise')
+        ]
+
 # Personnalisation du site admin
 admin.site.site_header = "DRIV'N COOK - Administration"
 admin.site.site_title = "DRIV'N COOK Admin"
@@ -24,6 +65,7 @@ class EntrepotAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAd
     list_display = ['nom_entrepot', 'ville', 'type_entrepot_badge', 'statut_badge', 'stock_count', 'created_at']
     list_filter = ['type_entrepot', 'statut', 'ville', 'created_at']
     search_fields = ['nom_entrepot', 'ville', 'responsable', 'adresse']
+    champs_recherche_autocompletion = ['^nom_entrepot']
     list_per_page = 20
     ordering = ['type_entrepot', 'nom_entrepot']
     
@@ -58,10 +100,16 @@ class EntrepotAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAd
         )
     statut_badge.short_description = 'Statut'
     
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.est_autocompletion(request):
+            return queryset
+        return queryset.annotate(nb_stocks=Count('stocks'))
+    
     def stock_count(self, obj):
-        count = obj.stocks.count()
-        return format_html('<strong>{}</strong> produits', count)
+        return format_html('<strong>{}</strong> produits', obj.nb_stocks)
     stock_count.short_description = 'Produits en stock'
+    stock_count.admin_order_field = 'nb_stocks'
 
 
 @admin.register(models.Franchise)
@@ -69,6 +117,8 @@ class FranchiseAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomA
     list_display = ['nom_franchise', 'get_franchisee_name', 'statut_badge', 'statut_paiement_badge', 'droit_entree', 'camions_count', 'emplacements_count', 'created_at']
     list_filter = ['statut', 'statut_paiement', 'date_signature', 'created_at']
     search_fields = ['nom_franchise', 'user__first_name', 'user__last_name', 'user__email', 'ville']
+    champs_recherche_autocompletion = ['^nom_franchise']
+    raw_id_fields = ['user', 'valide_par']
     list_per_page = 20
     ordering = ['-created_at']
     
@@ -93,6 +143,15 @@ class FranchiseAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomA
     )
     readonly_fields = ['date_validation', 'date_paiement']
     
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).select_related('user')
+        if self.est_autocompletion(request):
+            return queryset
+        return queryset.annotate(
+            nb_camions=Count('camions', distinct=True),
+            nb_emplacements=Count('emplacements_autorises', distinct=True)
+        )
+    
     def get_franchisee_name(self, obj):
         if obj.user:
             return f"{obj.user.first_name} {obj.user.last_name}".strip() or obj.user.email
@@ -130,14 +189,14 @@ class FranchiseAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomA
     statut_paiement_badge.short_description = 'Paiement'
     
     def camions_count(self, obj):
-        count = obj.camions.count()
-        return format_html('<strong>{}</strong> camion(s)', count)
+        return format_html('<strong>{}</strong> camion(s)', obj.nb_camions)
     camions_count.short_description = 'Camions'
+    camions_count.admin_order_field = 'nb_camions'
     
     def emplacements_count(self, obj):
-        count = obj.emplacements_autorises.count()
-        return format_html('<strong>{}</strong> emplacement(s)', count)
+        return format_html('<strong>{}</strong> emplacement(s)', obj.nb_emplacements)
     emplacements_count.short_description = 'Emplacements'
+    emplacements_count.admin_order_field = 'nb_emplacements'
 
 
 @admin.register(models.Emplacement)
@@ -145,7 +204,8 @@ class EmplacementAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ Custo
     list_display = ['nom_emplacement', 'ville', 'type_zone_badge', 'tarif_journalier', 'franchises_count', 'disponibilite_badge']
     list_filter = ['type_zone', 'ville', 'created_at']
     search_fields = ['nom_emplacement', 'ville', 'adresse']
-    filter_horizontal = ['franchises_autorisees']
+    champs_recherche_autocompletion = ['^nom_emplacement']
+    autocomplete_fields = ['franchises_autorisees']
     list_per_page = 20
     ordering = ['ville', 'nom_emplacement']
     
@@ -164,6 +224,19 @@ class EmplacementAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ Custo
         }),
     )
     
+    def get_queryset(self, request):
+        if self.est_autocompletion(request):
+            return super().get_queryset(request)
+        affectations_actives = models.AffectationEmplacement.objects.filter(
+            emplacement=OuterRef('pk'),
+            statut__in=models.AffectationEmplacement.STATUTS_ACTIFS
+        ).order_by('-date_debut')
+        return super().get_queryset(request).annotate(
+            nb_franchises=Count('franchises_autorisees'),
+            occupe=Exists(affectations_actives),
+            camion_occupant=Subquery(affectations_actives.values('camion__numero_camion')[:1])
+        )
+    
     def type_zone_badge(self, obj):
         colors = {
             'centre_ville': '#3b82f6',
@@ -180,17 +253,16 @@ class EmplacementAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ Custo
     type_zone_badge.short_description = 'Type'
     
     def franchises_count(self, obj):
-        count = obj.franchises_autorisees.count()
-        return format_html('<strong>{}</strong> franchise(s)', count)
+        return format_html('<strong>{}</strong> franchise(s)', obj.nb_franchises)
     franchises_count.short_description = 'Franchises autorisées'
+    franchises_count.admin_order_field = 'nb_franchises'
     
     def disponibilite_badge(self, obj):
-        if obj.est_disponible:
+        if not obj.occupe:
             return format_html('<span style="color: #10b981;">✅ Disponible</span>')
         else:
-            affectation = obj.affectation_actuelle
-            if affectation:
-                return format_html('<span style="color: #ef4444;">❌ Occupé par {}</span>', affectation.camion.numero_camion)
+            if obj.camion_occupant:
+                return format_html('<span style="color: #ef4444;">❌ Occupé par {}</span>', obj.camion_occupant)
             return format_html('<span style="color: #f59e0b;">⚠️ Indisponible</span>')
     disponibilite_badge.short_description = 'Disponibilité'
 
@@ -198,8 +270,10 @@ class EmplacementAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ Custo
 @admin.register(models.Camion)
 class CamionAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAdminMixin
     list_display = ['numero_camion', 'immatriculation', 'get_franchise_name', 'statut_badge', 'kilometrage', 'maintenances_count']
-    list_filter = ['statut', 'marque', 'franchise', 'date_attribution']
+    list_filter = ['statut', 'marque', ('franchise', FranchiseListFilter), 'date_attribution']
     search_fields = ['numero_camion', 'immatriculation', 'marque', 'modele', 'franchise__nom_franchise']
+    champs_recherche_autocompletion = ['^numero_camion', '^immatriculation']
+    autocomplete_fields = ['franchise']
     list_per_page = 20
     ordering = ['numero_camion']
     
@@ -215,6 +289,12 @@ class CamionAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAdmi
         }),
     )
     
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.est_autocompletion(request):
+            return queryset
+        return queryset.select_related('franchise').annotate(nb_maintenances=Count('maintenances'))
+    
     def get_franchise_name(self, obj):
         return obj.franchise.nom_franchise if obj.franchise else "Non attribué"
     get_franchise_name.short_description = 'Franchise'
@@ -234,16 +314,17 @@ class CamionAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAdmi
     statut_badge.short_description = 'Statut'
     
     def maintenances_count(self, obj):
-        count = obj.maintenances.count()
-        return format_html('<strong>{}</strong> intervention(s)', count)
+        return format_html('<strong>{}</strong> intervention(s)', obj.nb_maintenances)
     maintenances_count.short_description = 'Maintenances'
+    maintenances_count.admin_order_field = 'nb_maintenances'
 
 
 @admin.register(models.MaintenanceCamion)
 class MaintenanceCamionAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAdminMixin
     list_display = ['camion', 'type_maintenance_badge', 'date_maintenance', 'statut_badge', 'cout', 'garage']
-    list_filter = ['type_maintenance', 'statut', 'date_maintenance', 'camion__franchise']
+    list_filter = ['type_maintenance', 'statut', 'date_maintenance', ('camion__franchise', FranchiseListFilter)]
     search_fields = ['camion__numero_camion', 'camion__immatriculation', 'description', 'garage']
+    autocomplete_fields = ['camion']
     date_hierarchy = 'date_maintenance'
     list_per_page = 20
     ordering = ['-date_maintenance']
@@ -257,6 +338,9 @@ class MaintenanceCamionAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('camion')
+    
     def type_maintenance_badge(self, obj):
         colors = {
             'revision': '#3b82f6',
@@ -288,8 +372,9 @@ class MaintenanceCamionAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ
 @admin.register(models.AffectationEmplacement)
 class AffectationEmplacementAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAdminMixin
     list_display = ['camion', 'emplacement', 'date_debut', 'date_fin', 'statut_badge', 'get_franchise_name']
-    list_filter = ['statut', 'date_debut', 'emplacement__type_zone', 'camion__franchise']
+    list_filter = ['statut', 'date_debut', 'emplacement__type_zone', ('camion__franchise', FranchiseListFilter)]
     search_fields = ['camion__numero_camion', 'emplacement__nom_emplacement', 'emplacement__ville']
+    autocomplete_fields = ['camion', 'emplacement']
     date_hierarchy = 'date_debut'
     list_per_page = 20
     ordering = ['-date_debut']
@@ -303,6 +388,9 @@ class AffectationEmplacementAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJ
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('camion__franchise', 'emplacement')
+    
     def statut_badge(self, obj):
         colors = {
             'programme': '#f59e0b',
@@ -329,10 +417,13 @@ class CategorieProduitAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ
     list_per_page = 20
     ordering = ['nom_categorie']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(nb_produits=Count('produits'))
+    
     def produits_count(self, obj):
-        count = obj.produits.count()
-        return format_html('<strong>{}</strong> produit(s)', count)
+        return format_html('<strong>{}</strong> produit(s)', obj.nb_produits)
     produits_count.short_description = 'Produits'
+    produits_count.admin_order_field = 'nb_produits'
 
 
 @admin.register(models.Produit)
@@ -340,17 +431,24 @@ class ProduitAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAdm
     list_display = ['nom_produit', 'categorie', 'prix_unitaire_badge', 'unite', 'stocks_count']
     list_filter = ['categorie', 'unite', 'created_at']
     search_fields = ['nom_produit', 'categorie__nom_categorie']
+    champs_recherche_autocompletion = ['^nom_produit']
     list_per_page = 20
     ordering = ['nom_produit']
     
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.est_autocompletion(request):
+            return queryset
+        return queryset.select_related('categorie').annotate(nb_stocks=Count('stocks'))
+    
     def prix_unitaire_badge(self, obj):
         return format_html('<strong style="color: #10b981;">{} €</strong>', obj.prix_unitaire)
     prix_unitaire_badge.short_description = 'Prix unitaire'
     
     def stocks_count(self, obj):
-        count = obj.stocks.count()
-        return format_html('<strong>{}</strong> entrepôt(s)', count)
+        return format_html('<strong>{}</strong> entrepôt(s)', obj.nb_stocks)
     stocks_count.short_description = 'Entrepôts'
+    stocks_count.admin_order_field = 'nb_stocks'
 
 
 @admin.register(models.StockEntrepot)
@@ -358,9 +456,15 @@ class StockEntrepotAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ Cus
     list_display = ['produit', 'entrepot', 'quantite_disponible_badge', 'quantite_reservee', 'alerte_badge']
     list_filter = ['entrepot', 'produit__categorie', 'created_at']
     search_fields = ['produit__nom_produit', 'entrepot__nom_entrepot']
+    autocomplete_fields = ['produit', 'entrepot']
     list_per_page = 20
+    paginator = PaginateurEstime  # Grande table : total estimé au-delà du seuil
+    show_full_result_count = False
     ordering = ['entrepot__nom_entrepot', 'produit__nom_produit']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('produit', 'entrepot')
+    
     def quantite_disponible_badge(self, obj):
         color = '#ef4444' if obj.alerte_stock else '#10b981'
         return format_html('<strong style="color: {};">{}</strong>', color, obj.quantite_disponible)
@@ -378,15 +482,20 @@ class DetailCommandeInline(admin.TabularInline):
     extra = 0
     fields = ['produit', 'entrepot_livraison', 'quantite_commandee', 'prix_unitaire', 'sous_total']
     readonly_fields = ['sous_total']
+    autocomplete_fields = ['produit', 'entrepot_livraison']
 
 
 @admin.register(models.CommandeFranchise)
 class CommandeFranchiseAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAdminMixin
     list_display = ['numero_commande', 'franchise', 'date_commande', 'statut_badge', 'montant_total_badge', 'regle_80_20_badge', 'entrepots_count']
-    list_filter = ['statut', 'date_commande', 'franchise']
+    list_filter = ['statut', 'date_commande', ('franchise', FranchiseListFilter)]
     search_fields = ['numero_commande', 'franchise__nom_franchise', 'franchise__user__first_name', 'franchise__user__last_name']
+    champs_recherche_autocompletion = ['^numero_commande']
+    autocomplete_fields = ['franchise']
     date_hierarchy = 'date_commande'
     list_per_page = 20
+    paginator = PaginateurEstime  # Grande table : total estimé au-delà du seuil
+    show_full_result_count = False
     ordering = ['-date_commande']
     inlines = [DetailCommandeInline]
     
@@ -403,6 +512,36 @@ class CommandeFranchiseAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ
         }),
     )
     readonly_fields = ['numero_commande', 'montant_total', 'montant_drivn_cook', 'montant_fournisseur_libre']
+    actions = ['valider_commandes', 'preparer_commandes', 'livrer_commandes']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('franchise__user').avec_nombre_entrepots()
+    
+    def traiter_en_lot(self, request, queryset, traitement):
+        """Applique CommandeFranchise.*_en_lot à la sélection, échecs regroupés par motif"""
+        resultats = traitement(list(queryset.values_list('pk', flat=True)))
+        echecs = {}
+        for resultat in resultats:
+            if not resultat['succes']:
+                echecs.setdefault(resultat['error'], []).append(resultat['numero_commande'] or str(resultat['id']))
+        
+        reussies = len(resultats) - sum(len(numeros) for numeros in echecs.values())
+        if reussies:
+            self.message_user(request, f"{reussies} commande(s) traitée(s)", messages.SUCCESS)
+        for erreur, numeros in echecs.items():
+            self.message_user(request, f"{erreur} : {', '.join(numeros)}", messages.WARNING)
+    
+    def valider_commandes(self, request, queryset):
+        self.traiter_en_lot(request, queryset, models.CommandeFranchise.valider_en_lot)
+    valider_commandes.short_description = 'Valider les commandes sélectionnées (80/20 et stocks)'
+    
+    def preparer_commandes(self, request, queryset):
+        self.traiter_en_lot(request, queryset, models.CommandeFranchise.preparer_en_lot)
+    preparer_commandes.short_description = 'Marquer les commandes sélectionnées comme préparées'
+    
+    def livrer_commandes(self, request, queryset):
+        self.traiter_en_lot(request, queryset, models.CommandeFranchise.livrer_en_lot)
+    livrer_commandes.short_description = 'Marquer les commandes sélectionnées comme livrées'
     
     def statut_badge(self, obj):
         colors = {
@@ -429,16 +568,16 @@ class CommandeFranchiseAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ
         
         conforme, pourcentage, _ = obj.respecte_regle_80_20()
         if conforme:
-            return format_html('<span style="color: #10b981;">✅ {:.1f}% Driv\'n Cook</span>', pourcentage)
+            return format_html('<span style="color: #10b981;">✅ {}% Driv\'n Cook</span>', f'{pourcentage:.1f}')
         else:
-            return format_html('<span style="color: #ef4444;">❌ {:.1f}% Driv\'n Cook</span>', pourcentage)
+            return format_html('<span style="color: #ef4444;">❌ {}% Driv\'n Cook</span>', f'{pourcentage:.1f}')
     regle_80_20_badge.short_description = 'Règle 80/20'
     
     def entrepots_count(self, obj):
         if obj.pk:
             count = obj.entrepots_count
-            drivn_count = obj.entrepots_drivn_cook.count()
-            libre_count = obj.entrepots_fournisseur_libre.count()
+            drivn_count = obj.nb_entrepots_drivn_cook
+            libre_count = obj.nb_entrepots_fournisseur_libre
             return format_html(
                 '<strong>{}</strong> entrepôts<br><small>📦 {} Driv\'n Cook | 🚚 {} Libres</small>',
                 count, drivn_count, libre_count
@@ -452,9 +591,21 @@ class DetailCommandeAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ Cu
     list_display = ['commande', 'produit', 'entrepot_livraison', 'quantite_commandee', 'prix_unitaire', 'sous_total_badge']
     list_filter = ['entrepot_livraison', 'produit__categorie', 'entrepot_livraison__type_entrepot']
     search_fields = ['commande__numero_commande', 'produit__nom_produit', 'entrepot_livraison__nom_entrepot']
+    autocomplete_fields = ['commande', 'produit', 'entrepot_livraison']
     list_per_page = 20
+    paginator = PaginateurEstime  # Grande table : total estimé au-delà du seuil
+    show_full_result_count = False
     ordering = ['-commande__date_commande']
     
+    def get_queryset(self, request):
+        # La commande affichée (__str__) lit le nombre d'entrepôts : annoté dans le préchargement
+        return super().get_queryset(request).select_related('produit', 'entrepot_livraison').prefetch_related(
+            Prefetch(
+                'commande',
+                queryset=models.CommandeFranchise.objects.select_related('franchise').avec_nombre_entrepots()
+            )
+        )
+    
     def sous_total_badge(self, obj):
         return format_html('<strong style="color: #10b981;">{} €</strong>', obj.sous_total)
     sous_total_badge.short_description = 'Sous-total'
@@ -463,10 +614,13 @@ class DetailCommandeAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ Cu
 @admin.register(models.VenteFranchise)
 class VenteFranchiseAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ CustomAdminMixin
     list_display = ['franchise', 'date_vente', 'chiffre_affaires_badge', 'redevance_badge', 'nombre_transactions']
-    list_filter = ['date_vente', 'franchise']
+    list_filter = ['date_vente', ('franchise', FranchiseListFilter)]
     search_fields = ['franchise__nom_franchise', 'franchise__user__first_name', 'franchise__user__last_name']
+    autocomplete_fields = ['franchise']
     date_hierarchy = 'date_vente'
     list_per_page = 20
+    paginator = PaginateurEstime  # Grande table : total estimé au-delà du seuil
+    show_full_result_count = False
     ordering = ['-date_vente']
     
     fieldsets = (
@@ -479,6 +633,9 @@ class VenteFranchiseAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ AJOUTÉ Cu
     )
     readonly_fields = ['redevance_due']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('franchise__user')
+    
     def chiffre_affaires_badge(self, obj):
         return format_html('<strong style="color: #10b981; font-size: 14px;">{} €</strong>', obj.chiffre_affaires_jour)
     chiffre_affaires_badge.short_description = 'Chiffre d\'affaires'
@@ -493,10 +650,14 @@ class AutorisationEmplacementAdmin(CustomAdminMixin, admin.ModelAdmin):  # ✅ A
     list_display = ['franchise', 'emplacement', 'date_autorisation', 'date_expiration', 'est_active_badge', 'est_valide_badge']
     list_filter = ['est_active', 'date_autorisation', 'date_expiration']
     search_fields = ['franchise__nom_franchise', 'emplacement__nom_emplacement']
+    autocomplete_fields = ['franchise', 'emplacement']
     date_hierarchy = 'date_autorisation'
     list_per_page = 20
     ordering = ['-date_autorisation']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('franchise__user', 'emplacement')
+    
     def est_active_badge(self, obj):
         if obj.est_active:
             return format_html('<span style="color: #10b981;">✅ Active</span>')
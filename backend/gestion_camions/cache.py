@@ -0,0 +1,102 @@
+# cache.py - DRIV'N COOK : cache des données de référence (entrepôts, produits, catégories, stocks)
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+# Durée de vie (secondes) des réponses en cache, par ressource. L'invalidation par signal
+# est la règle ; la durée ne sert que de filet (écritures hors ORM, autre processus...).
+DUREES_CACHE = {
+    'entrepots': 60 * 60,
+    'categories': 60 * 60,
+    'produits': 60 * 60,
+    'stocks': 5 * 60,
+}
+
+
+def _cle_version(ressource):
+    return f'reference:version:{ressource}'
+
+
+def versions(ressources):
+    """Version courante (horodatage de la dernière modification) de chaque ressource"""
+    cles = {_cle_version(ressource): ressource for ressource in ressources}
+    trouvees = cache.get_many(list(cles))
+    manquantes = {cle: time.time() for cle in cles if cle not in trouvees}
+    if manquantes:
+        cache.set_many(manquantes, timeout=None)
+        trouvees.update(manquantes)
+    return {cles[cle]: version for cle, version in trouvees.items()}
+
+
+def invalider(*ressources):
+    """Change la version des ressources : les réponses qui en dépendent ne sont plus servies"""
+    maintenant = time.time()
+    cache.set_many({_cle_version(ressource): maintenant for ressource in ressources}, timeout=None)
+
+
+def portee_cache(request, par_utilisateur=False):
+    """Partie de la clé propre à l'appelant : rôle (admin / autre), ou utilisateur si demandé
+
+    Les listes de référence ne dépendent pas de l'utilisateur ; le rôle reste dans la clé
+    pour qu'un serializer qui varierait selon le profil ne serve jamais la réponse d'un
+    admin à un franchisé. par_utilisateur=True pour une réponse propre à chaque compte.
+    """
+    if par_utilisateur:
+        return f'utilisateur:{request.user.pk}'
+    return 'admin' if request.user.is_staff else 'utilisateur'
+
+
+def reponse_en_cache(request, ressources, construire, par_utilisateur=False):
+    """Réponse GET servie depuis le cache, construite par construire() en cas d'absence
+
+    La clé combine le chemin complet (filtres compris), la portée de l'appelant (voir
+    portee_cache) et la version de chaque ressource dont dépend la réponse. Les en-têtes
+    ETag / Last-Modified permettent au client de revalider et d'obtenir un 304 sans corps
+    tant que rien n'a changé.
+    """
+    versions_ressources = versions(ressources)
+    empreinte = hashlib.md5(
+        f"{request.get_full_path()}|{portee_cache(request, par_utilisateur)}|"
+        f"{sorted(versions_ressources.items())}".encode()
+    ).hexdigest()
+    etag = quote_etag(empreinte)
+    derniere_modification = int(max(versions_ressources.values()))
+    entetes = {
+        'ETag': etag,
+        'Last-Modified': http_date(derniere_modification),
+        'Cache-Control': 'private, no-cache',
+    }
+
+    non_modifie = get_conditional_response(request, etag=etag, last_modified=derniere_modification)
+    if non_modifie is not None:
+        for entete, valeur in entetes.items():
+            non_modifie[entete] = valeur
+        return non_modifie
+
+    cle = f'reference:reponse:{empreinte}'
+    data = cache.get(cle)
+    if data is None:
+        data = construire()
+        cache.set(cle, data, min(DUREES_CACHE[ressource] for ressource in ressources))
+    return Response(data, headers=entetes)
+
+
+class CacheReferenceMixin:
+    """Met en cache la liste d'une vue générique (ressources_cache : ressources dont elle dépend)
+
+    cache_par_utilisateur = True si le queryset ou le serializer dépend de request.user.
+    """
+    ressources_cache = ()
+    cache_par_utilisateur = False
+
+    def list(self, request, *args, **kwargs):
+        return reponse_en_cache(
+            request,
+            self.ressources_cache,
+            lambda: super(CacheReferenceMixin, self).list(request, *args, **kwargs).data,
+            par_utilisateur=self.cache_par_utilisateur
+        )
@@ -0,0 +1,35 @@
+# avancer_statuts.py - DRIV'N COOK : progression planifiée des affectations et des maintenances
+import logging
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_camions.models import AffectationEmplacement, MaintenanceCamion
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Passe en cours / terminé les affectations et maintenances dont la date est arrivée ou passée "
+        "(à planifier chaque nuit et en début de journée, par exemple via cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Jour de référence (YYYY-MM-DD), aujourd'hui par défaut")
+
+    def handle(self, *args, **options):
+        aujourd_hui = None
+        if options['date']:
+            try:
+                aujourd_hui = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError("Format de date invalide (format: YYYY-MM-DD)")
+
+        for libelle, modele in (('Affectations', AffectationEmplacement), ('Maintenances', MaintenanceCamion)):
+            nombres = modele.avancer_statuts(aujourd_hui)
+            logger.info("%s : %s", libelle, nombres)
+            self.stdout.write(
+                f"{libelle} : {nombres['en_cours']} passée(s) en cours, {nombres['termine']} terminée(s)"
+            )
+        self.stdout.write(self.style.SUCCESS("Statuts à jour"))
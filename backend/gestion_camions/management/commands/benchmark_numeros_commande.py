@@ -0,0 +1,107 @@
+# benchmark_numeros_commande.py - DRIV'N COOK : concurrence des créations de commandes (numérotation)
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from gestion_camions.models import (
+    CategorieProduit, CommandeFranchise, Entrepot, Franchise, Produit, StockEntrepot, fermer_connexion_sequences
+)
+from gestion_camions.serializers import AdminCommandeCreateSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée des commandes en parallèle par le serializer de l'API (transaction complète : "
+        "numéro, lignes, contrôle des stocks) et vérifie l'unicité des numéros. "
+        "À lancer sur PostgreSQL : SQLite sérialise toutes les écritures."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="Nombre de connexions concurrentes")
+        parser.add_argument('--par-thread', type=int, default=50, help="Commandes créées par connexion")
+        parser.add_argument('--lignes', type=int, default=5, help="Lignes par commande")
+
+    def creer_jeu(self, lignes):
+        """Franchise, entrepôt et produits de test, validés (visibles des autres connexions)"""
+        suffixe = f'{time.time_ns()}'
+        user = get_user_model().objects.create_user(
+            f'benchmark-{suffixe}', f'benchmark-{suffixe}@drivncook.fr', None, first_name='Bench', last_name='Mark'
+        )
+        franchise = Franchise.objects.create(user=user, nom_franchise=f'Benchmark {suffixe}', date_signature=date.today())
+        categorie = CategorieProduit.objects.create(nom_categorie=f'Benchmark {suffixe}')
+        entrepot = Entrepot.objects.create(
+            nom_entrepot=f'Benchmark {suffixe}', adresse='-', ville='-', code_postal='00000'
+        )
+        produits = []
+        for numero in range(lignes):
+            produit = Produit.objects.create(
+                nom_produit=f'Benchmark {suffixe} {numero}', categorie=categorie,
+                prix_unitaire=Decimal('1.00'), unite='kg'
+            )
+            StockEntrepot.objects.create(produit=produit, entrepot=entrepot, quantite_disponible=1_000_000)
+            produits.append(produit)
+        return user, franchise, categorie, entrepot, produits
+
+    def handle(self, *args, **options):
+        if connection.in_atomic_block:
+            raise CommandError("À lancer hors transaction")
+        user, franchise, categorie, entrepot, produits = self.creer_jeu(options['lignes'])
+        donnees = {
+            'franchise': franchise.pk,
+            'adresse_livraison': '1 rue du Benchmark',
+            'details': [
+                {'produit': produit.pk, 'entrepot_livraison': entrepot.pk, 'quantite_commandee': 1}
+                for produit in produits
+            ],
+        }
+
+        def creer(nombre):
+            # Une connexion par thread (plus celle des compteurs), chemin complet de l'API
+            # (AdminCommandeCreateSerializer.create)
+            try:
+                numeros, echecs = [], 0
+                for _ in range(nombre):
+                    serializer = AdminCommandeCreateSerializer(data=donnees)
+                    try:
+                        serializer.is_valid(raise_exception=True)
+                        numeros.append(serializer.save().numero_commande)
+                    except Exception as e:
+                        echecs += 1
+                        self.stderr.write(f"Échec : {e}")
+                return numeros, echecs
+            finally:
+                connection.close()
+                fermer_connexion_sequences()
+
+        threads, par_thread = options['threads'], options['par_thread']
+        debut = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                resultats = list(executor.map(creer, [par_thread] * threads))
+            duree = time.perf_counter() - debut
+        finally:
+            CommandeFranchise.objects.filter(franchise=franchise).delete()
+            franchise.delete()
+            StockEntrepot.objects.filter(entrepot=entrepot).delete()
+            Produit.objects.filter(pk__in=[produit.pk for produit in produits]).delete()
+            entrepot.delete()
+            categorie.delete()
+            user.delete()
+
+        numeros = [numero for lot, _ in resultats for numero in lot]
+        echecs = sum(nombre for _, nombre in resultats)
+        doublons = [numero for numero, nb in Counter(numeros).items() if nb > 1]
+
+        self.stdout.write(
+            f"{len(numeros)} commandes de {options['lignes']} ligne(s) créées par {threads} connexions "
+            f"en {duree:.2f}s ({len(numeros) / duree:.0f} commandes/s)"
+        )
+        if doublons or echecs:
+            raise CommandError(f"{len(doublons)} numéro(s) en double, {echecs} création(s) en échec")
+        self.stdout.write(self.style.SUCCESS("Aucun doublon, aucune création en échec"))
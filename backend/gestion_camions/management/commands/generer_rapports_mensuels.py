@@ -0,0 +1,61 @@
+# generer_rapports_mensuels.py - DRIV'N COOK : rapports de ventes de fin de mois pour toutes les franchises
+import os
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_camions.models import Franchise, debut_periode
+from gestion_camions.rapports import ecrire_rapports, rapports_du_mois_en_parallele, zipper_rapports
+
+
+class Command(BaseCommand):
+    help = "Rend en parallèle le rapport de ventes mensuel PDF de chaque franchise (dossier ou archive zip)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mois', help="Mois du rapport (YYYY-MM), le mois précédent par défaut")
+        parser.add_argument(
+            '--sortie',
+            help="Dossier de destination (par défaut RAPPORTS_PDF_DIR/mensuels/YYYY-MM)"
+        )
+        parser.add_argument('--zip', help="Écrit une archive zip à ce chemin plutôt qu'un dossier")
+        parser.add_argument(
+            '--processus', type=int, default=None,
+            help="Nombre de processus de rendu (nombre de CPU par défaut)"
+        )
+        parser.add_argument(
+            '--franchise', type=int, action='append', dest='franchises',
+            help="Limite aux franchises données (répétable)"
+        )
+
+    def handle(self, *args, **options):
+        if options['mois']:
+            try:
+                annee, mois = options['mois'].split('-')
+                premier_jour = date(int(annee), int(mois), 1)
+            except ValueError:
+                raise CommandError("Format de mois invalide (format: YYYY-MM)")
+        else:
+            # Dernier jour du mois précédent, ramené au premier jour
+            premier_jour = debut_periode('mois', debut_periode('mois', date.today()) - timedelta(days=1))
+
+        franchises = None
+        if options['franchises']:
+            franchises = Franchise.objects.filter(pk__in=options['franchises'])
+
+        debut = time.perf_counter()
+        rapports = rapports_du_mois_en_parallele(premier_jour, franchises, processus=options['processus'])
+        if options['zip']:
+            destination = options['zip']
+            nombre = zipper_rapports(rapports, destination)
+        else:
+            destination = options['sortie'] or os.path.join(
+                settings.RAPPORTS_PDF_DIR, 'mensuels', f'{premier_jour:%Y-%m}'
+            )
+            nombre = ecrire_rapports(rapports, destination)
+        duree = time.perf_counter() - debut
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{nombre} rapport(s) de {premier_jour:%Y-%m} générés en {duree:.1f}s → {destination}"
+        ))
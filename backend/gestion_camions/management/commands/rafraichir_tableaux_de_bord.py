@@ -0,0 +1,40 @@
+# rafraichir_tableaux_de_bord.py - DRIV'N COOK : recalcul planifié des tableaux de bord
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gestion_camions.models import Franchise, TableauDeBord
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les tableaux de bord (global et par franchise), seul endroit où ils le sont. "
+        "À planifier chaque minute avec --perimes, et chaque nuit sans option : la fenêtre des "
+        "ventes sur 30 jours avance même sans écriture"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--perimes', action='store_true',
+            help="Ne recalculer que les tableaux de franchise marqués à recalculer ou calculés un "
+                 "autre jour (le tableau global l'est toujours)"
+        )
+
+    def handle(self, *args, **options):
+        def rafraichir(franchise):
+            TableauDeBord.objects.get_or_create(franchise=franchise)[0].rafraichir()
+
+        rafraichir(None)
+
+        franchises = Franchise.objects.all()
+        if options['perimes']:
+            franchises = franchises.exclude(
+                tableau_de_bord__a_recalculer=False, tableau_de_bord__date_calcul=timezone.now().date()
+            )
+        nombre = 0
+        for franchise in franchises.iterator():
+            rafraichir(franchise)
+            nombre += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Tableaux de bord à jour : global + {nombre} franchise(s)"
+        ))
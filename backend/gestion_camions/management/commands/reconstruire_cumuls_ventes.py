@@ -0,0 +1,29 @@
+# reconstruire_cumuls_ventes.py - DRIV'N COOK : recalcul des cumuls de ventes
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_camions.models import CumulVentes
+
+
+class Command(BaseCommand):
+    help = "Recalcule les cumuls semaine / mois / année des ventes à partir des ventes quotidiennes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--franchise', type=int, action='append', help="Franchise(s) à recalculer (toutes par défaut)")
+        parser.add_argument('--depuis', help="Premier jour couvert (YYYY-MM-DD)")
+        parser.add_argument('--jusqu-au', dest='jusqu_au', help="Dernier jour couvert (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        try:
+            date_min = date.fromisoformat(options['depuis']) if options['depuis'] else None
+            date_max = date.fromisoformat(options['jusqu_au']) if options['jusqu_au'] else None
+        except ValueError:
+            raise CommandError("Format de date invalide (format: YYYY-MM-DD)")
+
+        nombre = CumulVentes.reconstruire(
+            franchise_ids=options['franchise'],
+            date_min=date_min,
+            date_max=date_max
+        )
+        self.stdout.write(self.style.SUCCESS(f"{nombre} cumul(s) de ventes recalculé(s)"))
@@ -0,0 +1,57 @@
+# traiter_rapports_pdf.py - DRIV'N COOK : worker de la file des rapports PDF mensuels
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from gestion_camions.models import TacheRapportPDF
+from gestion_camions.rapports import (
+    DELAI_REPRISE_TACHES, INTERVALLE_NETTOYAGE, executer_tache, nettoyer_rapports, reprendre_taches_bloquees
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rend les rapports PDF en attente (à lancer avec RAPPORTS_PDF_WORKER_EXTERNE=True "
+        "pour sortir le rendu des processus web) et supprime les PDF plus anciens que "
+        "RAPPORTS_PDF_CONSERVATION_JOURS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--une-fois', action='store_true', help="Vide la file puis s'arrête")
+        parser.add_argument('--intervalle', type=float, default=2, help="Secondes entre deux scrutations")
+        parser.add_argument(
+            '--reprendre-apres', type=int, default=int(DELAI_REPRISE_TACHES.total_seconds() // 60),
+            help="Remet en attente les tâches en cours depuis plus de N minutes (worker arrêté)"
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        dernier_nettoyage = None
+        while True:
+            if dernier_nettoyage is None or time.monotonic() - dernier_nettoyage >= INTERVALLE_NETTOYAGE:
+                supprimes = nettoyer_rapports()
+                dernier_nettoyage = time.monotonic()
+                if supprimes:
+                    self.stdout.write(f"{supprimes} ancien(s) rapport(s) PDF supprimé(s)")
+
+            reprises = reprendre_taches_bloquees(timedelta(minutes=options['reprendre_apres']))
+            if reprises:
+                self.stdout.write(f"{reprises} tâche(s) bloquée(s) remise(s) en attente")
+
+            traitees = 0
+            for tache in TacheRapportPDF.objects.filter(statut='en_attente').select_related(
+                'franchise__user'
+            ).order_by('created_at'):
+                if executer_tache(tache):
+                    traitees += 1
+                    if tache.statut == 'erreur':
+                        self.stderr.write(f"Rapport {tache.franchise} {tache.mois:%Y-%m} en erreur")
+            total += traitees
+
+            if options['une_fois']:
+                break
+            if not traitees:
+                time.sleep(options['intervalle'])
+
+        self.stdout.write(self.style.SUCCESS(f"{total} rapport(s) PDF généré(s)"))
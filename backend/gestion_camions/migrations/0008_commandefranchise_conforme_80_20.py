@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:05
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def initialiser_conformite(apps, schema_editor):
+    """Calcule la conformité 80/20 des commandes existantes à partir des montants stockés"""
+    CommandeFranchise = apps.get_model('gestion_camions', 'CommandeFranchise')
+    CommandeFranchise.objects.filter(
+        montant_total__gt=0,
+        montant_drivn_cook__lt=F('montant_total') * Decimal('0.8')
+    ).update(conforme_80_20=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_camions', '0007_delete_paiementredevance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandefranchise',
+            name='conforme_80_20',
+            field=models.BooleanField(db_index=True, default=True, editable=False, help_text='Recalculé à chaque modification des lignes de commande'),
+        ),
+        migrations.RunPython(initialiser_conformite, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:08
+
+from datetime import datetime
+
+from django.db import migrations, models
+
+
+def initialiser_sequences(apps, schema_editor):
+    """Reprend le dernier numéro attribué chaque jour par l'ancien générateur"""
+    CommandeFranchise = apps.get_model('gestion_camions', 'CommandeFranchise')
+    SequenceCommande = apps.get_model('gestion_camions', 'SequenceCommande')
+    
+    derniers = {}
+    numeros = CommandeFranchise.objects.filter(
+        numero_commande__startswith='CMD-'
+    ).values_list('numero_commande', flat=True)
+    for numero in numeros.iterator():
+        try:
+            _, date_str, seq = numero.split('-')
+            jour = datetime.strptime(date_str, '%Y%m%d').date()
+            seq = int(seq)
+        except ValueError:
+            continue
+        derniers[jour] = max(derniers.get(jour, 0), seq)
+    
+    SequenceCommande.objects.bulk_create(
+        [SequenceCommande(jour=jour, dernier_numero=seq) for jour, seq in derniers.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_camions', '0008_commandefranchise_conforme_80_20'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceCommande',
+            fields=[
+                ('jour', models.DateField(primary_key=True, serialize=False)),
+                ('dernier_numero', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Séquence de commandes',
+                'verbose_name_plural': 'Séquences de commandes',
+            },
+        ),
+        migrations.RunPython(initialiser_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_camions', '0009_sequencecommande'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='affectationemplacement',
+            index=models.Index(fields=['-date_debut'], name='affectation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='affectationemplacement',
+            index=models.Index(condition=models.Q(('statut__in', ['programme', 'en_cours'])), fields=['emplacement', 'date_debut'], name='affectation_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commandefranchise',
+            index=models.Index(fields=['-date_commande'], name='commande_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commandefranchise',
+            index=models.Index(fields=['franchise', '-date_commande'], name='commande_franchise_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commandefranchise',
+            index=models.Index(fields=['statut', '-date_commande'], name='commande_statut_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='franchise',
+            index=models.Index(fields=['statut'], name='franchise_statut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='franchise',
+            index=models.Index(fields=['stripe_checkout_session_id'], name='franchise_stripe_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockentrepot',
+            index=models.Index(fields=['entrepot', 'quantite_disponible'], name='stock_entrepot_qte_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockentrepot',
+            index=models.Index(fields=['produit', 'quantite_disponible'], name='stock_produit_qte_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventefranchise',
+            index=models.Index(fields=['-date_vente'], name='vente_date_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_camions', '0010_index_requetes_frequentes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableauDeBord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('camions_total', models.PositiveIntegerField(default=0)),
+                ('camions_actifs', models.PositiveIntegerField(default=0)),
+                ('camions_disponibles', models.PositiveIntegerField(default=0)),
+                ('emplacements_autorises', models.PositiveIntegerField(default=0)),
+                ('commandes_total', models.PositiveIntegerField(default=0)),
+                ('commandes_en_attente', models.PositiveIntegerField(default=0)),
+                ('commandes_en_cours', models.PositiveIntegerField(default=0)),
+                ('commandes_conformes_80_20', models.PositiveIntegerField(default=0)),
+                ('affectations_actives', models.PositiveIntegerField(default=0)),
+                ('affectations_programmees', models.PositiveIntegerField(default=0)),
+                ('chiffre_affaires_30j', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('redevance_30j', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('franchises_actives', models.PositiveIntegerField(default=0)),
+                ('entrepots_drivn_cook', models.PositiveIntegerField(default=0)),
+                ('fournisseurs_libres', models.PositiveIntegerField(default=0)),
+                ('alertes_stock', models.PositiveIntegerField(default=0)),
+                ('date_calcul', models.DateField(blank=True, null=True)),
+                ('a_recalculer', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('franchise', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tableau_de_bord', to='gestion_camions.franchise')),
+            ],
+            options={
+                'verbose_name': 'Tableau de bord',
+                'verbose_name_plural': 'Tableaux de bord',
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+
+
+def calculer_cumuls(apps, schema_editor):
+    """Construit les cumuls à partir des ventes déjà saisies"""
+    VenteFranchise = apps.get_model('gestion_camions', 'VenteFranchise')
+    CumulVentes = apps.get_model('gestion_camions', 'CumulVentes')
+    
+    troncatures = {'semaine': TruncWeek, 'mois': TruncMonth, 'annee': TruncYear}
+    for periode, troncature in troncatures.items():
+        lignes = VenteFranchise.objects.annotate(debut=troncature('date_vente')).values(
+            'franchise', 'debut'
+        ).annotate(
+            total_ca=Sum('chiffre_affaires_jour'),
+            total_redevance=Sum('redevance_due'),
+            total_transactions=Sum('nombre_transactions'),
+            jours=Count('id')
+        ).order_by()
+        CumulVentes.objects.bulk_create([
+            CumulVentes(
+                franchise_id=ligne['franchise'],
+                periode=periode,
+                debut=ligne['debut'],
+                chiffre_affaires=ligne['total_ca'],
+                redevance=ligne['total_redevance'],
+                nombre_transactions=ligne['total_transactions'],
+                nombre_jours=ligne['jours']
+            )
+            for ligne in lignes
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_camions', '0011_tableau_de_bord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CumulVentes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.CharField(choices=[('semaine', 'Semaine'), ('mois', 'Mois'), ('annee', 'Année')], max_length=10)),
+                ('debut', models.DateField(help_text='Premier jour de la période (lundi, 1er du mois ou 1er janvier)')),
+                ('chiffre_affaires', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('redevance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('nombre_transactions', models.PositiveBigIntegerField(default=0)),
+                ('nombre_jours', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('franchise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cumuls_ventes', to='gestion_camions.franchise')),
+            ],
+            options={
+                'verbose_name': 'Cumul de ventes',
+                'verbose_name_plural': 'Cumuls de ventes',
+                'indexes': [models.Index(fields=['periode', 'debut'], name='cumul_periode_debut_idx')],
+                'unique_together': {('franchise', 'periode', 'debut')},
+            },
+        ),
+        migrations.RunPython(calculer_cumuls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_camions', '0012_cumuls_ventes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheRapportPDF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField(help_text='Premier jour du mois du rapport')),
+                ('cle', models.CharField(max_length=64, unique=True)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('termine', 'Terminé'), ('erreur', 'Erreur')], default='en_attente', max_length=20)),
+                ('erreur', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('franchise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='taches_rapports', to='gestion_camions.franchise')),
+            ],
+            options={
+                'verbose_name': 'Tâche de rapport PDF',
+                'verbose_name_plural': 'Tâches de rapports PDF',
+                'indexes': [models.Index(fields=['statut', 'created_at'], name='tache_rapport_statut_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:29
+
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+STATUTS_ACTIFS = ('programme', 'en_cours')
+
+# Recouvrement = même emplacement (ou même camion), jours communs et créneaux sécants ;
+# un horaire vide vaut début (00:00) ou fin (24:00) de journée. int8range(x, x, '[]') remplace
+# l'égalité sur les clés (bigint) pour rester dans les opérateurs GiST natifs (pas d'extension
+# btree_gist, souvent indisponible sans droits superutilisateur). GREATEST évite l'erreur
+# « range lower bound must be less than or equal to upper bound » sur d'anciennes lignes
+# dont la fin précède le début.
+CONTRAINTE = """
+    ALTER TABLE gestion_camions_affectationemplacement
+    ADD CONSTRAINT affectation_{colonne}_sans_chevauchement EXCLUDE USING gist (
+        int8range({colonne}_id, {colonne}_id, '[]') WITH &&,
+        daterange(date_debut, GREATEST(COALESCE(date_fin, date_debut), date_debut), '[]') WITH &&,
+        numrange(
+            COALESCE(date_part('epoch', horaire_debut)::numeric, 0),
+            GREATEST(
+                COALESCE(date_part('epoch', horaire_fin)::numeric, 86400),
+                COALESCE(date_part('epoch', horaire_debut)::numeric, 0)
+            ),
+            '[)'
+        ) WITH &&
+    ) WHERE (statut IN ('programme', 'en_cours'))
+"""
+
+
+def _periode(ligne):
+    """(premier jour, dernier jour, début en secondes, fin en secondes), normalisés comme CONTRAINTE"""
+    date_debut, date_fin, horaire_debut, horaire_fin = ligne
+    debut = horaire_debut.hour * 3600 + horaire_debut.minute * 60 + horaire_debut.second if horaire_debut else 0
+    fin = horaire_fin.hour * 3600 + horaire_fin.minute * 60 + horaire_fin.second if horaire_fin else 86400
+    return date_debut, max(date_fin or date_debut, date_debut), debut, max(fin, debut)
+
+
+def _chevauche(a, b):
+    return a[0] <= b[1] and b[0] <= a[1] and a[2] < b[3] and b[2] < a[3]
+
+
+def annuler_conflits(apps, schema_editor):
+    """Annule les affectations actives qui en recouvrent une plus ancienne (même emplacement ou camion)
+
+    L'ancien contrôle ne portait que sur la date de début : des recouvrements actifs peuvent
+    exister et feraient échouer la création des contraintes. La plus ancienne affectation
+    (clé la plus petite) est conservée, les suivantes passent en « annule » et sont journalisées.
+    """
+    AffectationEmplacement = apps.get_model('gestion_camions', 'AffectationEmplacement')
+    conservees = {}
+    annulees = []
+    for pk, camion_id, emplacement_id, *ligne in AffectationEmplacement.objects.filter(
+        statut__in=STATUTS_ACTIFS
+    ).order_by('pk').values_list(
+        'pk', 'camion_id', 'emplacement_id', 'date_debut', 'date_fin', 'horaire_debut', 'horaire_fin'
+    ).iterator():
+        periode = _periode(ligne)
+        cles = (('emplacement', emplacement_id), ('camion', camion_id))
+        if any(_chevauche(periode, autre) for cle in cles for autre in conservees.get(cle, ())):
+            annulees.append(pk)
+            continue
+        for cle in cles:
+            conservees.setdefault(cle, []).append(periode)
+
+    if annulees:
+        AffectationEmplacement.objects.filter(pk__in=annulees).update(statut='annule')
+        logger.warning(
+            "%d affectation(s) en recouvrement annulée(s) avant la contrainte d'exclusion : %s",
+            len(annulees), ', '.join(map(str, annulees))
+        )
+
+
+def creer_contraintes(apps, schema_editor):
+    """Contraintes d'exclusion, PostgreSQL uniquement (ailleurs : contrôle applicatif seul)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for colonne in ('emplacement', 'camion'):
+        schema_editor.execute(CONTRAINTE.format(colonne=colonne))
+
+
+def supprimer_contraintes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for colonne in ('emplacement', 'camion'):
+        schema_editor.execute(
+            'ALTER TABLE gestion_camions_affectationemplacement '
+            f'DROP CONSTRAINT IF EXISTS affectation_{colonne}_sans_chevauchement'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_camions', '0013_tache_rapport_pdf'),
+    ]
+
+    operations = [
+        migrations.RunPython(annuler_conflits, migrations.RunPython.noop),
+        migrations.RunPython(creer_contraintes, supprimer_contraintes),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:02
+
+from django.db import migrations
+
+
+# Colonnes cherchées par préfixe dans les widgets d'autocomplétion de l'admin (istartswith).
+# PostgreSQL compile istartswith en UPPER(col::text) LIKE UPPER('abc%') : seul un index sur
+# la même expression, en text_pattern_ops (indépendant de la collation), peut servir.
+INDEX = [
+    ('franchise_nom_upper_idx', 'gestion_camions_franchise', 'nom_franchise'),
+    ('produit_nom_upper_idx', 'gestion_camions_produit', 'nom_produit'),
+    ('entrepot_nom_upper_idx', 'gestion_camions_entrepot', 'nom_entrepot'),
+    ('emplacement_nom_upper_idx', 'gestion_camions_emplacement', 'nom_emplacement'),
+    ('camion_numero_upper_idx', 'gestion_camions_camion', 'numero_camion'),
+    ('camion_immatriculation_upper_idx', 'gestion_camions_camion', 'immatriculation'),
+    ('commande_numero_upper_idx', 'gestion_camions_commandefranchise', 'numero_commande'),
+]
+
+
+def creer_index(apps, schema_editor):
+    """Index d'expression, PostgreSQL uniquement (SQLite : tables de développement)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nom, table, colonne in INDEX:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nom} ON {table} (UPPER({colonne}::text) text_pattern_ops)'
+        )
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nom, _, _ in INDEX:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nom}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_camions', '0014_affectation_sans_chevauchement'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
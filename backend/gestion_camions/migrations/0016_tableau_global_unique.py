@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:18
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def supprimer_doublons_globaux(apps, schema_editor):
+    """Ne garde que la plus ancienne ligne globale (deux premières lectures concurrentes en créaient deux)"""
+    TableauDeBord = apps.get_model('gestion_camions', 'TableauDeBord')
+    conservee = TableauDeBord.objects.filter(franchise__isnull=True).order_by('pk').values_list('pk', flat=True).first()
+    if conservee is not None:
+        TableauDeBord.objects.filter(franchise__isnull=True).exclude(pk=conservee).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_camions', '0015_index_recherche_autocompletion'),
+    ]
+
+    operations = [
+        migrations.RunPython(supprimer_doublons_globaux, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tableaudebord',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('franchise', models.Value(0), output_field=models.BigIntegerField()), name='tableau_unique_par_franchise'),
+        ),
+    ]
@@ -2,11 +2,18 @@
 # MODIFICATION : Multi-emplacements pour une franchise
 
 from django.db import models
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncMonth, TruncWeek, TruncYear
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from datetime import timedelta
+import os
+import threading
+
+from .cache import invalider as invalider_cache
 
 class Entrepot(models.Model):
     """Entrepôts : 4 officiels Driv'n Cook + autres fournisseurs libres"""
@@ -100,6 +107,11 @@ class Franchise(models.Model):
         verbose_name = "Franchisé"
         verbose_name_plural = "Franchisés"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['statut'], name='franchise_statut_idx'),
+            # Recherche à chaque vérification de paiement Stripe
+            models.Index(fields=['stripe_checkout_session_id'], name='franchise_stripe_session_idx'),
+        ]
         
     def __str__(self):
         return f"{self.nom_franchise} - {self.user.first_name} {self.user.last_name}"
@@ -212,6 +224,28 @@ class Emplacement(models.Model):
             return False, f"Emplacement occupé par {affectation.camion.franchise.nom_franchise}"
         
         return True, "Emplacement disponible"
+    
+    @classmethod
+    def calendrier_occupation(cls, emplacement_ids, date_debut, date_fin):
+        """Occupation jour par jour des emplacements sur une période, en une requête
+        
+        Renvoie {emplacement_id: [affectations actives du jour, pour chaque jour]} ;
+        une liste vide signifie que l'emplacement est libre ce jour-là.
+        """
+        nombre_jours = (date_fin - date_debut).days + 1
+        calendrier = {emplacement_id: [[] for _ in range(nombre_jours)] for emplacement_id in emplacement_ids}
+        
+        affectations = AffectationEmplacement.objects.filter(
+            AffectationEmplacement.filtre_chevauchement(date_debut, date_fin),
+            emplacement_id__in=emplacement_ids
+        ).select_related('camion').order_by('date_debut', 'horaire_debut')
+        for affectation in affectations:
+            jours = calendrier[affectation.emplacement_id]
+            premier = max((affectation.date_debut - date_debut).days, 0)
+            dernier = min((affectation.date_fin_effective - date_debut).days, nombre_jours - 1)
+            for jour in range(premier, dernier + 1):
+                jours[jour].append(affectation)
+        return calendrier
 
 
 class Camion(models.Model):
@@ -270,6 +304,24 @@ class MaintenanceCamion(models.Model):
         
     def __str__(self):
         return f"{self.camion.numero_camion} - {self.type_maintenance} - {self.date_maintenance}"
+    
+    @classmethod
+    def avancer_statuts(cls, aujourd_hui=None):
+        """Fait progresser les maintenances selon leur date, en deux UPDATE ensemblistes
+        
+        Une maintenance passe en cours le jour prévu et se termine le lendemain ; renvoie
+        {'en_cours': n, 'termine': n}.
+        """
+        aujourd_hui = aujourd_hui or timezone.now().date()
+        maintenant = timezone.now()
+        return {
+            'termine': cls.objects.filter(
+                statut__in=['programme', 'en_cours'], date_maintenance__lt=aujourd_hui
+            ).update(statut='termine', updated_at=maintenant),
+            'en_cours': cls.objects.filter(
+                statut='programme', date_maintenance=aujourd_hui
+            ).update(statut='en_cours', updated_at=maintenant),
+        }
 
 
 class AffectationEmplacement(models.Model):
@@ -296,9 +348,92 @@ class AffectationEmplacement(models.Model):
         ordering = ['-date_debut']
         verbose_name = "Affectation d'emplacement"
         verbose_name_plural = "Affectations d'emplacements"
+        indexes = [
+            models.Index(fields=['-date_debut'], name='affectation_date_idx'),
+            # Index partiel : seules les affectations actives servent aux contrôles de conflits
+            models.Index(
+                fields=['emplacement', 'date_debut'],
+                condition=Q(statut__in=['programme', 'en_cours']),
+                name='affectation_active_idx'
+            ),
+        ]
+    
+    # Statuts qui occupent un emplacement (et un camion)
+    STATUTS_ACTIFS = ['programme', 'en_cours']
+    
+    # Contrainte d'exclusion PostgreSQL (migration 0014) violée par une écriture concurrente
+    MESSAGE_CONFLIT_CONCURRENT = "Conflit d'affectation : créneau pris entre-temps, veuillez réessayer"
+    
+    @staticmethod
+    def est_conflit_concurrent(erreur):
+        return 'sans_chevauchement' in str(erreur)
+    
+    @property
+    def date_fin_effective(self):
+        """Dernier jour occupé : sans date de fin, l'affectation ne couvre que date_debut"""
+        return self.date_fin or self.date_debut
+    
+    def chevauche(self, autre):
+        """Vrai si les deux affectations se recouvrent (jours communs et créneaux horaires sécants)
+        
+        Un horaire vide vaut début ou fin de journée ; les créneaux sont semi-ouverts,
+        un camion peut donc arriver à l'heure où le précédent repart.
+        """
+        if self.date_debut > autre.date_fin_effective or autre.date_debut > self.date_fin_effective:
+            return False
+        debut_avant_fin = autre.horaire_fin is None or self.horaire_debut is None or self.horaire_debut < autre.horaire_fin
+        fin_apres_debut = self.horaire_fin is None or autre.horaire_debut is None or autre.horaire_debut < self.horaire_fin
+        return debut_avant_fin and fin_apres_debut
+    
+    @classmethod
+    def filtre_chevauchement(cls, date_debut, date_fin=None, horaire_debut=None, horaire_fin=None):
+        """Q des affectations actives qui recouvrent la période et le créneau donnés
+        
+        La borne date_debut <= fin se résout sur l'index affectation_active_idx.
+        """
+        filtre = Q(statut__in=cls.STATUTS_ACTIFS, date_debut__lte=date_fin or date_debut) & (
+            Q(date_fin__gte=date_debut) | Q(date_fin__isnull=True, date_debut__gte=date_debut)
+        )
+        if horaire_fin is not None:
+            filtre &= Q(horaire_debut__isnull=True) | Q(horaire_debut__lt=horaire_fin)
+        if horaire_debut is not None:
+            filtre &= Q(horaire_fin__isnull=True) | Q(horaire_fin__gt=horaire_debut)
+        return filtre
+    
+    def conflits(self):
+        """Affectations actives qui occupent le même emplacement ou le même camion au même moment"""
+        return AffectationEmplacement.objects.filter(
+            Q(emplacement_id=self.emplacement_id) | Q(camion_id=self.camion_id),
+            AffectationEmplacement.filtre_chevauchement(
+                self.date_debut, self.date_fin, self.horaire_debut, self.horaire_fin
+            )
+        ).exclude(pk=self.pk)
+    
+    def erreur_periode(self):
+        if self.date_fin and self.date_debut and self.date_fin < self.date_debut:
+            return "La date de fin doit être postérieure ou égale à la date de début"
+        if self.horaire_debut and self.horaire_fin and self.horaire_fin <= self.horaire_debut:
+            return "L'horaire de fin doit être postérieur à l'horaire de début"
+        return None
+    
+    def message_conflit(self, conflit):
+        if conflit.emplacement_id == self.emplacement_id:
+            return (
+                f"Conflit d'affectation : l'emplacement '{conflit.emplacement.nom_emplacement}' "
+                f"est déjà occupé du {conflit.date_debut} au {conflit.date_fin_effective} "
+                f"par le camion {conflit.camion.numero_camion}"
+            )
+        return (
+            f"Conflit d'affectation : le camion {conflit.camion.numero_camion} est déjà affecté "
+            f"à '{conflit.emplacement.nom_emplacement}' du {conflit.date_debut} au {conflit.date_fin_effective}"
+        )
     
     def clean(self):
         """Validation des affectations avec vérification des autorisations multi-emplacements"""
+        erreur = self.erreur_periode()
+        if erreur:
+            raise ValidationError(erreur)
+        
         if self.camion and self.emplacement:
             # Vérifier que la franchise du camion est autorisée pour cet emplacement
             franchise = self.camion.franchise
@@ -308,25 +443,157 @@ class AffectationEmplacement(models.Model):
                     f"pour l'emplacement '{self.emplacement.nom_emplacement}'"
                 )
             
-            # Vérifier les conflits de dates/horaires pour le même emplacement
-            if self.date_debut and self.statut in ['programme', 'en_cours']:
-                conflits = AffectationEmplacement.objects.filter(
-                    emplacement=self.emplacement,
-                    date_debut=self.date_debut,
-                    statut__in=['programme', 'en_cours']
-                ).exclude(pk=self.pk if self.pk else None)
-                
-                if conflits.exists():
-                    conflit = conflits.first()
-                    raise ValidationError(
-                        f"Conflit d'affectation : l'emplacement '{self.emplacement.nom_emplacement}' "
-                        f"est déjà occupé le {self.date_debut} par le camion {conflit.camion.numero_camion}"
-                    )
+            # Vérifier les recouvrements de dates/horaires sur l'emplacement et sur le camion
+            if self.date_debut and self.statut in self.STATUTS_ACTIFS:
+                conflit = self.conflits().select_related('camion', 'emplacement').first()
+                if conflit:
+                    raise ValidationError(self.message_conflit(conflit))
     
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError as e:
+            # Contrainte d'exclusion PostgreSQL : affectation concurrente enregistrée entre-temps
+            if not self.est_conflit_concurrent(e):
+                raise
+            raise ValidationError(self.MESSAGE_CONFLIT_CONCURRENT)
+    
+    @classmethod
+    def verifier_planning(cls, affectations):
+        """Contrôle un lot d'affectations (non enregistrées) en deux requêtes
+        
+        Autorisations des franchises, puis une seule requête pour toutes les affectations
+        actives qui recouvrent la période du lot ; les recouvrements (avec l'existant et à
+        l'intérieur du lot) sont ensuite détectés par balayage des intervalles triés.
+        Renvoie {index dans le lot: message d'erreur}.
+        """
+        erreurs = {}
+        for index, affectation in enumerate(affectations):
+            erreur = affectation.erreur_periode()
+            if erreur:
+                erreurs[index] = erreur
+        
+        autorisees = set(Emplacement.franchises_autorisees.through.objects.filter(
+            emplacement_id__in={a.emplacement_id for a in affectations}
+        ).values_list('emplacement_id', 'franchise_id'))
+        for index, affectation in enumerate(affectations):
+            franchise = affectation.camion.franchise
+            if franchise and (affectation.emplacement_id, franchise.id) not in autorisees:
+                erreurs.setdefault(index, (
+                    f"La franchise '{franchise.nom_franchise}' n'est pas autorisée "
+                    f"pour l'emplacement '{affectation.emplacement.nom_emplacement}'"
+                ))
+        
+        actives = [
+            (index, affectation) for index, affectation in enumerate(affectations)
+            if affectation.statut in cls.STATUTS_ACTIFS and index not in erreurs
+        ]
+        if not actives:
+            return erreurs
+        
+        existantes = cls.objects.filter(
+            Q(emplacement_id__in={a.emplacement_id for _, a in actives})
+            | Q(camion_id__in={a.camion_id for _, a in actives}),
+            cls.filtre_chevauchement(
+                min(a.date_debut for _, a in actives),
+                max(a.date_fin_effective for _, a in actives)
+            )
+        ).exclude(
+            pk__in=[a.pk for _, a in actives if a.pk]
+        ).select_related('camion', 'emplacement')
+        
+        # Intervalles regroupés par emplacement et par camion (index None = déjà enregistrée)
+        groupes = {}
+        for affectation in existantes:
+            for cle in (('emplacement', affectation.emplacement_id), ('camion', affectation.camion_id)):
+                groupes.setdefault(cle, []).append((None, affectation))
+        for index, affectation in actives:
+            for cle in (('emplacement', affectation.emplacement_id), ('camion', affectation.camion_id)):
+                groupes.setdefault(cle, []).append((index, affectation))
+        
+        for intervalles in groupes.values():
+            intervalles.sort(key=lambda element: element[1].date_debut)
+            en_cours = []
+            for index, affectation in intervalles:
+                en_cours = [
+                    element for element in en_cours
+                    if element[1].date_fin_effective >= affectation.date_debut
+                ]
+                for index_autre, autre in en_cours:
+                    if (index is None and index_autre is None) or not affectation.chevauche(autre):
+                        continue
+                    if index is not None:
+                        erreurs.setdefault(index, affectation.message_conflit(autre))
+                    else:
+                        erreurs.setdefault(index_autre, autre.message_conflit(affectation))
+                en_cours.append((index, affectation))
+        return erreurs
+    
+    @classmethod
+    def avancer_statuts(cls, aujourd_hui=None):
+        """Fait progresser les affectations selon leurs dates, en UPDATE ensemblistes
+        
+        programme/en_cours → termine une fois le dernier jour passé, programme → en_cours
+        pendant la période. update() n'émet aucun signal : les tableaux de bord des
+        franchises concernées sont invalidés ici. Renvoie {'en_cours': n, 'termine': n}.
+        """
+        aujourd_hui = aujourd_hui or timezone.now().date()
+        maintenant = timezone.now()
+        a_terminer = Q(statut__in=cls.STATUTS_ACTIFS) & (
+            Q(date_fin__lt=aujourd_hui) | Q(date_fin__isnull=True, date_debut__lt=aujourd_hui)
+        )
+        a_commencer = Q(statut='programme', date_debut__lte=aujourd_hui) & (
+            Q(date_fin__gte=aujourd_hui) | Q(date_fin__isnull=True, date_debut=aujourd_hui)
+        )
+        
+        with transaction.atomic():
+            franchise_ids = set(cls.objects.filter(a_terminer | a_commencer).values_list(
+                'camion__franchise_id', flat=True
+            ).distinct())
+            if not franchise_ids:
+                return {'termine': 0, 'en_cours': 0}
+            nombres = {
+                'termine': cls.objects.filter(a_terminer).update(statut='termine', updated_at=maintenant),
+                'en_cours': cls.objects.filter(a_commencer).update(statut='en_cours', updated_at=maintenant),
+            }
+        
+        TableauDeBord.invalider(*(franchise_id for franchise_id in franchise_ids if franchise_id))
+        return nombres
+    
+    @classmethod
+    def planifier(cls, affectations):
+        """Enregistre un lot d'affectations en une transaction, après contrôle de l'ensemble
+        
+        Lève ValidationError ({index: message}) si une affectation est refusée, ou
+        ValidationError(MESSAGE_CONFLIT_CONCURRENT) si la contrainte d'exclusion rejette
+        l'insertion (écriture concurrente) : rien n'est créé.
+        """
+        with transaction.atomic():
+            # Verrou des emplacements et camions concernés le temps du contrôle et de l'insertion
+            list(Emplacement.objects.select_for_update().filter(
+                pk__in={a.emplacement_id for a in affectations}
+            ).values_list('pk', flat=True))
+            list(Camion.objects.select_for_update().filter(
+                pk__in={a.camion_id for a in affectations}
+            ).values_list('pk', flat=True))
+            
+            erreurs = cls.verifier_planning(affectations)
+            if erreurs:
+                raise ValidationError({str(index): message for index, message in sorted(erreurs.items())})
+            try:
+                with transaction.atomic():
+                    creees = cls.objects.bulk_create(affectations, batch_size=500)
+            except IntegrityError as e:
+                if not cls.est_conflit_concurrent(e):
+                    raise
+                raise ValidationError(cls.MESSAGE_CONFLIT_CONCURRENT)
         
+        # bulk_create n'émet pas post_save : invalider les tableaux de bord concernés
+        TableauDeBord.invalider(*{a.camion.franchise_id for a in affectations if a.camion.franchise_id})
+        return creees
+    
     def __str__(self):
         return f"{self.camion.numero_camion} → {self.emplacement.nom_emplacement} ({self.date_debut})"
 
@@ -418,6 +685,10 @@ class StockEntrepot(models.Model):
     
     class Meta:
         unique_together = ['produit', 'entrepot']
+        indexes = [
+            models.Index(fields=['entrepot', 'quantite_disponible'], name='stock_entrepot_qte_idx'),
+            models.Index(fields=['produit', 'quantite_disponible'], name='stock_produit_qte_idx'),
+        ]
         
     def __str__(self):
         return f"{self.produit.nom_produit} - {self.entrepot.nom_entrepot} : {self.quantite_disponible}"
@@ -429,9 +700,209 @@ class StockEntrepot(models.Model):
     @property
     def alerte_stock(self):
         return self.quantite_disponible <= self.seuil_alerte
+    
+    @classmethod
+    def verrouiller(cls, paires):
+        """SELECT ... FOR UPDATE sur les stocks des couples (produit_id, entrepot_id), en une requête
+        
+        À appeler dans une transaction. Les lignes sont verrouillées dans l'ordre des clés
+        pour éviter les interblocages entre validations concurrentes.
+        """
+        stocks = cls.objects.select_for_update().filter(filtre_paires_stock(paires)).order_by('pk')
+        return {(stock.produit_id, stock.entrepot_id): stock for stock in stocks}
+
+    @classmethod
+    def liberer_reservations(cls, commande_ids):
+        """Rend les quantités réservées par des commandes livrées, en un seul UPDATE
+
+        Équivalent ORM de UPDATE ... SET quantite_reservee = quantite_reservee - lignes.total
+        FROM (lignes groupées par produit et entrepôt) : le calcul se fait en base à partir
+        de la valeur courante (pas de mise à jour perdue entre livraisons concurrentes) et
+        la réservation ne descend jamais sous zéro.
+        """
+        lignes = DetailCommande.objects.filter(
+            commande_id__in=commande_ids,
+            produit=OuterRef('produit'),
+            entrepot_livraison=OuterRef('entrepot')
+        )
+        quantites = lignes.order_by().values('produit').annotate(total=Sum('quantite_commandee')).values('total')
+        nombre = cls.objects.filter(Exists(lignes)).update(
+            quantite_reservee=Greatest(
+                F('quantite_reservee') - Subquery(quantites), Value(0),
+                output_field=models.PositiveIntegerField()
+            ),
+            updated_at=timezone.now()
+        )
+        if nombre:
+            # update() ne déclenche pas post_save
+            invalider_cache('stocks')
+        return nombre
+
+
+def filtre_paires_stock(paires, prefixe=''):
+    """Filtre Q sur une liste de couples (produit_id, entrepot_id)"""
+    filtre = Q(pk__in=[])
+    for produit_id, entrepot_id in set(paires):
+        filtre |= Q(**{f'{prefixe}produit_id': produit_id, f'{prefixe}entrepot_id': entrepot_id})
+    return filtre
 
 # models.py - MODIFICATION pour supporter le multi-entrepôts
 
+# Connexion dédiée (une par thread) aux incréments des compteurs, hors transaction appelante
+_connexions_sequences = threading.local()
+
+
+def connexion_sequences():
+    """Connexion en autocommit pour SequenceCommande, distincte de celle de la requête
+
+    Le verrou de ligne pris par l'incrément est relâché dès la fin de l'instruction, au lieu
+    de rester posé jusqu'au COMMIT de la transaction qui crée la commande.
+    """
+    connexion = getattr(_connexions_sequences, 'connexion', None)
+    if connexion is None:
+        connexion = connections.create_connection(DEFAULT_DB_ALIAS)
+        _connexions_sequences.connexion = connexion
+    connexion.close_if_unusable_or_obsolete()
+    return connexion
+
+
+def fermer_connexion_sequences(seulement_perimee=False):
+    """Ferme la connexion dédiée du thread courant, ouverte hors du gestionnaire connections
+
+    close_old_connections (début et fin de requête) ne la voit pas : signals.py appelle
+    cette fonction aux mêmes moments avec seulement_perimee=True (même règle CONN_MAX_AGE
+    que les connexions de Django). Les threads hors requête (commandes, benchmarks) la
+    ferment eux-mêmes avant de se terminer.
+    """
+    connexion = getattr(_connexions_sequences, 'connexion', None)
+    if connexion is None:
+        return
+    if seulement_perimee:
+        connexion.close_if_unusable_or_obsolete()
+    else:
+        connexion.close()
+
+
+class SequenceCommande(models.Model):
+    """Compteur journalier des numéros de commande (CMD-YYYYMMDD-NNNN)"""
+    jour = models.DateField(primary_key=True)
+    dernier_numero = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Séquence de commandes"
+        verbose_name_plural = "Séquences de commandes"
+    
+    def __str__(self):
+        return f"{self.jour} : {self.dernier_numero}"
+    
+    @classmethod
+    def prochain_numero(cls, jour):
+        """Incrémente atomiquement le compteur du jour et renvoie la nouvelle valeur
+        
+        Un seul aller-retour (INSERT ... ON CONFLICT DO UPDATE ... RETURNING) sur la ligne du
+        jour. Appelé dans une transaction (création de commande avec ses lignes et le contrôle
+        des stocks), l'incrément passe sur PostgreSQL par connexion_sequences() : le verrou
+        de la ligne n'est pas conservé jusqu'au COMMIT de l'appelant, les créations du jour ne
+        se sérialisent pas. Comme avec nextval(), un numéro pris par une transaction annulée
+        est perdu (trou dans la numérotation, jamais de doublon). SQLite sérialise de toute
+        façon les écritures et ne verrait pas une autre connexion : connexion courante.
+        """
+        connexion = connection
+        if connection.vendor == 'postgresql' and connection.in_atomic_block:
+            connexion = connexion_sequences()
+        table = connexion.ops.quote_name(cls._meta.db_table)
+        with connexion.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (jour, dernier_numero) VALUES (%s, 1) "
+                f"ON CONFLICT (jour) DO UPDATE SET dernier_numero = {table}.dernier_numero + 1 "
+                f"RETURNING dernier_numero",
+                [connexion.ops.adapt_datefield_value(jour)]
+            )
+            return cursor.fetchone()[0]
+
+
+def somme_par_type_entrepot(type_entrepot, prefixe=''):
+    """Somme des sous-totaux des lignes livrées depuis un type d'entrepôt (agrégat conditionnel)"""
+    return Coalesce(
+        Sum(
+            f'{prefixe}sous_total',
+            filter=Q(**{f'{prefixe}entrepot_livraison__type_entrepot': type_entrepot})
+        ),
+        Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def analyser_regle_80_20(montant_total, montant_drivn_cook, montant_fournisseur_libre,
+                         nb_entrepots_drivn_cook=0, nb_entrepots_fournisseur_libre=0):
+    """Résultat (conforme, pourcentage Driv'n Cook, message) de la règle 80/20 pour des montants"""
+    if montant_total == 0:
+        return True, 0, "Commande vide"
+        
+    pourcentage_drivn = (montant_drivn_cook / montant_total) * 100
+    pourcentage_libre = (montant_fournisseur_libre / montant_total) * 100
+    
+    if pourcentage_drivn >= 80:
+        message = f"✅ Conforme : {pourcentage_drivn:.1f}% Driv'n Cook ({nb_entrepots_drivn_cook} entrepôts), {pourcentage_libre:.1f}% libre ({nb_entrepots_fournisseur_libre} entrepôts)"
+        return True, pourcentage_drivn, message
+    else:
+        message = f"❌ Non-conforme : {pourcentage_drivn:.1f}% Driv'n Cook (minimum 80%), {pourcentage_libre:.1f}% libre"
+        return False, pourcentage_drivn, message
+
+
+class CommandeFranchiseQuerySet(models.QuerySet):
+    """Requêtes sur les commandes"""
+
+    def avec_montants_calcules(self):
+        """Annote les montants recalculés depuis les lignes (une requête pour N commandes)"""
+        return self.annotate(
+            montant_drivn_cook_calcule=somme_par_type_entrepot('drivn_cook', prefixe='details__'),
+            montant_fournisseur_libre_calcule=somme_par_type_entrepot('fournisseur_libre', prefixe='details__'),
+        ).annotate(
+            montant_total_calcule=F('montant_drivn_cook_calcule') + F('montant_fournisseur_libre_calcule')
+        )
+
+    def avec_nombre_entrepots(self):
+        """Annote le nombre d'entrepôts Driv'n Cook et fournisseurs libres de chaque commande"""
+        return self.annotate(
+            nb_entrepots_drivn_cook=Count(
+                'details__entrepot_livraison', distinct=True,
+                filter=Q(details__entrepot_livraison__type_entrepot='drivn_cook')
+            ),
+            nb_entrepots_fournisseur_libre=Count(
+                'details__entrepot_livraison', distinct=True,
+                filter=Q(details__entrepot_livraison__type_entrepot='fournisseur_libre')
+            ),
+        )
+
+    def statistiques_80_20(self):
+        """Total, conformes, non conformes et taux de conformité en une requête d'agrégat"""
+        stats = self.order_by().aggregate(
+            total_commandes=Count('id'),
+            commandes_conformes=Count('id', filter=Q(conforme_80_20=True)),
+        )
+        stats['commandes_non_conformes'] = stats['total_commandes'] - stats['commandes_conformes']
+        stats['taux_conformite'] = round(
+            stats['commandes_conformes'] / stats['total_commandes'] * 100, 2
+        ) if stats['total_commandes'] > 0 else 0
+        return stats
+
+    def avec_details_complets(self):
+        """Précharge franchise, lignes, produits, entrepôts et stock disponible de chaque ligne
+
+        Le nombre de requêtes ne dépend plus du nombre de commandes : une pour les commandes
+        (franchise jointe), une pour toutes leurs lignes avec le stock en sous-requête.
+        """
+        stock_disponible = StockEntrepot.objects.filter(
+            produit=OuterRef('produit'),
+            entrepot=OuterRef('entrepot_livraison')
+        ).values('quantite_disponible')[:1]
+        details = DetailCommande.objects.select_related('produit', 'entrepot_livraison').annotate(
+            stock_disponible_annote=Subquery(stock_disponible)
+        )
+        return self.select_related('franchise').prefetch_related(Prefetch('details', queryset=details))
+
+
 class CommandeFranchise(models.Model):
     """Commandes d'approvisionnement des franchisés avec support multi-entrepôts et contrôle 80/20"""
     STATUT_CHOICES = [
@@ -525,13 +996,28 @@ class CommandeFranchise(models.Model):
     montant_fournisseur_libre = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'),
                                                    help_text="Montant des produits libres (20% maximum)")
     
+    # 🎯 CONFORMITÉ 80/20 DÉNORMALISÉE (filtrable et indexée en base)
+    conforme_80_20 = models.BooleanField(
+        default=True,
+        db_index=True,
+        editable=False,
+        help_text="Recalculé à chaque modification des lignes de commande"
+    )
+    
     statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CommandeFranchiseQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-date_commande']
+        indexes = [
+            models.Index(fields=['-date_commande'], name='commande_date_idx'),
+            models.Index(fields=['franchise', '-date_commande'], name='commande_franchise_date_idx'),
+            models.Index(fields=['statut', '-date_commande'], name='commande_statut_date_idx'),
+        ]
     
     @property
     def entrepots_utilises(self):
@@ -542,7 +1028,9 @@ class CommandeFranchise(models.Model):
     
     @property
     def entrepots_count(self):
-        """Nombre d'entrepôts différents utilisés"""
+        """Nombre d'entrepôts différents utilisés (lu dans l'annotation avec_nombre_entrepots si présente)"""
+        if hasattr(self, 'nb_entrepots_drivn_cook'):
+            return self.nb_entrepots_drivn_cook + self.nb_entrepots_fournisseur_libre
         return self.entrepots_utilises.count()
     
     @property
@@ -555,6 +1043,23 @@ class CommandeFranchise(models.Model):
         """Entrepôts fournisseurs libres utilisés"""
         return self.entrepots_utilises.filter(type_entrepot='fournisseur_libre')
     
+    def repartition_par_entrepot(self):
+        """Montant commandé par entrepôt {entrepot: montant}, trié par nom d'entrepôt
+
+        Calculé depuis les lignes de la commande : aucune requête supplémentaire quand
+        elles ont été préchargées (voir CommandeFranchiseQuerySet.avec_details_complets).
+        """
+        if 'details' in getattr(self, '_prefetched_objects_cache', {}):
+            details = self.details.all()
+        else:
+            details = self.details.select_related('entrepot_livraison')
+
+        repartition = {}
+        for detail in details:
+            entrepot = detail.entrepot_livraison
+            repartition[entrepot] = repartition.get(entrepot, Decimal('0.00')) + detail.sous_total
+        return dict(sorted(repartition.items(), key=lambda item: item[0].nom_entrepot))
+    
     # 🎯 NOUVELLES PROPRIÉTÉS POUR L'ADRESSE DE LIVRAISON
     @property
     def adresse_livraison_complete(self):
@@ -617,30 +1122,291 @@ class CommandeFranchise(models.Model):
             return
             
         # Le contrôle 80/20 se base sur le TYPE D'ENTREPÔT, pas le produit
-        self.montant_drivn_cook = sum(
-            detail.sous_total for detail in self.details.all() 
-            if detail.entrepot_livraison.type_entrepot == 'drivn_cook'
-        )
-        self.montant_fournisseur_libre = sum(
-            detail.sous_total for detail in self.details.all() 
-            if detail.entrepot_livraison.type_entrepot == 'fournisseur_libre'
+        # Une seule requête d'agrégation conditionnelle pour les deux montants
+        montants = self.details.aggregate(
+            drivn_cook=somme_par_type_entrepot('drivn_cook'),
+            fournisseur_libre=somme_par_type_entrepot('fournisseur_libre'),
         )
+        self.montant_drivn_cook = montants['drivn_cook']
+        self.montant_fournisseur_libre = montants['fournisseur_libre']
         self.montant_total = self.montant_drivn_cook + self.montant_fournisseur_libre
+        self.conforme_80_20 = self.est_conforme_80_20()
 
-    def respecte_regle_80_20(self):
-        """Vérifie que 80% minimum du montant vient des entrepôts Driv'n Cook - MULTI-ENTREPÔTS"""
+    def est_conforme_80_20(self):
+        """Conformité 80/20 calculée à partir des montants déjà connus (sans requête)"""
         if self.montant_total == 0:
-            return True, 0, "Commande vide"
+            return True
+        return (self.montant_drivn_cook / self.montant_total) * 100 >= 80
+
+    def enregistrer_montants(self):
+        """Recalcule puis persiste les montants et la conformité 80/20 sans repasser par save()"""
+        self.calculer_montants()
+        CommandeFranchise.objects.filter(pk=self.pk).update(
+            montant_total=self.montant_total,
+            montant_drivn_cook=self.montant_drivn_cook,
+            montant_fournisseur_libre=self.montant_fournisseur_libre,
+            conforme_80_20=self.conforme_80_20
+        )
+        # update() ne déclenche pas post_save : la conformité des tableaux de bord est à recalculer
+        TableauDeBord.invalider(self.franchise_id)
+
+    def ajouter_details(self, details_data):
+        """Crée toutes les lignes de la commande en une fois et recalcule les montants une seule fois
+        
+        details_data : liste de dicts {produit, entrepot_livraison, quantite_commandee}
+        """
+        lignes = [
+            (int(d['produit']), int(d['entrepot_livraison']), int(d['quantite_commandee']))
+            for d in details_data
+        ]
+        
+        # Vérification des stocks de toutes les lignes en une seule requête
+        stocks = {
+            (stock.produit_id, stock.entrepot_id): stock
+            for stock in StockEntrepot.objects.filter(
+                filtre_paires_stock([(p, e) for p, e, _ in lignes])
+            ).select_related('produit', 'entrepot')
+        }
+        
+        details = []
+        for produit_id, entrepot_id, quantite in lignes:
+            stock = stocks.get((produit_id, entrepot_id))
+            if stock is None:
+                produit = Produit.objects.filter(pk=produit_id).first()
+                entrepot = Entrepot.objects.filter(pk=entrepot_id).first()
+                if not produit or not entrepot:
+                    raise ValidationError(
+                        f"Produit ou entrepôt introuvable : produit {produit_id}, entrepôt {entrepot_id}"
+                    )
+                raise ValidationError(
+                    f"Le produit {produit.nom_produit} n'est pas disponible "
+                    f"dans l'entrepôt {entrepot.nom_entrepot}"
+                )
+            if stock.quantite_disponible < quantite:
+                raise ValidationError(
+                    f"Stock insuffisant pour {stock.produit.nom_produit} "
+                    f"dans {stock.entrepot.nom_entrepot} : "
+                    f"disponible {stock.quantite_disponible}, demandé {quantite}"
+                )
             
-        pourcentage_drivn = (self.montant_drivn_cook / self.montant_total) * 100
-        pourcentage_libre = (self.montant_fournisseur_libre / self.montant_total) * 100
+            prix_unitaire = stock.produit.prix_unitaire
+            details.append(DetailCommande(
+                commande=self,
+                produit_id=produit_id,
+                entrepot_livraison_id=entrepot_id,
+                quantite_commandee=quantite,
+                prix_unitaire=prix_unitaire,
+                sous_total=quantite * prix_unitaire
+            ))
         
-        if pourcentage_drivn >= 80:
-            message = f"✅ Conforme : {pourcentage_drivn:.1f}% Driv'n Cook ({self.entrepots_drivn_cook.count()} entrepôts), {pourcentage_libre:.1f}% libre ({self.entrepots_fournisseur_libre.count()} entrepôts)"
-            return True, pourcentage_drivn, message
-        else:
-            message = f"❌ Non-conforme : {pourcentage_drivn:.1f}% Driv'n Cook (minimum 80%), {pourcentage_libre:.1f}% libre"
-            return False, pourcentage_drivn, message
+        # bulk_create ne passe pas par DetailCommande.save() : sous_total calculé ci-dessus
+        DetailCommande.objects.bulk_create(details)
+        self.enregistrer_montants()
+        return details
+
+    def respecte_regle_80_20(self):
+        """Vérifie que 80% minimum du montant vient des entrepôts Driv'n Cook - MULTI-ENTREPÔTS"""
+        nb_drivn_cook = nb_fournisseur_libre = 0
+        if self.montant_total and self.est_conforme_80_20():
+            if hasattr(self, 'nb_entrepots_drivn_cook'):
+                # Annoté par CommandeFranchiseQuerySet.avec_nombre_entrepots : pas de requête
+                nb_drivn_cook, nb_fournisseur_libre = self.nb_entrepots_drivn_cook, self.nb_entrepots_fournisseur_libre
+            else:
+                types_entrepots = [entrepot.type_entrepot for entrepot in self.repartition_par_entrepot()]
+                nb_drivn_cook = types_entrepots.count('drivn_cook')
+                nb_fournisseur_libre = types_entrepots.count('fournisseur_libre')
+        return analyser_regle_80_20(
+            self.montant_total, self.montant_drivn_cook, self.montant_fournisseur_libre,
+            nb_drivn_cook, nb_fournisseur_libre
+        )
+
+    # 🎯 TRANSITIONS DE STATUT EN LOT (expédition du matin)
+    @staticmethod
+    def resultat_lot(commande_id, commande=None, error=None, **infos):
+        """Résultat d'une commande dans un traitement en lot"""
+        resultat = {
+            'id': commande_id,
+            'numero_commande': commande.numero_commande if commande else None,
+            'statut': commande.statut if commande else None,
+            'succes': error is None,
+        }
+        if error:
+            resultat['error'] = error
+        resultat.update(infos)
+        return resultat
+
+    @classmethod
+    def verrouiller_lot(cls, commande_ids):
+        """Commandes {pk: commande} verrouillées (SELECT ... FOR UPDATE) dans l'ordre des clés"""
+        return {
+            commande.pk: commande
+            for commande in cls.objects.select_for_update().filter(pk__in=commande_ids).order_by('pk')
+        }
+
+    @classmethod
+    def valider_en_lot(cls, commande_ids):
+        """Valide des commandes en attente : règle 80/20 et stocks contrôlés pour toutes à la fois
+
+        Nombre de requêtes constant : verrou des commandes, lignes (avec type d'entrepôt),
+        verrou des stocks, un UPDATE groupé des commandes (montants recalculés + statut) et
+        un des stocks réservés. Les commandes sont servies dans l'ordre de la liste : une
+        commande refusée ne bloque pas les suivantes. Un résultat par identifiant.
+        """
+        commande_ids = list(dict.fromkeys(commande_ids))
+        with transaction.atomic():
+            commandes = cls.verrouiller_lot(commande_ids)
+            en_attente = [pk for pk, commande in commandes.items() if commande.statut == 'en_attente']
+
+            lignes = {}
+            for ligne in DetailCommande.objects.filter(commande_id__in=en_attente).values(
+                'commande_id', 'produit_id', 'entrepot_livraison_id', 'quantite_commandee', 'sous_total',
+                'produit__nom_produit', 'entrepot_livraison__nom_entrepot', 'entrepot_livraison__type_entrepot'
+            ).order_by('pk'):
+                lignes.setdefault(ligne['commande_id'], []).append(ligne)
+            stocks = StockEntrepot.verrouiller([
+                (ligne['produit_id'], ligne['entrepot_livraison_id'])
+                for details in lignes.values() for ligne in details
+            ])
+
+            resultats, stocks_reserves = [], set()
+            for commande_id in commande_ids:
+                commande = commandes.get(commande_id)
+                if commande is None:
+                    resultats.append(cls.resultat_lot(commande_id, error='Commande introuvable'))
+                    continue
+                if commande.statut != 'en_attente':
+                    resultats.append(cls.resultat_lot(
+                        commande_id, commande, 'Seules les commandes en attente peuvent être validées'
+                    ))
+                    continue
+
+                # Montants recalculés depuis les lignes (comme calculer_montants, sans requête)
+                details = lignes.get(commande_id, [])
+                montants = {'drivn_cook': Decimal('0.00'), 'fournisseur_libre': Decimal('0.00')}
+                entrepots = {'drivn_cook': set(), 'fournisseur_libre': set()}
+                demandes = {}
+                for ligne in details:
+                    type_entrepot = ligne['entrepot_livraison__type_entrepot']
+                    if type_entrepot in montants:
+                        montants[type_entrepot] += ligne['sous_total']
+                        entrepots[type_entrepot].add(ligne['entrepot_livraison_id'])
+                    paire = (ligne['produit_id'], ligne['entrepot_livraison_id'])
+                    demandes.setdefault(paire, [ligne, 0])[1] += ligne['quantite_commandee']
+                commande.montant_drivn_cook = montants['drivn_cook']
+                commande.montant_fournisseur_libre = montants['fournisseur_libre']
+                commande.montant_total = commande.montant_drivn_cook + commande.montant_fournisseur_libre
+                commande.conforme_80_20 = commande.est_conforme_80_20()
+
+                conforme, pourcentage_drivn, message = analyser_regle_80_20(
+                    commande.montant_total, commande.montant_drivn_cook, commande.montant_fournisseur_libre,
+                    len(entrepots['drivn_cook']), len(entrepots['fournisseur_libre'])
+                )
+                if not conforme:
+                    resultats.append(cls.resultat_lot(
+                        commande_id, commande, 'Règle 80/20 non respectée',
+                        details=message, pourcentage_drivn_cook=float(pourcentage_drivn)
+                    ))
+                    continue
+
+                # Stock restant après les commandes déjà validées dans ce lot
+                stocks_insuffisants = []
+                for paire, (ligne, quantite) in demandes.items():
+                    stock = stocks.get(paire)
+                    disponible = stock.quantite_disponible if stock else 0
+                    if disponible < quantite:
+                        stocks_insuffisants.append({
+                            'produit': ligne['produit__nom_produit'],
+                            'entrepot': ligne['entrepot_livraison__nom_entrepot'],
+                            'demande': quantite,
+                            'disponible': disponible
+                        })
+                if stocks_insuffisants:
+                    resultats.append(cls.resultat_lot(
+                        commande_id, commande, 'Stocks insuffisants', details=stocks_insuffisants
+                    ))
+                    continue
+
+                for paire, (_, quantite) in demandes.items():
+                    stock = stocks.get(paire)
+                    if stock is None:
+                        # Quantité nulle sans ligne de stock : rien à réserver
+                        continue
+                    stock.quantite_disponible -= quantite
+                    stock.quantite_reservee += quantite
+                    stocks_reserves.add(paire)
+                commande.statut = 'validee'
+                resultats.append(cls.resultat_lot(
+                    commande_id, commande,
+                    regle_80_20=message, pourcentage_drivn_cook=float(pourcentage_drivn)
+                ))
+
+            maintenant = timezone.now()
+            a_enregistrer = [commandes[pk] for pk in en_attente]
+            for commande in a_enregistrer:
+                commande.updated_at = maintenant
+            cls.objects.bulk_update(a_enregistrer, [
+                'montant_total', 'montant_drivn_cook', 'montant_fournisseur_libre', 'conforme_80_20',
+                'statut', 'updated_at'
+            ])
+            if stocks_reserves:
+                for paire in stocks_reserves:
+                    stocks[paire].updated_at = maintenant
+                StockEntrepot.objects.bulk_update(
+                    [stocks[paire] for paire in stocks_reserves],
+                    ['quantite_disponible', 'quantite_reservee', 'updated_at']
+                )
+                invalider_cache('stocks')
+            # bulk_update ne déclenche pas post_save
+            if a_enregistrer:
+                TableauDeBord.invalider(*{commande.franchise_id for commande in a_enregistrer})
+        return resultats
+
+    @classmethod
+    def avancer_en_lot(cls, commande_ids, depuis, vers, error):
+        """Passe de `depuis` à `vers` les commandes de la liste qui y sont : un seul UPDATE
+
+        À appeler dans une transaction. Renvoie (résultats, identifiants avancés).
+        """
+        commande_ids = list(dict.fromkeys(commande_ids))
+        commandes = cls.verrouiller_lot(commande_ids)
+        avancees = [pk for pk in commande_ids if pk in commandes and commandes[pk].statut == depuis]
+        if avancees:
+            cls.objects.filter(pk__in=avancees).update(statut=vers, updated_at=timezone.now())
+            TableauDeBord.invalider(*{commandes[pk].franchise_id for pk in avancees})
+
+        resultats = []
+        for commande_id in commande_ids:
+            commande = commandes.get(commande_id)
+            if commande is None:
+                resultats.append(cls.resultat_lot(commande_id, error='Commande introuvable'))
+            elif commande_id in avancees:
+                commande.statut = vers
+                resultats.append(cls.resultat_lot(commande_id, commande))
+            else:
+                resultats.append(cls.resultat_lot(commande_id, commande, error))
+        return resultats, avancees
+
+    @classmethod
+    def preparer_en_lot(cls, commande_ids):
+        """Marque préparées les commandes validées de la liste"""
+        with transaction.atomic():
+            resultats, _ = cls.avancer_en_lot(
+                commande_ids, 'validee', 'preparee',
+                'Seules les commandes validées peuvent être marquées comme préparées'
+            )
+        return resultats
+
+    @classmethod
+    def livrer_en_lot(cls, commande_ids):
+        """Marque livrées les commandes préparées de la liste et libère leurs réservations"""
+        with transaction.atomic():
+            resultats, livrees = cls.avancer_en_lot(
+                commande_ids, 'preparee', 'livree',
+                'Seules les commandes préparées peuvent être marquées comme livrées'
+            )
+            if livrees:
+                StockEntrepot.liberer_reservations(livrees)
+        return resultats
 
     # 🎯 NOUVELLE PROPRIÉTÉ POUR LE FRONTEND
     @property
@@ -685,31 +1451,10 @@ class CommandeFranchise(models.Model):
                 raise ValidationError(f"Règle 80/20 non respectée : {message}")
 
     def generer_numero_commande(self):
-        """Génère automatiquement un numéro de commande unique"""
-        with transaction.atomic():
-            date_str = timezone.now().strftime('%Y%m%d')
-            
-            # Récupérer le dernier numéro pour ce jour
-            derniere_commande = CommandeFranchise.objects.select_for_update().filter(
-                numero_commande__startswith=f'CMD-{date_str}'
-            ).order_by('-numero_commande').first()
-            
-            if derniere_commande:
-                try:
-                    dernier_seq = int(derniere_commande.numero_commande.split('-')[-1])
-                    nouveau_seq = dernier_seq + 1
-                except (ValueError, IndexError):
-                    nouveau_seq = 1
-            else:
-                nouveau_seq = 1
-            
-            numero = f'CMD-{date_str}-{nouveau_seq:04d}'
-            
-            while CommandeFranchise.objects.filter(numero_commande=numero).exists():
-                nouveau_seq += 1
-                numero = f'CMD-{date_str}-{nouveau_seq:04d}'
-            
-            return numero
+        """Génère automatiquement un numéro de commande unique via le compteur du jour"""
+        jour = timezone.now().date()
+        sequence = SequenceCommande.prochain_numero(jour)
+        return f'CMD-{jour:%Y%m%d}-{sequence:04d}'
 
     def save(self, *args, **kwargs):
         # Initialiser l'adresse de livraison avec celle de la franchise si vide
@@ -724,18 +1469,29 @@ class CommandeFranchise(models.Model):
         
         # Calculer les montants si la commande a des détails
         if self.details.exists():
-            self.calculer_montants()
-            CommandeFranchise.objects.filter(pk=self.pk).update(
-                montant_total=self.montant_total,
-                montant_drivn_cook=self.montant_drivn_cook,
-                montant_fournisseur_libre=self.montant_fournisseur_libre
-            )
+            self.enregistrer_montants()
 
     def __str__(self):
         entrepots_info = f"({self.entrepots_count} entrepôts)" if self.pk else ""
         return f"{self.numero_commande} - {self.franchise.nom_franchise} - {self.montant_total}€ {entrepots_info}"
 
 
+class DetailCommandeQuerySet(models.QuerySet):
+    """Requêtes sur les lignes de commande"""
+
+    def delete(self):
+        """Supprime les lignes puis recalcule une seule fois chaque commande concernée
+        
+        Le signal post_delete ignore les suppressions issues d'un queryset (voir signals.py) :
+        sans ce regroupement, chaque ligne supprimée relancerait le recalcul de sa commande.
+        """
+        commande_ids = set(self.order_by().values_list('commande_id', flat=True).distinct())
+        resultat = super().delete()
+        for commande in CommandeFranchise.objects.filter(pk__in=commande_ids):
+            commande.enregistrer_montants()
+        return resultat
+
+
 class DetailCommande(models.Model):
     """Lignes de commande avec entrepôt de livraison spécifique - MULTI-ENTREPÔTS"""
     commande = models.ForeignKey(CommandeFranchise, on_delete=models.CASCADE, related_name='details')
@@ -755,6 +1511,8 @@ class DetailCommande(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = DetailCommandeQuerySet.as_manager()
+    
     class Meta:
         # 🎯 NOUVEAU : Empêcher les doublons (même produit + même entrepôt dans une commande)
         unique_together = ['commande', 'produit', 'entrepot_livraison']
@@ -795,12 +1553,67 @@ class DetailCommande(models.Model):
         
         # Recalcul des montants de la commande parent
         if self.commande_id:
-            self.commande.calculer_montants()
-            CommandeFranchise.objects.filter(pk=self.commande_id).update(
-                montant_total=self.commande.montant_total,
-                montant_drivn_cook=self.commande.montant_drivn_cook,
-                montant_fournisseur_libre=self.commande.montant_fournisseur_libre
-            )
+            self.commande.enregistrer_montants()
+    
+
+class VenteFranchiseQuerySet(models.QuerySet):
+    """Requêtes sur les ventes : les écritures en masse reconstruisent les cumuls touchés
+    
+    update() et delete() d'un queryset n'appellent ni save() ni delete() de l'instance, qui
+    tiennent CumulVentes à jour ligne à ligne : les périodes concernées sont recalculées
+    depuis les ventes (CumulVentes.reconstruire_bornes), dans la même transaction. Les
+    franchises concernées sont verrouillées avant la lecture des bornes (CumulVentes.verrouiller).
+    """
+    
+    def _verrouiller(self, *autres):
+        CumulVentes.verrouiller(
+            set(self.order_by().values_list('franchise', flat=True).distinct()) | set(autres)
+        )
+    
+    def _bornes(self):
+        """Couples (franchise_id, jour) : premier et dernier jour des ventes du queryset, par franchise"""
+        lignes = self.order_by().values('franchise').annotate(
+            premier=Min('date_vente'), dernier=Max('date_vente')
+        ).values_list('franchise', 'premier', 'dernier')
+        return [(franchise_id, jour) for franchise_id, premier, dernier in lignes for jour in (premier, dernier)]
+    
+    def _reconstruire(self, lignes):
+        bornes = CumulVentes.bornes_ventes(lignes)
+        CumulVentes.reconstruire_bornes(bornes)
+        TableauDeBord.invalider(*bornes)
+    
+    def update(self, **kwargs):
+        # La redevance suit le chiffre d'affaires, y compris exprimé en F() (évalué sur l'ancienne valeur)
+        if 'chiffre_affaires_jour' in kwargs and 'redevance_due' not in kwargs:
+            kwargs['redevance_due'] = kwargs['chiffre_affaires_jour'] * VenteFranchise.TAUX_REDEVANCE
+        with transaction.atomic():
+            cible = kwargs.get('franchise', kwargs.get('franchise_id'))
+            cible = cible.pk if isinstance(cible, Franchise) else cible
+            self._verrouiller(*([cible] if isinstance(cible, int) else []))
+            lignes = self._bornes()
+            if {'franchise', 'franchise_id', 'date_vente'} & kwargs.keys():
+                # Les ventes changent de période ou de franchise : bornes relues après coup
+                pks = list(self.values_list('pk', flat=True))
+                resultat = super().update(**kwargs)
+                lignes += self.model.objects.filter(pk__in=pks)._bornes()
+            else:
+                resultat = super().update(**kwargs)
+            self._reconstruire(lignes)
+        return resultat
+    
+    update.alters_data = True
+    
+    def delete(self):
+        with transaction.atomic():
+            self._verrouiller()
+            lignes = self._bornes()
+            resultat = super().delete()
+            self._reconstruire(lignes)
+        return resultat
+    
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 class VenteFranchise(models.Model):
     """Chiffres de ventes quotidiens avec redevance de 4%"""
@@ -813,16 +1626,463 @@ class VenteFranchise(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = VenteFranchiseQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['franchise', 'date_vente']
         ordering = ['-date_vente']
+        indexes = [
+            models.Index(fields=['-date_vente'], name='vente_date_idx'),
+        ]
         
     def __str__(self):
         return f"{self.franchise.nom_franchise} - {self.date_vente} : {self.chiffre_affaires_jour}€ (redevance: {self.redevance_due}€)"
     
+    TAUX_REDEVANCE = Decimal('0.04')
+    
     def save(self, *args, **kwargs):
         # Calcul automatique de la redevance (4% du CA)
-        self.redevance_due = self.chiffre_affaires_jour * Decimal('0.04')
-        super().save(*args, **kwargs)
+        self.redevance_due = self.chiffre_affaires_jour * self.TAUX_REDEVANCE
+        
+        with transaction.atomic():
+            ancienne = None
+            if self.pk:
+                # Franchise d'origine aussi verrouillée si la vente change de franchise
+                CumulVentes.verrouiller(
+                    {self.franchise_id, *VenteFranchise.objects.filter(pk=self.pk).values_list('franchise', flat=True)}
+                )
+                ancienne = VenteFranchise.objects.select_for_update().filter(pk=self.pk).first()
+            else:
+                CumulVentes.verrouiller([self.franchise_id])
+            super().save(*args, **kwargs)
+            
+            # Mise à jour incrémentale des cumuls semaine / mois / année
+            if ancienne:
+                CumulVentes.appliquer(ancienne, signe=-1)
+            CumulVentes.appliquer(self)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            CumulVentes.verrouiller([self.franchise_id])
+            resultat = super().delete(*args, **kwargs)
+            CumulVentes.appliquer(self, signe=-1)
+        return resultat
+    
+    @classmethod
+    def importer(cls, ventes):
+        """Enregistre des ventes en masse, en remplaçant celles déjà saisies pour le même jour
+        
+        ventes : instances non enregistrées (franchise_id, date_vente, chiffre_affaires_jour,
+        nombre_transactions). Un INSERT ... ON CONFLICT (franchise, date_vente) DO UPDATE
+        par lot de 500 ; save() et les signaux ne sont pas appelés, les cumuls des périodes
+        touchées sont reconstruits en une passe (une requête par type de période).
+        """
+        for vente in ventes:
+            vente.redevance_due = vente.chiffre_affaires_jour * cls.TAUX_REDEVANCE
+        
+        # Ventes, cumuls des périodes touchées et tableaux de bord dans la même transaction :
+        # un import interrompu ne laisse pas de cumuls décalés
+        with transaction.atomic():
+            CumulVentes.verrouiller({vente.franchise_id for vente in ventes})
+            cls.objects.bulk_create(
+                ventes,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['franchise', 'date_vente'],
+                update_fields=['chiffre_affaires_jour', 'redevance_due', 'nombre_transactions', 'updated_at']
+            )
+            CumulVentes.reconstruire_bornes(
+                CumulVentes.bornes_ventes((vente.franchise_id, vente.date_vente) for vente in ventes)
+            )
+            TableauDeBord.invalider(*{vente.franchise_id for vente in ventes})
+        return len(ventes)
 
 
+def debut_periode(periode, jour):
+    """Premier jour de la semaine (lundi), du mois ou de l'année contenant jour"""
+    if periode == 'semaine':
+        return jour - timedelta(days=jour.weekday())
+    if periode == 'mois':
+        return jour.replace(day=1)
+    return jour.replace(month=1, day=1)
+
+
+def periode_suivante(periode, debut):
+    """Premier jour de la période qui suit celle commençant à debut"""
+    if periode == 'semaine':
+        return debut + timedelta(days=7)
+    if periode == 'mois':
+        return (debut.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return debut.replace(year=debut.year + 1)
+
+
+class CumulVentes(models.Model):
+    """Cumuls des ventes par franchise et par semaine, mois et année
+
+    Tenus à jour à chaque enregistrement / suppression de VenteFranchise (reconstruits par
+    période pour les update() / delete() de queryset et les imports) ; la commande
+    reconstruire_cumuls_ventes les recalcule depuis les ventes. Les rapports sur plusieurs
+    mois ou années lisent une ligne par période au lieu d'une ligne par jour.
+    """
+    PERIODE_CHOICES = [
+        ('semaine', 'Semaine'),
+        ('mois', 'Mois'),
+        ('annee', 'Année'),
+    ]
+    TRONCATURES = {'semaine': TruncWeek, 'mois': TruncMonth, 'annee': TruncYear}
+    
+    franchise = models.ForeignKey(Franchise, on_delete=models.CASCADE, related_name='cumuls_ventes')
+    periode = models.CharField(max_length=10, choices=PERIODE_CHOICES)
+    debut = models.DateField(help_text="Premier jour de la période (lundi, 1er du mois ou 1er janvier)")
+    chiffre_affaires = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    redevance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    nombre_transactions = models.PositiveBigIntegerField(default=0)
+    nombre_jours = models.PositiveIntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['franchise', 'periode', 'debut']
+        verbose_name = "Cumul de ventes"
+        verbose_name_plural = "Cumuls de ventes"
+        indexes = [
+            models.Index(fields=['periode', 'debut'], name='cumul_periode_debut_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.franchise_id} - {self.get_periode_display()} du {self.debut} : {self.chiffre_affaires}€"
+    
+    @staticmethod
+    def verrouiller(franchise_ids=None):
+        """Verrouille (FOR UPDATE) les franchises dont les cumuls vont être écrits (toutes si None)
+        
+        À appeler dans la transaction, avant de lire les ventes : les mises à jour incrémentales
+        (appliquer) et les reconstructions d'une même franchise s'exécutent alors l'une après
+        l'autre, et une vente enregistrée entre l'agrégat et le remplacement des cumuls ne peut
+        plus être écrasée. Ordre des clés fixe, pour éviter les interblocages.
+        """
+        franchises = Franchise.objects.select_for_update().order_by('pk')
+        if franchise_ids is not None:
+            franchises = franchises.filter(pk__in=[franchise_id for franchise_id in franchise_ids if franchise_id])
+        list(franchises.values_list('pk', flat=True))
+    
+    @classmethod
+    def appliquer(cls, vente, signe=1):
+        """Ajoute (signe=1) ou retire (signe=-1) une journée de vente aux trois cumuls qui la contiennent"""
+        increments = {
+            'chiffre_affaires': F('chiffre_affaires') + signe * vente.chiffre_affaires_jour,
+            'redevance': F('redevance') + signe * vente.redevance_due,
+            'nombre_transactions': F('nombre_transactions') + signe * vente.nombre_transactions,
+            'nombre_jours': F('nombre_jours') + signe,
+            'updated_at': timezone.now(),
+        }
+        for periode, _ in cls.PERIODE_CHOICES:
+            cumul = cls.objects.filter(
+                franchise_id=vente.franchise_id, periode=periode, debut=debut_periode(periode, vente.date_vente)
+            )
+            if signe < 0:
+                cumul.update(**increments)
+                cumul.filter(nombre_jours=0).delete()
+                continue
+            if cumul.update(**increments):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        franchise_id=vente.franchise_id,
+                        periode=periode,
+                        debut=debut_periode(periode, vente.date_vente),
+                        chiffre_affaires=vente.chiffre_affaires_jour,
+                        redevance=vente.redevance_due,
+                        nombre_transactions=vente.nombre_transactions,
+                        nombre_jours=1
+                    )
+            except IntegrityError:
+                # Créé entre-temps par une écriture concurrente
+                cumul.update(**increments)
+    
+    @classmethod
+    def reconstruire(cls, franchise_ids=None, date_min=None, date_max=None):
+        """Recalcule depuis les ventes les cumuls des périodes couvrant [date_min, date_max]
+        
+        Sans bornes ni franchises, tous les cumuls sont reconstruits. Une requête GROUP BY
+        par type de période, franchises verrouillées ; renvoie le nombre de cumuls écrits.
+        """
+        ventes = VenteFranchise.objects.all()
+        cumuls = cls.objects.all()
+        if franchise_ids is not None:
+            ventes = ventes.filter(franchise_id__in=franchise_ids)
+            cumuls = cumuls.filter(franchise_id__in=franchise_ids)
+        
+        nombre = 0
+        with transaction.atomic():
+            cls.verrouiller(franchise_ids)
+            for periode in cls.TRONCATURES:
+                ventes_periode = ventes
+                cumuls_periode = cumuls.filter(periode=periode)
+                if date_min:
+                    debut = debut_periode(periode, date_min)
+                    ventes_periode = ventes_periode.filter(date_vente__gte=debut)
+                    cumuls_periode = cumuls_periode.filter(debut__gte=debut)
+                if date_max:
+                    fin = debut_periode(periode, date_max)
+                    ventes_periode = ventes_periode.filter(date_vente__lt=periode_suivante(periode, fin))
+                    cumuls_periode = cumuls_periode.filter(debut__lte=fin)
+                nombre += cls._remplacer(periode, ventes_periode, cumuls_periode)
+        return nombre
+    
+    @classmethod
+    def reconstruire_bornes(cls, bornes):
+        """Recalcule les cumuls couvrant, pour chaque franchise, ses propres dates modifiées
+        
+        bornes : {franchise_id: (premier jour, dernier jour)}. Contrairement à reconstruire(),
+        l'intervalle d'une franchise ne s'étend pas aux autres : un import qui touche
+        janvier pour l'une et décembre pour l'autre ne recalcule pas toute l'année des deux.
+        Toujours une requête GROUP BY par type de période, franchises verrouillées.
+        """
+        if not bornes:
+            return 0
+        nombre = 0
+        with transaction.atomic():
+            cls.verrouiller(bornes)
+            for periode in cls.TRONCATURES:
+                filtre_ventes, filtre_cumuls = Q(pk__in=[]), Q(pk__in=[])
+                for franchise_id, (date_min, date_max) in bornes.items():
+                    debut, fin = debut_periode(periode, date_min), debut_periode(periode, date_max)
+                    filtre_ventes |= Q(
+                        franchise_id=franchise_id, date_vente__gte=debut, date_vente__lt=periode_suivante(periode, fin)
+                    )
+                    filtre_cumuls |= Q(franchise_id=franchise_id, debut__gte=debut, debut__lte=fin)
+                nombre += cls._remplacer(
+                    periode,
+                    VenteFranchise.objects.filter(filtre_ventes),
+                    cls.objects.filter(filtre_cumuls, periode=periode)
+                )
+        return nombre
+    
+    @staticmethod
+    def bornes_ventes(lignes):
+        """{franchise_id: (premier jour, dernier jour)} de couples (franchise_id, date_vente)"""
+        bornes = {}
+        for franchise_id, jour in lignes:
+            debut, fin = bornes.get(franchise_id, (jour, jour))
+            bornes[franchise_id] = (min(debut, jour), max(fin, jour))
+        return bornes
+    
+    @classmethod
+    def _remplacer(cls, periode, ventes, cumuls):
+        """Remplace les cumuls de la période par l'agrégat des ventes ; renvoie le nombre écrit
+        
+        Appelé dans la transaction de reconstruire() / reconstruire_bornes(), franchises
+        verrouillées : agrégat, suppression et insertion voient les mêmes ventes.
+        """
+        lignes = ventes.annotate(debut=cls.TRONCATURES[periode]('date_vente')).values(
+            'franchise', 'debut'
+        ).annotate(
+            total_ca=Sum('chiffre_affaires_jour'),
+            total_redevance=Sum('redevance_due'),
+            total_transactions=Sum('nombre_transactions'),
+            jours=Count('id')
+        ).order_by()
+        nouveaux = [
+            cls(
+                franchise_id=ligne['franchise'],
+                periode=periode,
+                debut=ligne['debut'],
+                chiffre_affaires=ligne['total_ca'],
+                redevance=ligne['total_redevance'],
+                nombre_transactions=ligne['total_transactions'],
+                nombre_jours=ligne['jours']
+            )
+            for ligne in lignes
+        ]
+        cumuls.delete()
+        cls.objects.bulk_create(nouveaux, batch_size=1000)
+        return len(nouveaux)
+
+
+
+
+class TableauDeBord(models.Model):
+    """Compteurs des tableaux de bord, une ligne par franchise et une ligne globale (franchise vide)
+
+    Seule la commande rafraichir_tableaux_de_bord recalcule les lignes (à planifier chaque
+    minute avec --perimes, et chaque nuit sans option) ; la lecture sert la ligne telle
+    quelle. Les écritures sur les modèles suivis marquent à recalculer la ligne de la
+    franchise concernée (voir signals.py). La ligne globale n'est jamais marquée : une
+    écriture ne verrouille donc pas une ligne partagée par toute l'application, et la
+    commande la recalcule à chaque passage.
+    """
+    franchise = models.OneToOneField(
+        Franchise, on_delete=models.CASCADE, null=True, blank=True, related_name='tableau_de_bord'
+    )
+
+    camions_total = models.PositiveIntegerField(default=0)
+    camions_actifs = models.PositiveIntegerField(default=0)
+    camions_disponibles = models.PositiveIntegerField(default=0)
+    emplacements_autorises = models.PositiveIntegerField(default=0)
+    commandes_total = models.PositiveIntegerField(default=0)
+    commandes_en_attente = models.PositiveIntegerField(default=0)
+    commandes_en_cours = models.PositiveIntegerField(default=0)
+    commandes_conformes_80_20 = models.PositiveIntegerField(default=0)
+    affectations_actives = models.PositiveIntegerField(default=0)
+    affectations_programmees = models.PositiveIntegerField(default=0)
+    chiffre_affaires_30j = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    redevance_30j = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    # Compteurs propres à la ligne globale
+    franchises_actives = models.PositiveIntegerField(default=0)
+    entrepots_drivn_cook = models.PositiveIntegerField(default=0)
+    fournisseurs_libres = models.PositiveIntegerField(default=0)
+    alertes_stock = models.PositiveIntegerField(default=0)
+
+    date_calcul = models.DateField(null=True, blank=True)
+    a_recalculer = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    CHAMPS_CALCULES = [
+        'camions_total', 'camions_actifs', 'camions_disponibles', 'emplacements_autorises',
+        'commandes_total', 'commandes_en_attente', 'commandes_en_cours', 'commandes_conformes_80_20',
+        'affectations_actives', 'affectations_programmees', 'chiffre_affaires_30j', 'redevance_30j',
+        'franchises_actives', 'entrepots_drivn_cook', 'fournisseurs_libres', 'alertes_stock',
+        'date_calcul',
+    ]
+
+    class Meta:
+        verbose_name = "Tableau de bord"
+        verbose_name_plural = "Tableaux de bord"
+        constraints = [
+            # Une seule ligne globale : la franchise vide compte comme la clé 0
+            models.UniqueConstraint(
+                Coalesce('franchise', Value(0), output_field=models.BigIntegerField()),
+                name='tableau_unique_par_franchise'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Tableau de bord {self.franchise.nom_franchise if self.franchise_id else 'global'}"
+
+    @property
+    def taux_conformite_80_20(self):
+        if self.commandes_total == 0:
+            return 0
+        return round(self.commandes_conformes_80_20 / self.commandes_total * 100, 2)
+
+    @classmethod
+    def obtenir(cls, franchise=None):
+        """Ligne de la franchise (ou globale) telle qu'enregistrée, calculée à la première lecture"""
+        tableau, _ = cls.objects.get_or_create(franchise=franchise)
+        if tableau.date_calcul is None:
+            tableau.rafraichir()
+        return tableau
+
+    def rafraichir(self):
+        """Recalcule et enregistre la ligne
+        
+        Le drapeau est baissé avant le calcul : une écriture concurrente le relève et la
+        ligne sera recalculée au passage suivant de la commande.
+        """
+        TableauDeBord.objects.filter(pk=self.pk).update(a_recalculer=False)
+        self.a_recalculer = False
+        self.recalculer()
+        self.save(update_fields=self.CHAMPS_CALCULES + ['updated_at'])
+
+    @classmethod
+    def invalider(cls, *franchise_ids):
+        """Marque à recalculer les lignes des franchises fournies (la ligne globale n'est pas touchée)"""
+        franchise_ids = [franchise_id for franchise_id in franchise_ids if franchise_id]
+        if franchise_ids:
+            cls.objects.filter(franchise_id__in=franchise_ids, a_recalculer=False).update(a_recalculer=True)
+
+    @classmethod
+    def invalider_tout(cls):
+        cls.objects.filter(a_recalculer=False).update(a_recalculer=True)
+
+    def recalculer(self):
+        """Recalcule les compteurs, un agrégat par table"""
+        aujourd_hui = timezone.now().date()
+        franchise = {'franchise': self.franchise} if self.franchise_id else {}
+        camion_franchise = {'camion__franchise': self.franchise} if self.franchise_id else {}
+
+        compteurs = {}
+        compteurs.update(Camion.objects.filter(**franchise).aggregate(
+            camions_total=Count('id'),
+            camions_actifs=Count('id', filter=Q(statut__in=['disponible', 'attribue'])),
+            camions_disponibles=Count('id', filter=Q(statut='disponible')),
+        ))
+        compteurs.update(CommandeFranchise.objects.filter(**franchise).aggregate(
+            commandes_total=Count('id'),
+            commandes_en_attente=Count('id', filter=Q(statut='en_attente')),
+            commandes_en_cours=Count('id', filter=Q(statut__in=['en_attente', 'validee', 'preparee'])),
+            commandes_conformes_80_20=Count('id', filter=Q(conforme_80_20=True)),
+        ))
+        compteurs.update(AffectationEmplacement.objects.filter(**camion_franchise).aggregate(
+            affectations_actives=Count('id', filter=Q(statut='en_cours')),
+            affectations_programmees=Count('id', filter=Q(statut='programme')),
+        ))
+        ventes = VenteFranchise.objects.filter(
+            date_vente__gte=aujourd_hui - timedelta(days=30), **franchise
+        ).aggregate(ca=Sum('chiffre_affaires_jour'), redevance=Sum('redevance_due'))
+        self.chiffre_affaires_30j = ventes['ca'] or 0
+        self.redevance_30j = ventes['redevance'] or 0
+
+        if self.franchise_id:
+            self.emplacements_autorises = Emplacement.objects.filter(
+                franchises_autorisees=self.franchise
+            ).count()
+        else:
+            # Franchise active = droit d'entrée payé (statut « Payé - Actif »)
+            self.franchises_actives = Franchise.objects.filter(statut='paye').count()
+            compteurs.update(Entrepot.objects.filter(statut='actif').aggregate(
+                entrepots_drivn_cook=Count('id', filter=Q(type_entrepot='drivn_cook')),
+                fournisseurs_libres=Count('id', filter=Q(type_entrepot='fournisseur_libre')),
+            ))
+            self.alertes_stock = StockEntrepot.objects.filter(
+                quantite_disponible__lte=F('seuil_alerte')
+            ).count()
+
+        for champ, valeur in compteurs.items():
+            setattr(self, champ, valeur)
+        self.date_calcul = aujourd_hui
+
+
+
+class TacheRapportPDF(models.Model):
+    """Rendu en tâche de fond d'un rapport PDF de ventes mensuel
+
+    cle identifie le contenu (franchise, mois, version des données) : le fichier produit
+    est réutilisé tant que les ventes du mois ne changent pas.
+    """
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('termine', 'Terminé'),
+        ('erreur', 'Erreur'),
+    ]
+    
+    franchise = models.ForeignKey(Franchise, on_delete=models.CASCADE, related_name='taches_rapports')
+    mois = models.DateField(help_text="Premier jour du mois du rapport")
+    cle = models.CharField(max_length=64, unique=True)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
+    erreur = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Tâche de rapport PDF"
+        verbose_name_plural = "Tâches de rapports PDF"
+        indexes = [
+            models.Index(fields=['statut', 'created_at'], name='tache_rapport_statut_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Rapport {self.mois:%Y-%m} - {self.franchise_id} ({self.get_statut_display()})"
+    
+    @property
+    def chemin(self):
+        return os.path.join(settings.RAPPORTS_PDF_DIR, f'{self.cle}.pdf')
+    
+    @property
+    def disponible(self):
+        return self.statut == 'termine' and os.path.exists(self.chemin)
@@ -0,0 +1,139 @@
+# planification.py - DRIV'N COOK : répartition automatique des camions sur les emplacements
+from datetime import timedelta
+
+from django.db.models import Q
+
+from .models import AffectationEmplacement, Emplacement
+
+# Horizon maximal d'une planification (un trimestre)
+JOURS_MAX_PLANIFICATION = 93
+
+
+def _cout(emplacement, types_zone):
+    """Ordre de préférence d'un emplacement : zone souhaitée d'abord, puis tarif le plus bas"""
+    rang_zone = types_zone.index(emplacement.type_zone) if emplacement.type_zone in types_zone else len(types_zone)
+    return (rang_zone, emplacement.tarif_journalier or 0, emplacement.id)
+
+
+def _repartir(emplacements_tries, franchises_par_emplacement, capacites):
+    """Affecte au plus capacites[f] emplacements à chaque franchise f autorisée
+
+    Le coût ne dépend que de l'emplacement : parcourir les emplacements du moins cher au
+    plus cher en gardant tout emplacement pour lequel un chemin augmentant existe donne
+    une affectation de taille maximale et de coût minimal (glouton sur le matroïde
+    transversal). Les sommets « franchise » portent la capacité, le graphe reste petit
+    même avec des centaines de camions.
+    """
+    emplacements_de = {franchise_id: [] for franchise_id in capacites}
+
+    def augmenter(emplacement_id, visitees):
+        for franchise_id in franchises_par_emplacement[emplacement_id]:
+            if franchise_id in visitees or not capacites.get(franchise_id):
+                continue
+            visitees.add(franchise_id)
+            if len(emplacements_de[franchise_id]) < capacites[franchise_id]:
+                emplacements_de[franchise_id].append(emplacement_id)
+                return True
+            # Franchise pleine : céder un de ses emplacements à une autre franchise
+            for autre_id in list(emplacements_de[franchise_id]):
+                emplacements_de[franchise_id].remove(autre_id)
+                if augmenter(autre_id, visitees):
+                    emplacements_de[franchise_id].append(emplacement_id)
+                    return True
+                emplacements_de[franchise_id].append(autre_id)
+        return False
+
+    for emplacement in emplacements_tries:
+        augmenter(emplacement.id, set())
+    return emplacements_de
+
+
+def proposer_planning(camions, date_debut, date_fin, types_zone=None, tarif_max=None,
+                      horaire_debut=None, horaire_fin=None):
+    """Planning sans conflit des camions sur leurs emplacements autorisés, jour par jour
+
+    Trois requêtes : autorisations, emplacements, affectations actives qui recouvrent la
+    période (camions ou emplacements déjà pris). Chaque jour, le plus grand nombre possible
+    de camions reçoit un emplacement libre, au coût le plus bas selon les préférences ;
+    un camion garde son emplacement de la veille quand c'est possible et les jours
+    consécutifs sont regroupés en une seule affectation.
+
+    Renvoie (affectations non enregistrées, [(camion, jour)] restés sans emplacement).
+    """
+    types_zone = list(types_zone or [])
+    franchise_ids = {camion.franchise_id for camion in camions}
+
+    franchises_par_emplacement = {}
+    for emplacement_id, franchise_id in Emplacement.franchises_autorisees.through.objects.filter(
+        franchise_id__in=franchise_ids
+    ).values_list('emplacement_id', 'franchise_id'):
+        franchises_par_emplacement.setdefault(emplacement_id, []).append(franchise_id)
+
+    emplacements = Emplacement.objects.filter(pk__in=franchises_par_emplacement)
+    if tarif_max is not None:
+        emplacements = emplacements.exclude(tarif_journalier__gt=tarif_max)
+    emplacements = sorted(emplacements, key=lambda emplacement: _cout(emplacement, types_zone))
+
+    # Jours déjà pris, par emplacement et par camion, sur le créneau demandé
+    nombre_jours = (date_fin - date_debut).days + 1
+    pris = {}
+    for affectation in AffectationEmplacement.objects.filter(
+        Q(emplacement_id__in=[emplacement.id for emplacement in emplacements])
+        | Q(camion_id__in=[camion.id for camion in camions]),
+        AffectationEmplacement.filtre_chevauchement(date_debut, date_fin, horaire_debut, horaire_fin)
+    ):
+        premier = max((affectation.date_debut - date_debut).days, 0)
+        dernier = min((affectation.date_fin_effective - date_debut).days, nombre_jours - 1)
+        for cle in (('emplacement', affectation.emplacement_id), ('camion', affectation.camion_id)):
+            pris.setdefault(cle, set()).update(range(premier, dernier + 1))
+
+    camions = sorted(camions, key=lambda camion: camion.id)
+    emplacements_par_id = {emplacement.id: emplacement for emplacement in emplacements}
+    affectations, sans_emplacement = [], []
+    en_cours = {}  # camion.id -> affectation prolongée tant que le camion reste sur place
+
+    for jour in range(nombre_jours):
+        date_jour = date_debut + timedelta(days=jour)
+        libres = [camion for camion in camions if jour not in pris.get(('camion', camion.id), ())]
+        capacites = {}
+        for camion in libres:
+            capacites[camion.franchise_id] = capacites.get(camion.franchise_id, 0) + 1
+
+        repartition = _repartir(
+            [e for e in emplacements if jour not in pris.get(('emplacement', e.id), ())],
+            franchises_par_emplacement,
+            capacites
+        )
+
+        veille = {
+            camion_id: affectation for camion_id, affectation in en_cours.items()
+            if affectation.date_fin_effective == date_jour - timedelta(days=1)
+        }
+        for franchise_id, emplacement_ids in repartition.items():
+            restants = sorted(emplacement_ids, key=lambda i: _cout(emplacements_par_id[i], types_zone))
+            a_placer = []
+            for camion in (c for c in libres if c.franchise_id == franchise_id):
+                precedente = veille.get(camion.id)
+                if precedente and precedente.emplacement_id in restants:
+                    # Même emplacement que la veille : prolonger l'affectation
+                    restants.remove(precedente.emplacement_id)
+                    precedente.date_fin = date_jour
+                else:
+                    a_placer.append(camion)
+
+            for camion in a_placer:
+                if not restants:
+                    sans_emplacement.append((camion, date_jour))
+                    continue
+                affectation = AffectationEmplacement(
+                    camion=camion,
+                    emplacement=emplacements_par_id[restants.pop(0)],
+                    date_debut=date_jour,
+                    horaire_debut=horaire_debut,
+                    horaire_fin=horaire_fin,
+                    statut='programme'
+                )
+                affectations.append(affectation)
+                en_cours[camion.id] = affectation
+
+    return affectations, sans_emplacement
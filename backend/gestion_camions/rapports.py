@@ -0,0 +1,499 @@
+# rapports.py - DRIV'N COOK : rapports PDF de ventes mensuels (rendu, cache disque, file d'attente)
+import hashlib
+import logging
+import os
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import monotonic
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .models import CumulVentes, Franchise, TacheRapportPDF, VenteFranchise, periode_suivante
+
+logger = logging.getLogger(__name__)
+
+# Rendu en tâche de fond dans le processus web, sauf si un worker dédié
+# (commande traiter_rapports_pdf) traite la file d'attente
+_executeur = ThreadPoolExecutor(max_workers=2, thread_name_prefix='rapports-pdf')
+
+# Tâche restée en attente ou en cours plus longtemps que ce délai : processus arrêté pendant
+# le rendu (redémarrage, worker tué), elle est remise en file à la demande suivante
+DELAI_REPRISE_TACHES = timedelta(minutes=10)
+
+# Nettoyage du cache disque au plus une fois par heure et par processus
+INTERVALLE_NETTOYAGE = 3600
+_dernier_nettoyage = None
+
+
+def ventes_du_mois(franchise, premier_jour):
+    """Ventes quotidiennes du mois, chargées une seule fois"""
+    return list(VenteFranchise.objects.filter(
+        franchise=franchise,
+        date_vente__gte=premier_jour,
+        date_vente__lt=periode_suivante('mois', premier_jour)
+    ).order_by('date_vente'))
+
+
+def cle_rapport(franchise, premier_jour):
+    """Clé du PDF : franchise, mois et version des données affichées
+
+    La version suit le cumul du mois (modifié à chaque vente du mois) et les informations
+    de la franchise imprimées en en-tête : un mois clos garde la même clé.
+    """
+    cumul = CumulVentes.objects.filter(
+        franchise=franchise, periode='mois', debut=premier_jour
+    ).values_list('updated_at', 'nombre_jours').first()
+    user = franchise.user
+    version = '|'.join(str(valeur) for valeur in [
+        franchise.pk, f'{premier_jour:%Y-%m}', cumul,
+        franchise.nom_franchise, franchise.adresse, franchise.code_postal, franchise.ville,
+        user.first_name, user.last_name,
+    ])
+    return hashlib.sha256(version.encode()).hexdigest()
+
+
+def pdf_ventes_mensuel(franchise, premier_jour, ventes):
+    """Construit le PDF du rapport mensuel à partir des ventes du mois ; renvoie les octets"""
+    total_ca = sum(vente.chiffre_affaires_jour for vente in ventes)
+    total_redevance = sum(vente.redevance_due for vente in ventes)
+    total_transactions = sum(vente.nombre_transactions for vente in ventes)
+    
+    # Nom du mois en français
+    mois_noms = [
+        '', 'Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
+        'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre'
+    ]
+    
+    # Générer le PDF
+    buffer = BytesIO()
+    
+    # Configuration du document
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=2*cm,
+        leftMargin=2*cm,
+        topMargin=2*cm,
+        bottomMargin=2*cm
+    )
+    
+    # Styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        textColor=colors.HexColor('#3b82f6'),
+        alignment=1  # Centré
+    )
+    
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceAfter=20,
+        textColor=colors.HexColor('#666666'),
+        alignment=1
+    )
+    
+    normal_style = styles['Normal']
+    
+    # Contenu du PDF
+    story = []
+    
+    # Titre
+    story.append(Paragraph("RAPPORT MENSUEL DE VENTES", title_style))
+    story.append(Paragraph(f"DRIV'N COOK - {franchise.nom_franchise}", subtitle_style))
+    story.append(Spacer(1, 20))
+    
+    # Informations de la franchise
+    franchise_data = [
+        ['Franchise:', franchise.nom_franchise],
+        ['Propriétaire:', f"{franchise.user.first_name} {franchise.user.last_name}"],
+        ['Adresse:', f"{franchise.adresse}, {franchise.code_postal} {franchise.ville}"],
+        ['Période:', f"{mois_noms[premier_jour.month]} {premier_jour.year}"],
+        ['Date de génération:', datetime.now().strftime("%d/%m/%Y à %H:%M")],
+    ]
+    
+    franchise_table = Table(franchise_data, colWidths=[4*cm, 12*cm])
+    franchise_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8fafc')),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
+        ('LEFTPADDING', (0, 0), (-1, -1), 8),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ]))
+    
+    story.append(franchise_table)
+    story.append(Spacer(1, 20))
+    
+    # Résumé des ventes
+    story.append(Paragraph("RÉSUMÉ DU MOIS", styles['Heading2']))
+    story.append(Spacer(1, 10))
+    
+    resume_data = [
+        ['Nombre de jours d\'activité:', str(len(ventes))],
+        ['Chiffre d\'affaires total:', f"{total_ca:,.2f} €"],
+        ['Redevances dues (4%):', f"{total_redevance:,.2f} €"],
+        ['Moyenne journalière:', f"{(total_ca / len(ventes) if ventes else 0):,.2f} €"],
+    ]
+    
+    resume_table = Table(resume_data, colWidths=[8*cm, 8*cm])
+    resume_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e0f2fe')),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 11),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bae6fd')),
+        ('LEFTPADDING', (0, 0), (-1, -1), 10),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ]))
+    
+    story.append(resume_table)
+    story.append(Spacer(1, 30))
+    
+    # Détail des ventes
+    if ventes:
+        story.append(Paragraph("DÉTAIL DES VENTES", styles['Heading2']))
+        story.append(Spacer(1, 10))
+        
+        # En-têtes du tableau
+        ventes_data = [['Date', 'Chiffre d\'affaires', 'Transactions', 'Redevance due']]
+        
+        # Données des ventes
+        for vente in ventes:
+            ventes_data.append([
+                vente.date_vente.strftime("%d/%m/%Y"),
+                f"{vente.chiffre_affaires_jour:,.2f} €",
+                str(vente.nombre_transactions),
+                f"{vente.redevance_due:,.2f} €"
+            ])
+        
+        # Ligne de total
+        ventes_data.append([
+            'TOTAL',
+            f"{total_ca:,.2f} €",
+            str(total_transactions),
+            f"{total_redevance:,.2f} €"
+        ])
+        
+        ventes_table = Table(ventes_data, colWidths=[3*cm, 4*cm, 3*cm, 4*cm])
+        ventes_table.setStyle(TableStyle([
+            # En-tête
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            
+            # Corps du tableau
+            ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -2), 9),
+            ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+            
+            # Ligne de total
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, -1), (-1, -1), 10),
+            
+            # Grille et espacement
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 8),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            
+            # Alternance de couleurs
+            ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#f9fafb')]),
+        ]))
+        
+        story.append(ventes_table)
+    else:
+        story.append(Paragraph("Aucune vente enregistrée pour cette période.", normal_style))
+    
+    # Générer le PDF
+    doc.build(story)
+    
+    
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def nom_fichier_rapport(franchise, premier_jour):
+    """Nom du PDF : nom_franchise n'est pas unique et peut contenir « / », la clé le départage"""
+    return f"rapport_ventes_{franchise.pk}_{slugify(franchise.nom_franchise)}_{premier_jour:%Y-%m}.pdf"
+
+
+def reprendre_taches_bloquees(delai=DELAI_REPRISE_TACHES):
+    """Remet en attente les tâches en cours depuis plus de delai ; renvoie leur nombre"""
+    return TacheRapportPDF.objects.filter(
+        statut='en_cours', updated_at__lt=timezone.now() - delai
+    ).update(statut='en_attente', updated_at=timezone.now())
+
+
+def _planifier(tache):
+    """Rendu en tâche de fond dans le processus web (sans worker dédié)"""
+    if not getattr(settings, 'RAPPORTS_PDF_WORKER_EXTERNE', False):
+        transaction.on_commit(lambda: _executeur.submit(_executer_en_fond, tache.pk))
+        _planifier_nettoyage()
+
+
+def demander_rapport(franchise, premier_jour, planifier=True, reessayer=True):
+    """Tâche de rendu du rapport (existante si le même PDF est déjà produit ou en file)
+    
+    reessayer=False laisse en erreur une tâche qui a échoué (suivi d'un lot sans relance en boucle).
+    """
+    tache, creee = TacheRapportPDF.objects.get_or_create(
+        cle=cle_rapport(franchise, premier_jour),
+        defaults={'franchise': franchise, 'mois': premier_jour}
+    )
+    if not creee and (
+        (tache.statut == 'erreur' and reessayer) or (tache.statut == 'termine' and not tache.disponible)
+    ):
+        # Nouvel essai après une erreur, ou fichier supprimé du disque
+        TacheRapportPDF.objects.filter(pk=tache.pk).update(
+            statut='en_attente', erreur='', updated_at=timezone.now()
+        )
+        tache.statut = 'en_attente'
+        creee = True
+    if creee:
+        if planifier:
+            _planifier(tache)
+    elif planifier:
+        relancer_si_bloquee(tache)
+    return tache
+
+
+def relancer_si_bloquee(tache):
+    """Remet en file une tâche bloquée (en attente ou en cours depuis DELAI_REPRISE_TACHES)
+
+    Sans worker dédié, une tâche soumise au pool du processus web est perdue si ce processus
+    s'arrête : elle resterait « en cours » (ou « en attente ») indéfiniment. Renvoie True si
+    la tâche a été relancée.
+    """
+    if tache.statut not in ('en_attente', 'en_cours'):
+        return False
+    if not TacheRapportPDF.objects.filter(
+        pk=tache.pk, statut=tache.statut, updated_at__lt=timezone.now() - DELAI_REPRISE_TACHES
+    ).update(statut='en_attente', updated_at=timezone.now()):
+        return False
+    logger.warning("Tâche de rapport %s bloquée (%s) : remise en file", tache.pk, tache.statut)
+    tache.statut = 'en_attente'
+    _planifier(tache)
+    return True
+
+
+def nettoyer_rapports(conservation=None):
+    """Supprime les PDF du cache disque et les tâches terminées plus anciens que conservation
+
+    Par défaut RAPPORTS_PDF_CONSERVATION_JOURS. Un rapport supprimé est simplement rendu à
+    nouveau à la demande suivante (voir demander_rapport). Renvoie le nombre de fichiers supprimés.
+    """
+    if conservation is None:
+        conservation = timedelta(days=settings.RAPPORTS_PDF_CONSERVATION_JOURS)
+    limite = timezone.now() - conservation
+    TacheRapportPDF.objects.filter(statut__in=('termine', 'erreur'), updated_at__lt=limite).delete()
+    
+    # Fichiers anciens, y compris les temporaires laissés par un rendu interrompu
+    supprimes = 0
+    try:
+        entrees = list(os.scandir(settings.RAPPORTS_PDF_DIR))
+    except FileNotFoundError:
+        return 0
+    for entree in entrees:
+        try:
+            if entree.is_file() and entree.stat().st_mtime < limite.timestamp():
+                os.remove(entree.path)
+                supprimes += 1
+        except FileNotFoundError:
+            continue
+    return supprimes
+
+
+def _planifier_nettoyage():
+    global _dernier_nettoyage
+    if _dernier_nettoyage is not None and monotonic() - _dernier_nettoyage < INTERVALLE_NETTOYAGE:
+        return
+    _dernier_nettoyage = monotonic()
+    transaction.on_commit(lambda: _executeur.submit(_nettoyer_en_fond))
+
+
+def _nettoyer_en_fond():
+    try:
+        nettoyer_rapports()
+    except Exception:
+        logger.exception("Échec du nettoyage des rapports PDF")
+    finally:
+        connection.close()
+
+
+def executer_tache(tache):
+    """Rend le PDF d'une tâche en attente ; False si un autre processus s'en occupe déjà"""
+    if not TacheRapportPDF.objects.filter(pk=tache.pk, statut='en_attente').update(
+        statut='en_cours', updated_at=timezone.now()
+    ):
+        return False
+    
+    try:
+        franchise = tache.franchise
+        pdf = pdf_ventes_mensuel(franchise, tache.mois, ventes_du_mois(franchise, tache.mois))
+        os.makedirs(os.path.dirname(tache.chemin), exist_ok=True)
+        temporaire = f'{tache.chemin}.{os.getpid()}.tmp'
+        with open(temporaire, 'wb') as fichier:
+            fichier.write(pdf)
+        os.replace(temporaire, tache.chemin)
+    except Exception as e:
+        logger.exception("Échec du rendu du rapport %s", tache.cle)
+        TacheRapportPDF.objects.filter(pk=tache.pk).update(
+            statut='erreur', erreur=str(e), updated_at=timezone.now()
+        )
+        tache.statut = 'erreur'
+        return True
+    
+    TacheRapportPDF.objects.filter(pk=tache.pk).update(statut='termine', updated_at=timezone.now())
+    tache.statut = 'termine'
+    return True
+
+
+def _executer_en_fond(tache_id):
+    try:
+        tache = TacheRapportPDF.objects.select_related('franchise__user').filter(pk=tache_id).first()
+        if tache:
+            executer_tache(tache)
+    finally:
+        connection.close()
+
+
+
+# 📦 Rapports de fin de mois pour toutes les franchises
+
+def franchises_du_mois(premier_jour):
+    """Franchises concernées par le rapport du mois : actives, ou ayant vendu ce mois-ci"""
+    return Franchise.objects.filter(
+        Q(statut='paye') | Q(
+            ventes__date_vente__gte=premier_jour,
+            ventes__date_vente__lt=periode_suivante('mois', premier_jour)
+        )
+    ).distinct()
+
+
+def _rendre(arguments):
+    franchise, premier_jour, ventes = arguments
+    return pdf_ventes_mensuel(franchise, premier_jour, ventes)
+
+
+def _donnees_du_mois(premier_jour, franchises=None):
+    """[(franchise, ventes du mois)] dans l'ordre des noms, en deux requêtes (franchises, ventes)"""
+    if franchises is None:
+        franchises = franchises_du_mois(premier_jour)
+    franchises = list(franchises.select_related('user').order_by('nom_franchise'))
+    
+    ventes_par_franchise = defaultdict(list)
+    if franchises:
+        for vente in VenteFranchise.objects.filter(
+            franchise__in=[franchise.pk for franchise in franchises],
+            date_vente__gte=premier_jour,
+            date_vente__lt=periode_suivante('mois', premier_jour)
+        ).order_by('date_vente'):
+            ventes_par_franchise[vente.franchise_id].append(vente)
+    return [(franchise, ventes_par_franchise[franchise.pk]) for franchise in franchises]
+
+
+def rapports_du_mois(premier_jour, franchises=None):
+    """Rend le rapport du mois de chaque franchise, l'un après l'autre dans le processus courant
+    
+    Génère (franchise, nom de fichier, octets du PDF) dans l'ordre des noms de franchise.
+    """
+    for franchise, ventes in _donnees_du_mois(premier_jour, franchises):
+        yield franchise, nom_fichier_rapport(franchise, premier_jour), pdf_ventes_mensuel(
+            franchise, premier_jour, ventes
+        )
+
+
+def rapports_du_mois_en_parallele(premier_jour, franchises=None, processus=None):
+    """Comme rapports_du_mois, avec le rendu réparti sur un pool de processus
+    
+    Réservé aux commandes de gestion : ferme toutes les connexions du thread avant de créer
+    les processus fils, à ne pas appeler depuis une vue. Les processus ne font que le rendu
+    ReportLab, sans accès à la base.
+    """
+    donnees = _donnees_du_mois(premier_jour, franchises)
+    if not donnees:
+        return
+    
+    # Pas de connexion ouverte partagée avec les processus fils
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processus, initializer=django.setup) as pool:
+        pdfs = pool.map(_rendre, [(franchise, premier_jour, ventes) for franchise, ventes in donnees])
+        for (franchise, _), pdf in zip(donnees, pdfs):
+            yield franchise, nom_fichier_rapport(franchise, premier_jour), pdf
+
+
+def demander_rapports_du_mois(premier_jour, franchises=None):
+    """Tâches de rendu du rapport du mois de chaque franchise, dans l'ordre des noms
+    
+    Mises en file au besoin (voir demander_rapport) ; une tâche en erreur n'est pas relancée.
+    """
+    if franchises is None:
+        franchises = franchises_du_mois(premier_jour)
+    taches = []
+    for franchise in franchises.select_related('user').order_by('nom_franchise'):
+        tache = demander_rapport(franchise, premier_jour, reessayer=False)
+        tache.franchise = franchise
+        taches.append(tache)
+    return taches
+
+
+def rapports_des_taches(taches):
+    """(franchise, nom de fichier, octets du PDF) des tâches terminées, lus depuis le cache disque"""
+    for tache in taches:
+        if tache.disponible:
+            with open(tache.chemin, 'rb') as fichier:
+                yield tache.franchise, nom_fichier_rapport(tache.franchise, tache.mois), fichier.read()
+
+
+def ecrire_rapports(rapports, destination):
+    """Écrit les rapports dans un dossier ; renvoie le nombre de fichiers"""
+    os.makedirs(destination, exist_ok=True)
+    nombre = 0
+    for _, nom_fichier, pdf in rapports:
+        with open(os.path.join(destination, nom_fichier), 'wb') as fichier:
+            fichier.write(pdf)
+        nombre += 1
+    return nombre
+
+
+def zipper_rapports(rapports, fichier):
+    """Écrit les rapports dans une archive zip (chemin ou objet fichier) ; renvoie le nombre de PDF"""
+    nombre = 0
+    with zipfile.ZipFile(fichier, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for _, nom_fichier, pdf in rapports:
+            archive.writestr(nom_fichier, pdf)
+            nombre += 1
+    return nombre
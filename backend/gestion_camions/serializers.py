@@ -1,11 +1,14 @@
 # serializers.py - DRIV'N COOK Mission 1 (VERSION FINALE 80/20)
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from .models import (
     Entrepot, Franchise, Emplacement, Camion, MaintenanceCamion,
     AffectationEmplacement, CategorieProduit, Produit, StockEntrepot,
     CommandeFranchise, DetailCommande, VenteFranchise
 )
+from .planification import JOURS_MAX_PLANIFICATION, proposer_planning
 
 User = get_user_model()
 
@@ -68,6 +71,133 @@ class AffectationEmplacementSerializer(serializers.ModelSerializer):
             'created_at': {'read_only': True},
             'updated_at': {'read_only': True},
         }
+    
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+    
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
+
+class AffectationPlanningLigneSerializer(serializers.Serializer):
+    """Une affectation d'un planning"""
+    camion = serializers.IntegerField()
+    emplacement = serializers.IntegerField()
+    date_debut = serializers.DateField()
+    date_fin = serializers.DateField(required=False, allow_null=True, default=None)
+    horaire_debut = serializers.TimeField(required=False, allow_null=True, default=None)
+    horaire_fin = serializers.TimeField(required=False, allow_null=True, default=None)
+    statut = serializers.ChoiceField(
+        choices=AffectationEmplacement.STATUT_CHOICES, required=False, default='programme'
+    )
+
+
+class AffectationPlanningSerializer(serializers.Serializer):
+    """Planning d'affectations (une semaine, plusieurs camions) contrôlé en un seul passage
+
+    Camions et emplacements sont chargés en une requête chacun ; la franchise passée dans
+    le contexte (franchisé connecté) limite le planning à ses propres camions.
+    """
+    affectations = AffectationPlanningLigneSerializer(many=True, allow_empty=False, max_length=5000)
+    enregistrer = serializers.BooleanField(required=False, default=False)
+
+    def validate_affectations(self, lignes):
+        franchise = self.context.get('franchise')
+        camions = Camion.objects.select_related('franchise').in_bulk({ligne['camion'] for ligne in lignes})
+        emplacements = Emplacement.objects.in_bulk({ligne['emplacement'] for ligne in lignes})
+        erreurs = {}
+
+        for numero, ligne in enumerate(lignes, start=1):
+            camion = camions.get(ligne['camion'])
+            if camion is None or (franchise and camion.franchise_id != franchise.id):
+                erreurs[numero] = f"Camion {ligne['camion']} introuvable."
+            elif ligne['emplacement'] not in emplacements:
+                erreurs[numero] = f"Emplacement {ligne['emplacement']} introuvable."
+
+        if erreurs:
+            raise serializers.ValidationError(
+                [f"Ligne {numero} : {message}" for numero, message in sorted(erreurs.items())]
+            )
+
+        return [
+            AffectationEmplacement(**{
+                **ligne,
+                'camion': camions[ligne['camion']],
+                'emplacement': emplacements[ligne['emplacement']],
+            })
+            for ligne in lignes
+        ]
+
+    def conflits(self):
+        """Refus du planning : [{'ligne': numéro, 'message': ...}] (liste vide si tout passe)"""
+        erreurs = AffectationEmplacement.verifier_planning(self.validated_data['affectations'])
+        return [{'ligne': index + 1, 'message': message} for index, message in sorted(erreurs.items())]
+
+    def save(self):
+        """Crée le planning ; lève DjangoValidationError ({index: message}) en cas de conflit"""
+        return AffectationEmplacement.planifier(self.validated_data['affectations'])
+
+
+class PlanificateurSerializer(serializers.Serializer):
+    """Demande de répartition automatique des camions sur leurs emplacements autorisés"""
+    camions = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=2000)
+    date_debut = serializers.DateField()
+    date_fin = serializers.DateField()
+    horaire_debut = serializers.TimeField(required=False, allow_null=True, default=None)
+    horaire_fin = serializers.TimeField(required=False, allow_null=True, default=None)
+    types_zone = serializers.ListField(
+        child=serializers.ChoiceField(choices=Emplacement.TYPE_ZONE_CHOICES), required=False, default=list
+    )
+    tarif_max = serializers.DecimalField(max_digits=6, decimal_places=2, required=False, allow_null=True, default=None)
+    enregistrer = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        if data['date_fin'] < data['date_debut'] or (
+            (data['date_fin'] - data['date_debut']).days >= JOURS_MAX_PLANIFICATION
+        ):
+            raise serializers.ValidationError({
+                'date_fin': f"Période invalide (au plus {JOURS_MAX_PLANIFICATION} jours)"
+            })
+        if data['horaire_debut'] and data['horaire_fin'] and data['horaire_fin'] <= data['horaire_debut']:
+            raise serializers.ValidationError({
+                'horaire_fin': "L'horaire de fin doit être postérieur à l'horaire de début"
+            })
+
+        # Franchisé : ses camions (tous par défaut) ; admin : liste obligatoire
+        franchise = self.context.get('franchise')
+        camions = Camion.objects.exclude(statut__in=['maintenance', 'hors_service'])
+        if franchise:
+            camions = camions.filter(franchise=franchise)
+        elif not data.get('camions'):
+            raise serializers.ValidationError({'camions': "La liste des camions est obligatoire."})
+        if data.get('camions'):
+            camions = camions.filter(pk__in=data['camions'])
+        camions = list(camions.select_related('franchise'))
+
+        trouves = {camion.id for camion in camions}
+        erreurs = [
+            f"Camion {camion_id} introuvable ou indisponible."
+            for camion_id in data.get('camions', []) if camion_id not in trouves
+        ] + [
+            f"Le camion {camion.numero_camion} n'est attribué à aucune franchise."
+            for camion in camions if not camion.franchise_id
+        ]
+        if erreurs:
+            raise serializers.ValidationError({'camions': erreurs})
+
+        data['camions'] = camions
+        return data
+
+    def proposer(self):
+        """(affectations proposées, [(camion, jour)] sans emplacement)"""
+        donnees = {cle: valeur for cle, valeur in self.validated_data.items() if cle != 'enregistrer'}
+        return proposer_planning(**donnees)
 
 
 class CategorieProduitSerializer(serializers.ModelSerializer):
@@ -138,6 +268,9 @@ class AdminDetailCommandeSerializer(serializers.ModelSerializer):
     
     def get_stock_disponible(self, obj):
         """Stock disponible pour ce produit dans cet entrepôt"""
+        if hasattr(obj, 'stock_disponible_annote'):
+            # Préchargé par CommandeFranchiseQuerySet.avec_details_complets
+            return obj.stock_disponible_annote or 0
         try:
             stock = StockEntrepot.objects.get(
                 produit=obj.produit,
@@ -257,29 +390,16 @@ class AdminCommandeCreateSerializer(serializers.ModelSerializer):
         """Création d'une commande multi-entrepôts avec ses détails"""
         details_data = validated_data.pop('details')
         
-        # Créer la commande
-        commande = CommandeFranchise.objects.create(**validated_data)
-        
-        for detail_data in details_data:
-            try:
-                produit = Produit.objects.get(id=detail_data['produit'])
-                entrepot_livraison = Entrepot.objects.get(id=detail_data['entrepot_livraison'])
-            except (Produit.DoesNotExist, Entrepot.DoesNotExist):
-                raise serializers.ValidationError(
-                    f"Produit ou entrepôt introuvable : {detail_data}"
-                )
+        with transaction.atomic():
+            # Créer la commande
+            commande = CommandeFranchise.objects.create(**validated_data)
             
-            DetailCommande.objects.create(
-                commande=commande,
-                produit=produit,
-                entrepot_livraison=entrepot_livraison,
-                quantite_commandee=detail_data['quantite_commandee'],
-                prix_unitaire=produit.prix_unitaire
-            )
+            # Lignes insérées en bloc, montants recalculés une seule fois
+            try:
+                commande.ajouter_details(details_data)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages)
         
-        # Calcul final des montants
-        commande.calculer_montants()
-        commande.save()
         return commande
 
 
@@ -402,30 +522,15 @@ class AdminCommandeUpdateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         
-        # Supprimer les anciens détails
-        instance.details.all().delete()
-        
-        # Créer les nouveaux détails
-        for detail_data in details_data:
-            try:
-                produit = Produit.objects.get(id=detail_data['produit'])
-                entrepot_livraison = Entrepot.objects.get(id=detail_data['entrepot_livraison'])
-            except (Produit.DoesNotExist, Entrepot.DoesNotExist):
-                raise serializers.ValidationError(
-                    f"Produit ou entrepôt introuvable : {detail_data}"
-                )
+        with transaction.atomic():
+            # Supprimer les anciens détails
+            instance.details.all().delete()
             
-            DetailCommande.objects.create(
-                commande=instance,
-                produit=produit,
-                entrepot_livraison=entrepot_livraison,
-                quantite_commandee=detail_data['quantite_commandee'],
-                prix_unitaire=produit.prix_unitaire
-            )
-        
-        instance.refresh_from_db()  # Recharger l'instance depuis la DB
-        instance.calculer_montants()  # Recalculer les montants
-        instance.save()  # Sauvegarder les nouveaux montants
+            # Créer les nouveaux détails en bloc (montants recalculés une seule fois)
+            try:
+                instance.ajouter_details(details_data)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages)
         
         return instance
 
@@ -468,18 +573,12 @@ class AdminCommandeFranchiseMultiEntrepotSerializer(serializers.ModelSerializer)
     
     def get_entrepots_count(self, obj):
         """Retourne le nombre d'entrepôts utilisés"""
-        return obj.details.values('entrepot_livraison').distinct().count()
+        return len(obj.repartition_par_entrepot())
     
     def get_entrepots_utilises(self, obj):
         """Retourne la liste des entrepôts utilisés avec leurs détails"""
-        entrepots_ids = obj.details.values_list('entrepot_livraison', flat=True).distinct()
-        entrepots = Entrepot.objects.filter(id__in=entrepots_ids)
-        
         result = []
-        for entrepot in entrepots:
-            montant_entrepot = sum(
-                detail.sous_total for detail in obj.details.filter(entrepot_livraison=entrepot)
-            )
+        for entrepot, montant_entrepot in obj.repartition_par_entrepot().items():
             result.append({
                 'id': entrepot.id,
                 'nom_entrepot': entrepot.nom_entrepot,
@@ -504,6 +603,14 @@ class AdminCommandeFranchiseMultiEntrepotSerializer(serializers.ModelSerializer)
         return ""
 
 
+# 🎯 Traitement en lot des commandes (valider / préparer / livrer)
+class CommandesLotSerializer(serializers.Serializer):
+    """Liste des commandes à faire avancer en un seul traitement"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000
+    )
+
+
 # 🎯 Serializer pour récupérer les stocks multi-entrepôts (admin)
 class AdminStockMultiEntrepotSerializer(serializers.Serializer):
     """Serializer pour récupérer les stocks disponibles dans tous les entrepôts (admin)"""
@@ -573,6 +680,65 @@ class VenteFranchiseSerializer(serializers.ModelSerializer):
 
 
 
+class VenteImportLigneSerializer(serializers.Serializer):
+    """Une journée de ventes d'un fichier de caisse"""
+    franchise = serializers.IntegerField(required=False)
+    date_vente = serializers.DateField()
+    chiffre_affaires_jour = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    nombre_transactions = serializers.IntegerField(min_value=0, required=False, default=0)
+
+
+class VenteImportSerializer(serializers.Serializer):
+    """Import en masse des ventes quotidiennes (une ou plusieurs franchises)
+
+    La franchise passée dans le contexte (franchisé connecté) s'applique à toutes les lignes ;
+    sinon chaque ligne doit indiquer sa franchise. Les franchises sont vérifiées en une requête.
+    """
+    ventes = VenteImportLigneSerializer(many=True, allow_empty=False, max_length=5000)
+
+    def validate_ventes(self, lignes):
+        franchise = self.context.get('franchise')
+        erreurs = {}
+
+        if franchise:
+            for ligne in lignes:
+                ligne['franchise'] = franchise.id
+        else:
+            for numero, ligne in enumerate(lignes, start=1):
+                if not ligne.get('franchise'):
+                    erreurs[numero] = "La franchise est obligatoire."
+            demandees = {ligne['franchise'] for ligne in lignes if ligne.get('franchise')}
+            existantes = set(Franchise.objects.filter(id__in=demandees).values_list('id', flat=True))
+            for numero, ligne in enumerate(lignes, start=1):
+                if ligne.get('franchise') and ligne['franchise'] not in existantes:
+                    erreurs[numero] = f"Franchise {ligne['franchise']} introuvable."
+
+        vues = {}
+        for numero, ligne in enumerate(lignes, start=1):
+            cle = (ligne.get('franchise'), ligne['date_vente'])
+            if cle in vues:
+                erreurs.setdefault(numero, f"Même franchise et même date que la ligne {vues[cle]}.")
+            vues.setdefault(cle, numero)
+
+        if erreurs:
+            raise serializers.ValidationError(
+                [f"Ligne {numero} : {message}" for numero, message in sorted(erreurs.items())]
+            )
+        return lignes
+
+    def save(self):
+        ventes = [
+            VenteFranchise(
+                franchise_id=ligne['franchise'],
+                date_vente=ligne['date_vente'],
+                chiffre_affaires_jour=ligne['chiffre_affaires_jour'],
+                nombre_transactions=ligne['nombre_transactions'],
+            )
+            for ligne in self.validated_data['ventes']
+        ]
+        return VenteFranchise.importer(ventes)
+
+
 # Serializers simplifiés pour les listes/dropdown
 class FranchiseSimpleSerializer(serializers.ModelSerializer):
     """Franchise simplifié pour les selects"""
@@ -624,5 +790,4 @@ class RapportCommandeSerializer(serializers.ModelSerializer):
         return obj.details.count()
     
     def get_conforme_80_20(self, obj):
-        conforme, _ = obj.respecte_regle_80_20()
-        return conforme
\ No newline at end of file
+        return obj.conforme_80_20
\ No newline at end of file
@@ -0,0 +1,85 @@
+# signals.py - DRIV'N COOK : maintien des données dénormalisées
+from django.core.signals import request_finished, request_started
+from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalider
+from .models import (
+    AffectationEmplacement, Camion, CategorieProduit, CommandeFranchise, DetailCommande, Emplacement,
+    Entrepot, Franchise, Produit, StockEntrepot, TableauDeBord, VenteFranchise, fermer_connexion_sequences
+)
+
+
+@receiver([post_save, post_delete], sender=Camion)
+@receiver([post_save, post_delete], sender=CommandeFranchise)
+@receiver([post_save, post_delete], sender=VenteFranchise)
+def invalider_tableau_franchise(sender, instance, origin=None, **kwargs):
+    """Une écriture liée à une franchise périme son tableau de bord
+    
+    Le tableau global n'est pas marqué : rafraichir_tableaux_de_bord le recalcule à chaque passage.
+    """
+    if isinstance(origin, models.QuerySet) and origin.model is VenteFranchise:
+        # VenteFranchiseQuerySet.delete invalide une fois pour tout le lot
+        return
+    TableauDeBord.invalider(instance.franchise_id)
+
+
+@receiver(post_delete, sender=DetailCommande)
+def recalculer_commande_apres_suppression(sender, instance, origin=None, **kwargs):
+    """Remet à jour montants et conformité 80/20 quand une ligne est supprimée
+    
+    Rien à faire si la suppression vient d'un queryset de lignes (DetailCommandeQuerySet.delete
+    recalcule une fois par commande) ou des commandes elles-mêmes (cascade).
+    """
+    if isinstance(origin, (models.QuerySet, CommandeFranchise)):
+        return
+    commande = CommandeFranchise.objects.filter(pk=instance.commande_id).first()
+    if commande:
+        commande.enregistrer_montants()
+
+
+@receiver([post_save, post_delete], sender=AffectationEmplacement)
+def invalider_tableau_affectation(sender, instance, **kwargs):
+    franchise_id = Camion.objects.filter(pk=instance.camion_id).values_list('franchise_id', flat=True).first()
+    TableauDeBord.invalider(franchise_id)
+
+
+@receiver(m2m_changed, sender=Emplacement.franchises_autorisees.through)
+def invalider_tableau_emplacements(sender, instance, action, pk_set, **kwargs):
+    """Autorisations d'emplacements modifiées : franchises concernées à recalculer"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Franchise):
+        TableauDeBord.invalider(instance.pk)
+    elif pk_set:
+        TableauDeBord.objects.filter(franchise_id__in=pk_set).update(a_recalculer=True)
+    else:
+        # clear() depuis l'emplacement : les franchises retirées ne sont pas connues
+        TableauDeBord.invalider_tout()
+
+
+@receiver([post_save, post_delete], sender=Entrepot)
+def invalider_cache_entrepots(sender, instance, **kwargs):
+    invalider('entrepots')
+
+
+@receiver([post_save, post_delete], sender=Produit)
+def invalider_cache_produits(sender, instance, **kwargs):
+    invalider('produits')
+
+
+@receiver([post_save, post_delete], sender=CategorieProduit)
+def invalider_cache_categories(sender, instance, **kwargs):
+    invalider('categories')
+
+
+@receiver([post_save, post_delete], sender=StockEntrepot)
+def invalider_cache_stocks(sender, instance, **kwargs):
+    invalider('stocks')
+
+
+@receiver([request_started, request_finished])
+def fermer_connexion_sequences_perimee(sender, **kwargs):
+    """Connexion dédiée aux numéros de commande : même cycle de vie que celles de Django"""
+    fermer_connexion_sequences(seulement_perimee=True)
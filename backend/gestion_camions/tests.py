@@ -1,3 +1,1676 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import BytesIO
+from importlib import import_module
+from time import monotonic
+from unittest import mock, skipUnless
+from urllib.parse import unquote
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Count, F, Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.pagination import PaginateurEstime, VentePagination, compter
+
+from .cache import reponse_en_cache
+from .models import (
+    AffectationEmplacement, AutorisationEmplacement, Camion, CategorieProduit, CommandeFranchise, CumulVentes,
+    DetailCommande, Emplacement, Entrepot, Franchise, MaintenanceCamion, Produit, SequenceCommande, StockEntrepot,
+    TableauDeBord, TacheRapportPDF, VenteFranchise, connexion_sequences, debut_periode, fermer_connexion_sequences,
+    periode_suivante
+)
+from .planification import proposer_planning
+from .rapports import _executer_en_fond, ecrire_rapports, nettoyer_rapports, nom_fichier_rapport
+from .serializers import AdminCommandeFranchiseMultiEntrepotSerializer
+
+User = get_user_model()
+
+
+class IndexRequetesTests(TestCase):
+    """Les requêtes des vues de liste passent par les index déclarés dans Meta.indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('franchise', 'franchise@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.franchise = Franchise.objects.create(user=user, nom_franchise='F1', date_signature=date(2024, 1, 1))
+        cls.entrepot = Entrepot.objects.create(nom_entrepot='E1', adresse='a', ville='Paris', code_postal='75000')
+        cls.emplacement = Emplacement.objects.create(
+            nom_emplacement='Place', adresse='a', ville='Paris', type_zone='centre_ville'
+        )
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tables de test minuscules : forcer le planificateur à considérer les index
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUtiliseIndex(self, queryset, nom_index):
+        plan = queryset.explain()
+        self.assertIn(nom_index, plan, f"Index {nom_index} non utilisé :\n{plan}")
+
+    def test_commandes_par_franchise(self):
+        self.assertUtiliseIndex(
+            CommandeFranchise.objects.filter(franchise=self.franchise).order_by('-date_commande'),
+            'commande_franchise_date_idx'
+        )
+
+    def test_commandes_par_statut(self):
+        self.assertUtiliseIndex(
+            CommandeFranchise.objects.filter(statut='en_attente').order_by('-date_commande'),
+            'commande_statut_date_idx'
+        )
+
+    @skipUnless(
+        connection.vendor == 'postgresql',
+        "SQLite n'utilise un index partiel que si la requête contient des littéraux, pas des paramètres"
+    )
+    def test_affectations_actives(self):
+        self.assertUtiliseIndex(
+            AffectationEmplacement.objects.filter(
+                emplacement=self.emplacement,
+                date_debut=date(2025, 1, 1),
+                statut__in=['programme', 'en_cours']
+            ),
+            'affectation_active_idx'
+        )
+
+    def test_ventes_par_periode(self):
+        self.assertUtiliseIndex(
+            VenteFranchise.objects.filter(date_vente__gte=date(2025, 1, 1)).order_by('-date_vente'),
+            'vente_date_idx'
+        )
+
+    def test_stocks_disponibles_par_entrepot(self):
+        self.assertUtiliseIndex(
+            StockEntrepot.objects.filter(entrepot=self.entrepot, quantite_disponible__gt=0),
+            'stock_entrepot_qte_idx'
+        )
+
+    def test_franchises_par_statut(self):
+        self.assertUtiliseIndex(Franchise.objects.filter(statut='paye'), 'franchise_statut_idx')
+
+    def test_franchise_par_session_stripe(self):
+        self.assertUtiliseIndex(
+            Franchise.objects.filter(stripe_checkout_session_id='cs_test_123'),
+            'franchise_stripe_session_idx'
+        )
+
+
+class SerializerCommandesAdminTests(TestCase):
+    """La sérialisation d'une liste de commandes coûte un nombre fixe de requêtes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('franchise', 'franchise@drivncook.fr', 'pw', first_name='A', last_name='B')
+        franchise = Franchise.objects.create(user=user, nom_franchise='F1', date_signature=date(2024, 1, 1))
+        categorie = CategorieProduit.objects.create(nom_categorie='Épicerie')
+        entrepots = [
+            Entrepot.objects.create(nom_entrepot='Ivry', adresse='a', ville='Ivry', code_postal='94200'),
+            Entrepot.objects.create(
+                nom_entrepot='Marché', adresse='a', ville='Paris', code_postal='75000',
+                type_entrepot='fournisseur_libre'
+            ),
+        ]
+        produits = [
+            Produit.objects.create(
+                nom_produit=f'P{i}', categorie=categorie, prix_unitaire=Decimal('10.00'), unite='kg'
+            )
+            for i in range(3)
+        ]
+        for produit in produits:
+            for entrepot in entrepots:
+                StockEntrepot.objects.create(produit=produit, entrepot=entrepot, quantite_disponible=100)
+
+        for _ in range(5):
+            commande = CommandeFranchise.objects.create(franchise=franchise, adresse_livraison='1 rue de Paris')
+            commande.ajouter_details([
+                {'produit': produit.id, 'entrepot_livraison': entrepot.id, 'quantite_commandee': 2}
+                for produit in produits for entrepot in entrepots
+            ])
+
+    def serialiser(self, queryset):
+        return AdminCommandeFranchiseMultiEntrepotSerializer(queryset, many=True).data
+
+    def test_nombre_de_requetes_constant(self):
+        # Commandes (franchise jointe) + lignes (produit, entrepôt et stock joints)
+        with self.assertNumQueries(2):
+            data = self.serialiser(CommandeFranchise.objects.avec_details_complets())
+        self.assertEqual(len(data), 5)
+        with self.assertNumQueries(2):
+            self.serialiser(CommandeFranchise.objects.avec_details_complets()[:1])
+
+    def test_repartition_par_entrepot(self):
+        commande = self.serialiser(CommandeFranchise.objects.avec_details_complets())[0]
+        self.assertEqual(commande['entrepots_count'], 2)
+        self.assertEqual(
+            [(e['nom_entrepot'], e['montant_commande']) for e in commande['entrepots_utilises']],
+            [('Ivry', 60.0), ('Marché', 60.0)]
+        )
+        self.assertEqual({d['stock_disponible'] for d in commande['details']}, {100})
+        self.assertTrue(commande['respecte_regle_80_20_result']['message'].startswith('❌'))
+
+    def test_resultat_identique_sans_prechargement(self):
+        self.assertEqual(
+            self.serialiser(CommandeFranchise.objects.order_by('pk')),
+            self.serialiser(CommandeFranchise.objects.avec_details_complets().order_by('pk'))
+        )
+
+
+class CacheReferenceTests(TestCase):
+    """Listes de référence servies depuis le cache, invalidées par les écritures"""
+    url = '/api/entrepots/disponibles/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.entrepot = Entrepot.objects.create(nom_entrepot='Ivry', adresse='a', ville='Ivry', code_postal='94200')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def verifier_cache(self):
+        premiere = self.client.get(self.url)
+        self.assertEqual(premiere.status_code, 200)
+        self.assertIn('Last-Modified', premiere)
+
+        with self.assertNumQueries(0):
+            seconde = self.client.get(self.url)
+        self.assertEqual(seconde.data, premiere.data)
+        self.assertEqual(seconde['ETag'], premiere['ETag'])
+
+        non_modifiee = self.client.get(self.url, HTTP_IF_NONE_MATCH=premiere['ETag'])
+        self.assertEqual(non_modifiee.status_code, 304)
+
+        self.entrepot.nom_entrepot = 'Ivry-sur-Seine'
+        self.entrepot.save()
+        apres_modification = self.client.get(self.url, HTTP_IF_NONE_MATCH=premiere['ETag'])
+        self.assertEqual(apres_modification.status_code, 200)
+        self.assertEqual(apres_modification.data[0]['nom_entrepot'], 'Ivry-sur-Seine')
+
+    def test_cache_memoire_locale(self):
+        self.verifier_cache()
+
+    def test_portee_de_la_cle(self):
+        franchises = []
+        for nom in ('F1', 'F2'):
+            user = User.objects.create_user(nom, f'{nom}@drivncook.fr', 'pw', first_name=nom, last_name='X')
+            franchises.append(Franchise.objects.create(user=user, nom_franchise=nom, date_signature=date(2024, 1, 1)))
+        etag_admin = self.client.get(self.url)['ETag']
+
+        # Admin et franchisé ne partagent pas l'entrée ; deux franchisés, si (liste indépendante du compte)
+        client = APIClient()
+        client.force_authenticate(franchises[0].user)
+        with CaptureQueriesContext(connection) as capture:
+            reponse = client.get(self.url)
+        self.assertNotEqual(reponse['ETag'], etag_admin)
+        self.assertTrue(capture.captured_queries)
+        client.force_authenticate(franchises[1].user)
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(self.url)['ETag'], reponse['ETag'])
+
+        reponse = client.get('/api_user/entrepots/')
+        self.assertEqual((reponse.status_code, reponse.data[0]['nom_entrepot']), (200, 'Ivry'))
+
+        # Réponse propre à chaque compte : une entrée par utilisateur
+        construire = mock.Mock(return_value=[])
+        for franchise in (franchises[0], franchises[0], franchises[1]):
+            requete = RequestFactory().get('/api_user/exemple/')
+            requete.user = franchise.user
+            reponse_en_cache(requete, ['entrepots'], construire, par_utilisateur=True)
+        self.assertEqual(construire.call_count, 2)
+
+    def test_cache_fichiers(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': dossier,
+            }}):
+                self.verifier_cache()
+
+
+class ChevauchementAffectationsTests(TestCase):
+    """Recouvrements de périodes et de créneaux entre affectations"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('franchise', 'franchise@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.franchise = Franchise.objects.create(user=user, nom_franchise='F1', date_signature=date(2024, 1, 1))
+        cls.camions = [
+            Camion.objects.create(numero_camion=f'C{i}', immatriculation=f'AA-00{i}-AA', franchise=cls.franchise)
+            for i in range(3)
+        ]
+        cls.emplacements = [
+            Emplacement.objects.create(nom_emplacement=f'Place {i}', adresse='a', ville='Paris', type_zone='centre_ville')
+            for i in range(2)
+        ]
+        for emplacement in cls.emplacements:
+            emplacement.franchises_autorisees.add(cls.franchise)
+        AffectationEmplacement.objects.create(
+            camion=cls.camions[0], emplacement=cls.emplacements[0],
+            date_debut=date(2025, 6, 2), date_fin=date(2025, 6, 6),
+            horaire_debut=time(11), horaire_fin=time(15)
+        )
+
+    def affectation(self, camion=1, emplacement=0, **periode):
+        return AffectationEmplacement(camion=self.camions[camion], emplacement=self.emplacements[emplacement], **periode)
+
+    def test_periode_sur_plusieurs_jours(self):
+        with self.assertRaisesMessage(ValidationError, 'est déjà occupé du 2025-06-02 au 2025-06-06'):
+            self.affectation(date_debut=date(2025, 6, 5)).save()
+        self.affectation(date_debut=date(2025, 6, 7)).save()
+
+    def test_creneaux_horaires(self):
+        self.affectation(date_debut=date(2025, 6, 3), horaire_debut=time(15), horaire_fin=time(18)).save()
+        with self.assertRaises(ValidationError):
+            self.affectation(camion=2, date_debut=date(2025, 6, 4), horaire_debut=time(14, 30)).save()
+
+    def test_camion_deja_affecte(self):
+        with self.assertRaisesMessage(ValidationError, 'le camion C0 est déjà affecté'):
+            self.affectation(camion=0, emplacement=1, date_debut=date(2025, 6, 1), date_fin=date(2025, 6, 2)).save()
+
+    def test_affectation_annulee_ignoree(self):
+        self.affectation(date_debut=date(2025, 6, 4), statut='annule').save()
+
+    def test_planning_en_lot(self):
+        planning = [
+            self.affectation(camion=1, date_debut=date(2025, 6, 9), date_fin=date(2025, 6, 13)),
+            self.affectation(camion=2, date_debut=date(2025, 6, 12)),
+            self.affectation(camion=2, emplacement=1, date_debut=date(2025, 6, 2)),
+            self.affectation(camion=1, emplacement=1, date_debut=date(2025, 6, 6), horaire_debut=time(16)),
+            self.affectation(camion=2, emplacement=1, date_debut=date(2025, 6, 6), date_fin=date(2025, 6, 5)),
+        ]
+        with self.assertNumQueries(2):
+            erreurs = AffectationEmplacement.verifier_planning(planning)
+        self.assertEqual(sorted(erreurs), [1, 4])
+        self.assertIn('par le camion C1', erreurs[1])
+
+        with self.assertRaises(ValidationError):
+            AffectationEmplacement.planifier(planning)
+        self.assertEqual(AffectationEmplacement.objects.count(), 1)
+        self.assertEqual(len(AffectationEmplacement.planifier(planning[:1] + planning[2:4])), 3)
+
+    def test_calendrier_occupation(self):
+        ids = [emplacement.id for emplacement in self.emplacements]
+        with self.assertNumQueries(1):
+            calendrier = Emplacement.calendrier_occupation(ids, date(2025, 6, 1), date(2025, 6, 30))
+        self.assertEqual(len(calendrier[ids[0]]), 30)
+        self.assertEqual([jour for jour, occupation in enumerate(calendrier[ids[0]], start=1) if occupation], [2, 3, 4, 5, 6])
+        self.assertFalse(any(calendrier[ids[1]]))
+
+    def test_planificateur(self):
+        with self.assertNumQueries(3):
+            affectations, sans_emplacement = proposer_planning(self.camions, date(2025, 6, 1), date(2025, 6, 7))
+        self.assertEqual(AffectationEmplacement.verifier_planning(affectations), {})
+        # Deux emplacements, le premier occupé du 2 au 6 : 2 + 5 × 1 + 2 journées placées
+        self.assertEqual(sum((a.date_fin_effective - a.date_debut).days + 1 for a in affectations), 9)
+        self.assertEqual(len(sans_emplacement), 3 * 7 - 9 - 5)
+        # Le camion qui reste sur place garde une seule affectation sur toute la période
+        self.assertIn((date(2025, 6, 1), date(2025, 6, 7)), [(a.date_debut, a.date_fin) for a in affectations])
+
+    def test_migration_annule_recouvrements_existants(self):
+        migration = import_module('gestion_camions.migrations.0014_affectation_sans_chevauchement')
+        # Lignes antérieures au contrôle complet : insérées sans passer par save()
+        AffectationEmplacement.objects.bulk_create([
+            self.affectation(camion=1, date_debut=date(2025, 6, 4)),
+            self.affectation(camion=1, emplacement=1, date_debut=date(2025, 6, 20), horaire_fin=time(12)),
+            self.affectation(camion=2, emplacement=1, date_debut=date(2025, 6, 20), horaire_debut=time(12)),
+            self.affectation(camion=2, emplacement=1, date_debut=date(2025, 6, 20), date_fin=date(2025, 6, 19)),
+        ])
+        migration.annuler_conflits(django_apps, connection.schema_editor())
+        annulees = AffectationEmplacement.objects.filter(statut='annule').order_by('pk')
+        self.assertEqual(
+            [(a.camion_id, a.date_debut, a.date_fin) for a in annulees],
+            [(self.camions[1].id, date(2025, 6, 4), None), (self.camions[2].id, date(2025, 6, 20), date(2025, 6, 19))]
+        )
+
+    def test_planificateur_conflit_concurrent(self):
+        admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        client = APIClient()
+        client.force_authenticate(admin)
+        erreur = IntegrityError('conflicting key value violates exclusion constraint "affectation_camion_sans_chevauchement"')
+        with mock.patch.object(AffectationEmplacement.objects, 'bulk_create', side_effect=erreur):
+            reponse = client.post('/api/affectations/planificateur/', {
+                'camions': [self.camions[1].id], 'date_debut': '2025-06-09', 'date_fin': '2025-06-09',
+                'enregistrer': True,
+            }, format='json')
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(reponse.data['conflits'][0]['message'], AffectationEmplacement.MESSAGE_CONFLIT_CONCURRENT)
+        self.assertEqual(AffectationEmplacement.objects.count(), 1)
+
+    def test_avancer_statuts(self):
+        AffectationEmplacement.objects.create(
+            camion=self.camions[1], emplacement=self.emplacements[1], date_debut=date(2025, 6, 6)
+        )
+        self.assertEqual(AffectationEmplacement.avancer_statuts(date(2025, 6, 6)), {'termine': 0, 'en_cours': 2})
+        self.assertEqual(AffectationEmplacement.avancer_statuts(date(2025, 6, 7)), {'termine': 2, 'en_cours': 0})
+        self.assertFalse(AffectationEmplacement.objects.filter(statut__in=AffectationEmplacement.STATUTS_ACTIFS).exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ChangelistAdminTests(TestCase):
+    """Le nombre de requêtes d'une liste de l'admin ne dépend pas du nombre de lignes affichées"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.jeux = 0
+        cls.creer_jeu()
+
+    @classmethod
+    def creer_jeu(cls):
+        """Une franchise avec camion, emplacement, commande multi-entrepôts, vente..."""
+        cls.jeux += 1
+        n = cls.jeux
+        jour = date(2025, 1, 1) + timedelta(days=n)
+        user = User.objects.create_user(f'franchise{n}', f'franchise{n}@drivncook.fr', 'pw', first_name='A', last_name='B')
+        franchise = Franchise.objects.create(user=user, nom_franchise=f'F{n}', date_signature=date(2024, 1, 1))
+        categorie = CategorieProduit.objects.create(nom_categorie=f'Catégorie {n}')
+        entrepots = [
+            Entrepot.objects.create(nom_entrepot=f'Ivry {n}', adresse='a', ville='Ivry', code_postal='94200'),
+            Entrepot.objects.create(
+                nom_entrepot=f'Marché {n}', adresse='a', ville='Paris', code_postal='75000',
+                type_entrepot='fournisseur_libre'
+            ),
+        ]
+        produit = Produit.objects.create(
+            nom_produit=f'P{n}', categorie=categorie, prix_unitaire=Decimal('10.00'), unite='kg'
+        )
+        for entrepot in entrepots:
+            StockEntrepot.objects.create(produit=produit, entrepot=entrepot, quantite_disponible=100)
+        emplacement = Emplacement.objects.create(
+            nom_emplacement=f'Place {n}', adresse='a', ville='Paris', type_zone='centre_ville'
+        )
+        emplacement.franchises_autorisees.add(franchise)
+        AutorisationEmplacement.objects.create(franchise=franchise, emplacement=emplacement)
+        camion = Camion.objects.create(numero_camion=f'C{n}', immatriculation=f'AA-{n:03}-AA', franchise=franchise)
+        MaintenanceCamion.objects.create(
+            camion=camion, type_maintenance='revision', description='Vidange', date_maintenance=jour
+        )
+        AffectationEmplacement.objects.create(camion=camion, emplacement=emplacement, date_debut=jour)
+        for quantites in ([9, 1], [5, 5]):
+            commande = CommandeFranchise.objects.create(franchise=franchise, adresse_livraison='1 rue de Paris')
+            commande.ajouter_details([
+                {'produit': produit.id, 'entrepot_livraison': entrepot.id, 'quantite_commandee': quantite}
+                for entrepot, quantite in zip(entrepots, quantites)
+            ])
+        VenteFranchise.objects.create(
+            franchise=franchise, date_vente=jour, chiffre_affaires_jour=Decimal('100.00')
+        )
+
+    def requetes_changelist(self, modele):
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(reverse(f'admin:gestion_camions_{modele}_changelist'))
+        self.assertEqual(reponse.status_code, 200)
+        return len(requetes)
+
+    def verifier(self, modele):
+        self.client.force_login(self.admin)
+        avant = self.requetes_changelist(modele)
+        self.creer_jeu()
+        self.creer_jeu()
+        self.assertEqual(self.requetes_changelist(modele), avant)
+
+    def test_entrepots(self):
+        self.verifier('entrepot')
+
+    def test_franchises(self):
+        self.verifier('franchise')
+
+    def test_emplacements(self):
+        self.verifier('emplacement')
+
+    def test_camions(self):
+        self.verifier('camion')
+
+    def test_maintenances(self):
+        self.verifier('maintenancecamion')
+
+    def test_affectations(self):
+        self.verifier('affectationemplacement')
+
+    def test_categories(self):
+        self.verifier('categorieproduit')
+
+    def test_produits(self):
+        self.verifier('produit')
+
+    def test_stocks(self):
+        self.verifier('stockentrepot')
+
+    def test_commandes(self):
+        self.verifier('commandefranchise')
+
+    def test_details_commandes(self):
+        self.verifier('detailcommande')
+
+    def test_ventes(self):
+        self.verifier('ventefranchise')
+
+    def test_autorisations(self):
+        self.verifier('autorisationemplacement')
+
+    def verifier_formulaire(self, modele):
+        """Le formulaire de modification ne liste plus le catalogue : taille et requêtes constantes"""
+        self.client.force_login(self.admin)
+        url = reverse(
+            f'admin:gestion_camions_{modele._meta.model_name}_change',
+            args=[modele.objects.order_by('pk').first().pk]
+        )
+        self.client.get(url)  # caches (types de contenu...) remplis par la première requête
+        with CaptureQueriesContext(connection) as requetes:
+            avant = self.client.get(url)
+        self.assertEqual(avant.status_code, 200)
+        self.creer_jeu()
+        self.creer_jeu()
+        with self.assertNumQueries(len(requetes)):
+            apres = self.client.get(url)
+        self.assertEqual(len(apres.content), len(avant.content))
+
+    def test_formulaires_autocompletion(self):
+        for modele in (
+            CommandeFranchise, DetailCommande, AffectationEmplacement, MaintenanceCamion,
+            StockEntrepot, VenteFranchise, Emplacement, Camion, AutorisationEmplacement, Franchise
+        ):
+            with self.subTest(modele=modele.__name__):
+                self.verifier_formulaire(modele)
+
+    def test_recherche_autocompletion_par_prefixe(self):
+        user = User.objects.create_user('zoe', 'zoe@drivncook.fr', 'pw', first_name='Zoé', last_name='Martin')
+        Franchise.objects.create(user=user, nom_franchise='Zébulon Burgers', date_signature=date(2024, 1, 1))
+        self.client.force_login(self.admin)
+
+        def rechercher(terme):
+            reponse = self.client.get(reverse('admin:autocomplete'), {
+                'app_label': 'gestion_camions', 'model_name': 'camion', 'field_name': 'franchise', 'term': terme,
+            })
+            self.assertEqual(reponse.status_code, 200)
+            return [resultat['text'] for resultat in reponse.json()['results']]
+
+        self.assertEqual(rechercher('zébu'), ['Zébulon Burgers - Zoé Martin'])
+        # Préfixe du nom de franchise seulement : pas de icontains sur le nom ni sur le franchisé
+        self.assertEqual(rechercher('burgers'), [])
+        self.assertEqual(rechercher('martin'), [])
+
+
+class ComptageEstimeTests(TestCase):
+    """Total exact sous le seuil, estimation du planificateur au-dessus"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.franchise = Franchise.objects.create(user=cls.admin, nom_franchise='F1', date_signature=date(2024, 1, 1))
+        for jour in range(1, 6):
+            VenteFranchise.objects.create(
+                franchise=cls.franchise, date_vente=date(2025, 1, jour), chiffre_affaires_jour=Decimal('100.00')
+            )
+
+    def test_sans_estimation_comptage_exact(self):
+        with mock.patch('backend.pagination.estimer_nombre', return_value=None):
+            self.assertEqual(compter(VenteFranchise.objects.all(), seuil=2), (5, False))
+
+    def test_estimation_au_dessus_du_seuil(self):
+        with mock.patch('backend.pagination.estimer_nombre', return_value=50000):
+            self.assertEqual(compter(VenteFranchise.objects.all(), seuil=2), (50000, True))
+            # Estimation trop haute sur une petite sélection : le COUNT borné la corrige
+            self.assertEqual(compter(VenteFranchise.objects.all(), seuil=10), (5, False))
+
+    def test_paginateur_admin(self):
+        with mock.patch('backend.pagination.estimer_nombre', return_value=50000):
+            paginateur = PaginateurEstime(VenteFranchise.objects.order_by('id'), 2)
+            paginateur.seuil = 2
+            self.assertEqual(paginateur.count, 50000)
+            self.assertTrue(paginateur.estime)
+            self.assertEqual(len(paginateur.page(1)), 2)
+
+    def test_total_api(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        reponse = client.get('/api/ventes/', {'page_size': 2, 'total': 1})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(len(reponse.data['results']), 2)
+        self.assertEqual((reponse.data['total'], reponse.data['total_estime']), (5, False))
+        self.assertNotIn('total', client.get('/api/ventes/', {'page_size': 2}).data)
+
+
+class CommandesEnLotTests(TestCase):
+    """Validation (unitaire ou en lot), préparation et livraison des commandes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.franchise = Franchise.objects.create(user=cls.admin, nom_franchise='F1', date_signature=date(2024, 1, 1))
+        categorie = CategorieProduit.objects.create(nom_categorie='Frais')
+        cls.produit = Produit.objects.create(
+            nom_produit='Steak', categorie=categorie, prix_unitaire=Decimal('10.00'), unite='kg'
+        )
+        cls.ivry = Entrepot.objects.create(nom_entrepot='Ivry', adresse='a', ville='Ivry', code_postal='94200')
+        cls.marche = Entrepot.objects.create(
+            nom_entrepot='Marché', adresse='a', ville='Paris', code_postal='75000', type_entrepot='fournisseur_libre'
+        )
+        for entrepot in (cls.ivry, cls.marche):
+            StockEntrepot.objects.create(produit=cls.produit, entrepot=entrepot, quantite_disponible=100)
+
+    def setUp(self):
+        # Les validations invalident le cache des stocks, partagé entre les tests
+        cache.clear()
+
+    def commande(self, **quantites):
+        commande = CommandeFranchise.objects.create(franchise=self.franchise, adresse_livraison='1 rue de Paris')
+        commande.ajouter_details([
+            {'produit': self.produit.id, 'entrepot_livraison': getattr(self, nom).id, 'quantite_commandee': quantite}
+            for nom, quantite in quantites.items()
+        ])
+        return commande
+
+    def stock(self, entrepot):
+        return StockEntrepot.objects.get(produit=self.produit, entrepot=entrepot)
+
+    def test_validation_en_lot(self):
+        premiere = self.commande(ivry=60)
+        sans_stock = self.commande(ivry=50)
+        non_conforme = self.commande(ivry=10, marche=50)
+        deja_validee = self.commande(ivry=1)
+        CommandeFranchise.objects.filter(pk=deja_validee.pk).update(statut='validee')
+
+        resultats = CommandeFranchise.valider_en_lot(
+            [premiere.pk, sans_stock.pk, non_conforme.pk, deja_validee.pk, 999999]
+        )
+        self.assertEqual([r['succes'] for r in resultats], [True, False, False, False, False])
+        self.assertEqual(
+            [r.get('error') for r in resultats[1:]],
+            ['Stocks insuffisants', 'Règle 80/20 non respectée',
+             'Seules les commandes en attente peuvent être validées', 'Commande introuvable']
+        )
+        self.assertEqual(resultats[1]['details'][0]['disponible'], 40)
+        self.assertEqual(
+            dict(CommandeFranchise.objects.values_list('pk', 'statut')),
+            {premiere.pk: 'validee', sans_stock.pk: 'en_attente', non_conforme.pk: 'en_attente', deja_validee.pk: 'validee'}
+        )
+        stock = self.stock(self.ivry)
+        self.assertEqual((stock.quantite_disponible, stock.quantite_reservee), (40, 60))
+
+    def valider(self, commande, client=None):
+        if client is None:
+            client = APIClient()
+            client.force_authenticate(self.admin)
+        return client.post(f'/api/commandes/{commande.pk}/valider/')
+
+    def test_validation_unitaire_reserve_une_seule_fois(self):
+        commande = self.commande(ivry=60)
+        self.assertEqual(self.valider(commande).status_code, 200)
+        reponse = self.valider(commande)
+        self.assertEqual(reponse.status_code, 400)
+        stock = self.stock(self.ivry)
+        self.assertEqual((stock.quantite_disponible, stock.quantite_reservee), (40, 60))
+
+    def test_validation_unitaire_stock_insuffisant(self):
+        premiere, seconde = self.commande(ivry=60), self.commande(ivry=50)
+        self.valider(premiere)
+        reponse = self.valider(seconde)
+        self.assertEqual((reponse.status_code, reponse.data['error']), (400, 'Stocks insuffisants'))
+        self.assertEqual(reponse.data['details'][0]['disponible'], 40)
+        seconde.refresh_from_db()
+        self.assertEqual(seconde.statut, 'en_attente')
+        self.assertEqual(self.stock(self.ivry).quantite_reservee, 60)
+
+    def test_validation_unitaire_ligne_de_stock_supprimee(self):
+        autre = Produit.objects.create(
+            nom_produit='Salade', categorie=self.produit.categorie, prix_unitaire=Decimal('2.00'), unite='kg'
+        )
+        StockEntrepot.objects.create(produit=autre, entrepot=self.ivry, quantite_disponible=10)
+        commande = self.commande(ivry=5)
+        commande.ajouter_details([{'produit': autre.id, 'entrepot_livraison': self.ivry.id, 'quantite_commandee': 0}])
+        vide = CommandeFranchise.objects.create(franchise=self.franchise, adresse_livraison='1 rue de Paris')
+        vide.ajouter_details([{'produit': autre.id, 'entrepot_livraison': self.ivry.id, 'quantite_commandee': 3}])
+        StockEntrepot.objects.filter(produit=autre).delete()
+
+        # Stock absent : disponible 0 (400), et une quantité nulle ne réserve rien
+        reponse = self.valider(vide)
+        self.assertEqual((reponse.status_code, reponse.data['details'][0]['disponible']), (400, 0))
+        self.assertEqual(self.valider(commande).status_code, 200)
+        self.assertEqual(self.stock(self.ivry).quantite_reservee, 5)
+        resultat, = CommandeFranchise.valider_en_lot([vide.pk])
+        self.assertEqual(resultat['error'], 'Stocks insuffisants')
+
+    def test_validation_unitaire_annulee_en_cas_d_erreur(self):
+        commande = self.commande(ivry=60)
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(self.admin)
+        with mock.patch.object(StockEntrepot.objects, 'bulk_update', side_effect=RuntimeError):
+            self.assertEqual(self.valider(commande, client).status_code, 500)
+        commande.refresh_from_db()
+        self.assertEqual(commande.statut, 'en_attente')
+        stock = self.stock(self.ivry)
+        self.assertEqual((stock.quantite_disponible, stock.quantite_reservee), (100, 0))
+
+    def test_requetes_constantes(self):
+        def requetes(nombre):
+            ids = [self.commande(ivry=1).pk for _ in range(nombre)]
+            with CaptureQueriesContext(connection) as capture:
+                for traitement in (
+                    CommandeFranchise.valider_en_lot, CommandeFranchise.preparer_en_lot, CommandeFranchise.livrer_en_lot
+                ):
+                    self.assertTrue(all(r['succes'] for r in traitement(ids)))
+            return len(capture)
+
+        self.assertEqual(requetes(2), requetes(10))
+        stock = self.stock(self.ivry)
+        self.assertEqual((stock.quantite_disponible, stock.quantite_reservee), (88, 0))
+
+    def test_cycle_complet_api(self):
+        commandes = [self.commande(ivry=30), self.commande(ivry=20)]
+        ids = [commande.pk for commande in commandes]
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        reponse = client.post('/api/commandes/valider/', {'ids': ids}, format='json')
+        self.assertEqual((reponse.status_code, reponse.data['traitees']), (200, 2))
+        reponse = client.post('/api/commandes/livrer/', {'ids': ids}, format='json')
+        self.assertEqual((reponse.data['traitees'], reponse.data['echecs']), (0, 2))
+        client.post('/api/commandes/preparer/', {'ids': ids}, format='json')
+
+        # Réservation déjà partiellement libérée à la main : jamais négative
+        StockEntrepot.objects.filter(produit=self.produit, entrepot=self.ivry).update(quantite_reservee=10)
+        reponse = client.post('/api/commandes/livrer/', {'ids': ids}, format='json')
+        self.assertEqual(reponse.data['traitees'], 2)
+        self.assertEqual(self.stock(self.ivry).quantite_reservee, 0)
+        self.assertEqual(set(CommandeFranchise.objects.values_list('statut', flat=True)), {'livree'})
+
+        self.assertEqual(client.post('/api/commandes/valider/', {'ids': []}, format='json').status_code, 400)
+
+    def test_livraison_unitaire_requetes_constantes(self):
+        produits = [self.produit] + [
+            Produit.objects.create(
+                nom_produit=f'Produit {n}', categorie=self.produit.categorie, prix_unitaire=Decimal('1.00'), unite='kg'
+            )
+            for n in range(4)
+        ]
+        for produit in produits[1:]:
+            StockEntrepot.objects.create(produit=produit, entrepot=self.ivry, quantite_disponible=100)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        def livrer(nombre_lignes):
+            commande = CommandeFranchise.objects.create(franchise=self.franchise, adresse_livraison='1 rue de Paris')
+            commande.ajouter_details([
+                {'produit': produit.id, 'entrepot_livraison': self.ivry.id, 'quantite_commandee': 2}
+                for produit in produits[:nombre_lignes]
+            ])
+            CommandeFranchise.valider_en_lot([commande.pk])
+            CommandeFranchise.preparer_en_lot([commande.pk])
+            with CaptureQueriesContext(connection) as capture:
+                reponse = client.post(f'/api/commandes/{commande.pk}/livrer/')
+            self.assertEqual(reponse.status_code, 200)
+            return len(capture)
+
+        self.assertEqual(livrer(1), livrer(5))
+        self.assertEqual(
+            set(StockEntrepot.objects.filter(entrepot=self.ivry).values_list('quantite_reservee', flat=True)), {0}
+        )
+        self.assertEqual(client.post('/api/commandes/999999/livrer/').status_code, 404)
+        deja_livree = CommandeFranchise.objects.filter(statut='livree').first()
+        self.assertEqual(client.post(f'/api/commandes/{deja_livree.pk}/livrer/').status_code, 400)
+
+
+class LignesCommandeTests(TestCase):
+    """Montants et conformité 80/20 maintenus à l'ajout et à la suppression des lignes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('f1', 'f1@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.franchise = Franchise.objects.create(user=user, nom_franchise='F1', date_signature=date(2024, 1, 1))
+        categorie = CategorieProduit.objects.create(nom_categorie='Frais')
+        cls.produits = [
+            Produit.objects.create(
+                nom_produit=f'Produit {n}', categorie=categorie, prix_unitaire=Decimal('10.00'), unite='kg'
+            )
+            for n in range(5)
+        ]
+        cls.ivry = Entrepot.objects.create(nom_entrepot='Ivry', adresse='a', ville='Ivry', code_postal='94200')
+        cls.marche = Entrepot.objects.create(
+            nom_entrepot='Marché', adresse='a', ville='Paris', code_postal='75000', type_entrepot='fournisseur_libre'
+        )
+        for produit in cls.produits:
+            for entrepot in (cls.ivry, cls.marche):
+                StockEntrepot.objects.create(produit=produit, entrepot=entrepot, quantite_disponible=100)
+
+    def commande(self, lignes):
+        commande = CommandeFranchise.objects.create(franchise=self.franchise, adresse_livraison='1 rue de Paris')
+        commande.ajouter_details([
+            {'produit': produit.id, 'entrepot_livraison': entrepot.id, 'quantite_commandee': quantite}
+            for produit, entrepot, quantite in lignes
+        ])
+        commande.refresh_from_db()
+        return commande
+
+    @staticmethod
+    def mises_a_jour_commande(capture):
+        return [
+            requete for requete in capture.captured_queries
+            if requete['sql'].startswith('UPDATE "gestion_camions_commandefranchise"')
+        ]
+
+    def test_ajout_en_bloc_un_seul_recalcul(self):
+        commande = CommandeFranchise.objects.create(franchise=self.franchise, adresse_livraison='1 rue de Paris')
+        with CaptureQueriesContext(connection) as capture:
+            commande.ajouter_details([
+                {'produit': produit.id, 'entrepot_livraison': self.ivry.id, 'quantite_commandee': 9}
+                for produit in self.produits
+            ] + [{'produit': self.produits[0].id, 'entrepot_livraison': self.marche.id, 'quantite_commandee': 5}])
+        inserts = [r for r in capture.captured_queries if r['sql'].startswith('INSERT INTO "gestion_camions_detailcommande"')]
+        self.assertEqual((len(inserts), len(self.mises_a_jour_commande(capture))), (1, 1))
+
+        commande.refresh_from_db()
+        self.assertEqual(commande.details.count(), 6)
+        self.assertEqual(
+            (commande.montant_total, commande.montant_drivn_cook, commande.montant_fournisseur_libre),
+            (Decimal('500.00'), Decimal('450.00'), Decimal('50.00'))
+        )
+        self.assertTrue(commande.conforme_80_20)
+
+    def test_suppression_par_queryset(self):
+        premiere = self.commande([(produit, self.ivry, 2) for produit in self.produits[:3]] + [
+            (self.produits[0], self.marche, 10), (self.produits[1], self.marche, 10)
+        ])
+        seconde = self.commande([(self.produits[0], self.ivry, 1), (self.produits[0], self.marche, 5)])
+        self.assertEqual((premiere.conforme_80_20, seconde.conforme_80_20), (False, False))
+
+        # Un seul recalcul par commande, quel que soit le nombre de lignes supprimées
+        with CaptureQueriesContext(connection) as capture:
+            DetailCommande.objects.filter(entrepot_livraison=self.marche).delete()
+        self.assertEqual(len(self.mises_a_jour_commande(capture)), 2)
+
+        for commande, montant in ((premiere, Decimal('60.00')), (seconde, Decimal('10.00'))):
+            commande.refresh_from_db()
+            self.assertEqual(
+                (commande.montant_total, commande.montant_fournisseur_libre, commande.conforme_80_20),
+                (montant, Decimal('0.00'), True)
+            )
+
+        premiere.details.all().delete()
+        premiere.refresh_from_db()
+        self.assertEqual((premiere.montant_total, premiere.conforme_80_20), (Decimal('0.00'), True))
+
+    def test_suppression_unitaire_et_cascade(self):
+        commande = self.commande([(self.produits[0], self.ivry, 8), (self.produits[0], self.marche, 2)])
+        commande.details.get(entrepot_livraison=self.ivry).delete()
+        commande.refresh_from_db()
+        self.assertEqual((commande.montant_total, commande.conforme_80_20), (Decimal('20.00'), False))
+
+        # Suppression de la commande : ses lignes partent en cascade sans recalcul
+        with CaptureQueriesContext(connection) as capture:
+            commande.delete()
+        self.assertEqual(self.mises_a_jour_commande(capture), [])
+        self.assertFalse(DetailCommande.objects.filter(commande_id=commande.pk).exists())
+
+
+class RapportConformiteTests(TestCase):
+    """Rapport 80/20 : statistiques d'agrégat, groupes limités et signalés comme tronqués"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        user = User.objects.create_user('f1', 'f1@drivncook.fr', 'pw', first_name='C', last_name='D')
+        cls.franchise = Franchise.objects.create(user=user, nom_franchise='F1', date_signature=date(2024, 1, 1))
+        autre = User.objects.create_user('f2', 'f2@drivncook.fr', 'pw', first_name='E', last_name='F')
+        cls.autre = Franchise.objects.create(user=autre, nom_franchise='F2', date_signature=date(2024, 1, 1))
+        # F1 : 3 conformes et 2 non conformes, F2 : 1 non conforme
+        for jour, (franchise, conforme) in enumerate([
+            (cls.franchise, True), (cls.franchise, False), (cls.franchise, True),
+            (cls.franchise, True), (cls.franchise, False), (cls.autre, False)
+        ], start=1):
+            commande = CommandeFranchise.objects.create(franchise=franchise, adresse_livraison='1 rue de Paris')
+            CommandeFranchise.objects.filter(pk=commande.pk).update(
+                date_commande=date(2025, 3, jour), conforme_80_20=conforme, montant_total=Decimal('100.00'),
+                montant_drivn_cook=Decimal('90.00') if conforme else Decimal('50.00'),
+                montant_fournisseur_libre=Decimal('10.00') if conforme else Decimal('50.00')
+            )
+
+    def rapport(self, user=None, **params):
+        client = APIClient()
+        client.force_authenticate(user or self.admin)
+        return client.get('/api/rapport/conformite-80-20/', params)
+
+    def test_statistiques_et_groupes_tronques(self):
+        reponse = self.rapport(limite=2, date_fin='2025-03-05')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['statistiques'], {
+            'total_commandes': 5, 'commandes_conformes': 3,
+            'commandes_non_conformes': 2, 'taux_conformite': 60.0
+        })
+        self.assertEqual(reponse.data['limite'], 2)
+        self.assertEqual(reponse.data['tronque'], {'commandes_conformes': True, 'commandes_non_conformes': False})
+        self.assertEqual(
+            [ligne['date_commande'] for ligne in reponse.data['commandes_conformes']],
+            [date(2025, 3, 4), date(2025, 3, 3)]
+        )
+        self.assertEqual(len(reponse.data['commandes_non_conformes']), 2)
+
+        # Limite par défaut, plafonnée
+        self.assertEqual(self.rapport(limite=100000).data['limite'], 200)
+        self.assertEqual(self.rapport().data['tronque'], {'commandes_conformes': False, 'commandes_non_conformes': False})
+
+    def test_limite_invalide(self):
+        for limite in ('-5', '0', 'abc'):
+            reponse = self.rapport(limite=limite)
+            self.assertEqual(reponse.status_code, 400, limite)
+            self.assertIn('error', reponse.data)
+
+    def test_franchise_et_flux_ndjson(self):
+        reponse = self.rapport(user=self.franchise.user, sortie='ndjson')
+        lignes = [json.loads(ligne) for ligne in b''.join(reponse.streaming_content).decode().splitlines()]
+        self.assertEqual(lignes[0]['statistiques']['total_commandes'], 5)
+        self.assertEqual(len(lignes), 6)
+        self.assertEqual({ligne['franchise'] for ligne in lignes[1:]}, {'F1'})
+        self.assertEqual(sum(ligne['conforme'] for ligne in lignes[1:]), 3)
+
+
+class RapportsPDFTests(TestCase):
+    """File des rapports PDF mensuels : tâches, cache disque, reprise et nettoyage"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('f1', 'f1@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.franchise = Franchise.objects.create(user=user, nom_franchise='F1', date_signature=date(2024, 1, 1))
+        autre = User.objects.create_user('f2', 'f2@drivncook.fr', 'pw', first_name='C', last_name='D')
+        cls.autre = Franchise.objects.create(user=autre, nom_franchise='F2', date_signature=date(2024, 1, 1))
+        for jour in (1, 2):
+            VenteFranchise.objects.create(
+                franchise=cls.franchise, date_vente=date(2025, 3, jour), chiffre_affaires_jour=Decimal('100.00')
+            )
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.dossier = dossier.name
+        reglages = override_settings(RAPPORTS_PDF_DIR=self.dossier, RAPPORTS_PDF_WORKER_EXTERNE=True)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.franchise.user)
+
+    def demander(self, mois='2025-03'):
+        return self.client.post('/api_user/rapports/ventes/taches/', {'mois': mois}, format='json')
+
+    def test_cycle_tache_et_cache(self):
+        reponse = self.demander()
+        self.assertEqual((reponse.status_code, reponse.data['statut']), (202, 'en_attente'))
+        tache_id = reponse.data['id']
+        self.assertEqual(self.client.get(f'/api_user/rapports/ventes/taches/{tache_id}/pdf/').status_code, 409)
+
+        call_command('traiter_rapports_pdf', '--une-fois', stdout=mock.Mock())
+        self.assertEqual(self.client.get(f'/api_user/rapports/ventes/taches/{tache_id}/').data['statut'], 'termine')
+        reponse = self.client.get(f'/api_user/rapports/ventes/taches/{tache_id}/pdf/')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(b''.join(reponse.streaming_content).startswith(b'%PDF'))
+
+        # Mêmes données : même tâche, PDF servi depuis le disque sans nouveau rendu
+        with mock.patch('franchise_user.views.pdf_ventes_mensuel') as rendu_direct, \
+                mock.patch('gestion_camions.rapports.pdf_ventes_mensuel') as rendu:
+            reponse = self.demander()
+            self.assertEqual((reponse.status_code, reponse.data['id']), (200, tache_id))
+            reponse = self.client.get('/api_user/rapports/ventes/', {'mois': '2025-03'})
+            self.assertEqual(reponse.status_code, 200)
+        rendu.assert_not_called()
+        rendu_direct.assert_not_called()
+
+        # Une vente du mois change la version des données : nouvelle tâche
+        VenteFranchise.objects.create(
+            franchise=self.franchise, date_vente=date(2025, 3, 3), chiffre_affaires_jour=Decimal('50.00')
+        )
+        self.assertNotEqual(self.demander().data['id'], tache_id)
+
+    def test_acces_et_parametres(self):
+        tache_id = self.demander().data['id']
+        self.assertEqual(self.demander(mois='mars').status_code, 400)
+        self.assertEqual(self.client.get('/api_user/rapports/ventes/', {'mois': '2025-13'}).status_code, 400)
+
+        self.client.force_authenticate(self.autre.user)
+        self.assertEqual(self.client.get(f'/api_user/rapports/ventes/taches/{tache_id}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api_user/rapports/ventes/taches/{tache_id}/pdf/').status_code, 404)
+
+    def test_reprise_tache_bloquee_dans_le_processus_web(self):
+        tache_id = self.demander().data['id']
+        TacheRapportPDF.objects.filter(pk=tache_id).update(statut='en_cours')
+        # Tâche récente : laissée au rendu en cours
+        self.assertEqual(self.client.get(f'/api_user/rapports/ventes/taches/{tache_id}/').data['statut'], 'en_cours')
+
+        TacheRapportPDF.objects.filter(pk=tache_id).update(updated_at=timezone.now() - timedelta(hours=1))
+        with override_settings(RAPPORTS_PDF_WORKER_EXTERNE=False), \
+                mock.patch('gestion_camions.rapports._executeur') as executeur, \
+                self.captureOnCommitCallbacks(execute=True):
+            reponse = self.client.get(f'/api_user/rapports/ventes/taches/{tache_id}/')
+        self.assertEqual(reponse.data['statut'], 'en_attente')
+        self.assertIn(mock.call(_executer_en_fond, tache_id), executeur.submit.call_args_list)
+
+    def test_nettoyage_des_anciens_pdf(self):
+        ancienne = TacheRapportPDF.objects.create(
+            franchise=self.franchise, mois=date(2024, 1, 1), cle='a' * 64, statut='termine'
+        )
+        recente = TacheRapportPDF.objects.create(
+            franchise=self.franchise, mois=date(2024, 2, 1), cle='b' * 64, statut='termine'
+        )
+        TacheRapportPDF.objects.filter(pk=ancienne.pk).update(updated_at=timezone.now() - timedelta(days=60))
+        for tache in (ancienne, recente):
+            with open(tache.chemin, 'wb') as fichier:
+                fichier.write(b'%PDF')
+        temporaire = os.path.join(self.dossier, f'{"c" * 64}.pdf.123.tmp')
+        open(temporaire, 'wb').close()
+        il_y_a_60_jours = (timezone.now() - timedelta(days=60)).timestamp()
+        for chemin in (ancienne.chemin, temporaire):
+            os.utime(chemin, (il_y_a_60_jours, il_y_a_60_jours))
+
+        self.assertEqual(nettoyer_rapports(timedelta(days=30)), 2)
+        self.assertEqual(os.listdir(self.dossier), [os.path.basename(recente.chemin)])
+        self.assertEqual(list(TacheRapportPDF.objects.values_list('pk', flat=True)), [recente.pk])
+
+
+class RapportsMensuelsTests(TestCase):
+    """Archive zip des rapports du mois : rendus par la file des tâches, jamais dans la requête"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.franchises = {}
+        for nom, statut in (('Zeta', 'paye'), ('Alpha', 'valide'), ('Sans ventes', 'en_attente')):
+            user = User.objects.create_user(nom.lower(), f'{nom[0]}@drivncook.fr', 'pw', first_name=nom, last_name='X')
+            cls.franchises[nom] = Franchise.objects.create(
+                user=user, nom_franchise=nom, date_signature=date(2024, 1, 1), statut=statut
+            )
+        VenteFranchise.objects.create(
+            franchise=cls.franchises['Alpha'], date_vente=date(2025, 3, 2), chiffre_affaires_jour=Decimal('100.00')
+        )
+        VenteFranchise.objects.create(
+            franchise=cls.franchises['Sans ventes'], date_vente=date(2025, 4, 1), chiffre_affaires_jour=Decimal('1.00')
+        )
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(RAPPORTS_PDF_DIR=dossier.name, RAPPORTS_PDF_WORKER_EXTERNE=True)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def archive(self, **params):
+        with mock.patch('gestion_camions.rapports.pdf_ventes_mensuel') as rendu:
+            reponse = self.client.get('/api/rapport/ventes-mensuels/', params)
+        rendu.assert_not_called()
+        self.assertEqual(reponse.status_code, 202)
+        self.assertEqual(reponse.data['termines'], 0)
+        self.assertTrue(all(tache['statut'] == 'en_attente' for tache in reponse.data['taches']))
+
+        call_command('traiter_rapports_pdf', '--une-fois', stdout=mock.Mock())
+        with mock.patch('gestion_camions.rapports.pdf_ventes_mensuel') as rendu:
+            reponse = self.client.get('/api/rapport/ventes-mensuels/', params)
+            contenu = b''.join(reponse.streaming_content)
+        rendu.assert_not_called()
+        self.assertEqual(reponse.status_code, 200)
+        return zipfile.ZipFile(BytesIO(contenu))
+
+    def test_contenu_archive(self):
+        # Franchises payées ou ayant vendu dans le mois, dans l'ordre des noms
+        alpha, zeta, sans_ventes = (self.franchises[nom].pk for nom in ('Alpha', 'Zeta', 'Sans ventes'))
+        archive = self.archive(mois='2025-03')
+        self.assertEqual(archive.namelist(), [
+            f'rapport_ventes_{alpha}_alpha_2025-03.pdf', f'rapport_ventes_{zeta}_zeta_2025-03.pdf'
+        ])
+        self.assertTrue(all(archive.read(nom).startswith(b'%PDF') for nom in archive.namelist()))
+
+        archive = self.archive(mois='2025-03', franchise=sans_ventes)
+        self.assertEqual(archive.namelist(), [f'rapport_ventes_{sans_ventes}_sans-ventes_2025-03.pdf'])
+
+    def test_rapports_en_erreur(self):
+        with mock.patch('gestion_camions.rapports.pdf_ventes_mensuel', side_effect=RuntimeError('ReportLab')):
+            archive = self.archive(mois='2025-03', franchise=self.franchises['Zeta'].pk)
+        self.assertEqual(archive.namelist(), ['erreurs.txt'])
+        self.assertIn(b'Zeta', archive.read('erreurs.txt'))
+        # Pas de relance en boucle : l'archive reste disponible au rappel suivant
+        reponse = self.client.get(
+            '/api/rapport/ventes-mensuels/', {'mois': '2025-03', 'franchise': self.franchises['Zeta'].pk}
+        )
+        self.assertEqual(reponse.status_code, 200)
+
+    def test_noms_de_fichier(self):
+        # Même nom de franchise, « / » dans le nom : un fichier distinct par franchise
+        for numero in (1, 2):
+            user = User.objects.create_user(f'homonyme{numero}', f'h{numero}@drivncook.fr', 'pw')
+            Franchise.objects.create(
+                user=user, nom_franchise='Crêpes / Galettes', date_signature=date(2024, 1, 1), statut='paye'
+            )
+        rapports = [
+            (franchise, nom_fichier_rapport(franchise, date(2025, 3, 1)), b'%PDF')
+            for franchise in Franchise.objects.filter(nom_franchise='Crêpes / Galettes')
+        ]
+        self.assertEqual(len({nom for _, nom, _ in rapports}), 2)
+        self.assertTrue(all(nom.endswith('_crepes-galettes_2025-03.pdf') for _, nom, _ in rapports))
+        with tempfile.TemporaryDirectory() as dossier:
+            self.assertEqual(ecrire_rapports(rapports, dossier), 2)
+            self.assertEqual(len(os.listdir(dossier)), 2)
+
+    def test_parametres_invalides(self):
+        for params in ({}, {'mois': 'mars'}, {'mois': '2025-13'}, {'mois': '2025-03', 'franchise': 'abc'}):
+            reponse = self.client.get('/api/rapport/ventes-mensuels/', params)
+            self.assertEqual(reponse.status_code, 400, params)
+
+        self.client.force_authenticate(self.franchises['Alpha'].user)
+        self.assertEqual(self.client.get('/api/rapport/ventes-mensuels/', {'mois': '2025-03'}).status_code, 403)
+
+
+class PaginationCurseurTests(TestCase):
+    """Curseur sur toutes les colonnes de tri : pas d'OFFSET même quand la date est partagée"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        for numero in range(7):
+            user = User.objects.create_user(f'f{numero}', f'f{numero}@drivncook.fr', 'pw', first_name='F', last_name='X')
+            franchise = Franchise.objects.create(user=user, nom_franchise=f'F{numero}', date_signature=date(2024, 1, 1))
+            for jour in (1, 2, 3):
+                VenteFranchise.objects.create(
+                    franchise=franchise, date_vente=date(2025, 3, jour), chiffre_affaires_jour=Decimal('10.00')
+                )
+        cls.attendu = list(VenteFranchise.objects.order_by('-date_vente', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    @staticmethod
+    def position(url):
+        curseur = url.split('cursor=')[1].split('&')[0]
+        return json.loads(base64.urlsafe_b64decode(unquote(curseur)))['p']
+
+    def parcourir(self, url, lien):
+        ids, pages = [], 0
+        while url:
+            with CaptureQueriesContext(connection) as capture:
+                reponse = self.client.get(url)
+            self.assertEqual(reponse.status_code, 200)
+            self.assertFalse(any('OFFSET' in requete['sql'] for requete in capture.captured_queries))
+            ids.extend(vente['id'] for vente in reponse.data['results'])
+            url = reponse.data[lien]
+            if url:
+                # Position = (date, id) complète, pas de décalage
+                self.assertEqual(len(self.position(url)), 2)
+            pages += 1
+        return ids, pages
+
+    def test_parcours_complet_sans_offset(self):
+        ids, pages = self.parcourir('/api/ventes/?page_size=5', 'next')
+        self.assertEqual((ids, pages), (self.attendu, 5))
+
+        # Retour en arrière depuis la dernière page
+        reponse = self.client.get('/api/ventes/?page_size=5')
+        while reponse.data['next']:
+            reponse = self.client.get(reponse.data['next'])
+        derniere = [vente['id'] for vente in reponse.data['results']]
+        precedentes, _ = self.parcourir(reponse.data['previous'], 'previous')
+        self.assertEqual(derniere, self.attendu[20:])
+        self.assertEqual(precedentes, [i for debut in (15, 10, 5, 0) for i in self.attendu[debut:debut + 5]])
+
+    def test_curseur_invalide(self):
+        curseurs = ['pas-du-base64', base64.urlsafe_b64encode(b'pas-du-json').decode()] + [
+            base64.urlsafe_b64encode(json.dumps({'p': position}).encode()).decode()
+            for position in ('2025-03-01', ['2025-03-01'], ['hier', '1'])
+        ]
+        for curseur in curseurs:
+            self.assertEqual(self.client.get('/api/ventes/', {'cursor': curseur}).status_code, 404, curseur)
+
+    def test_taille_de_page_par_defaut(self):
+        # Sans paramètre, la liste est paginée (plus de liste complète) ; page_size plafonné
+        with mock.patch.object(VentePagination, 'page_size', 4):
+            reponse = self.client.get('/api/ventes/')
+        self.assertEqual(len(reponse.data['results']), 4)
+        self.assertIsNotNone(reponse.data['next'])
+        self.assertIsNone(reponse.data['previous'])
+        with mock.patch.object(VentePagination, 'max_page_size', 6):
+            self.assertEqual(len(self.client.get('/api/ventes/', {'page_size': 1000}).data['results']), 6)
+
+
+class ExportsTests(TestCase):
+    """Exports CSV / NDJSON en flux : filtres appliqués, paramètres contrôlés avant le flux"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.franchises = []
+        for nom in ('F1', 'F2'):
+            user = User.objects.create_user(nom, f'{nom}@drivncook.fr', 'pw', first_name=nom, last_name='X')
+            franchise = Franchise.objects.create(user=user, nom_franchise=nom, date_signature=date(2024, 1, 1))
+            cls.franchises.append(franchise)
+            for jour in (1, 15, 31):
+                VenteFranchise.objects.create(
+                    franchise=franchise, date_vente=date(2025, 3, jour), chiffre_affaires_jour=Decimal('100.00'),
+                    nombre_transactions=jour
+                )
+        categorie = CategorieProduit.objects.create(nom_categorie='Frais')
+        produit = Produit.objects.create(
+            nom_produit='Steak', categorie=categorie, prix_unitaire=Decimal('10.00'), unite='kg'
+        )
+        cls.entrepots = [
+            Entrepot.objects.create(nom_entrepot=nom, adresse='a', ville='Paris', code_postal='75000')
+            for nom in ('Ivry', 'Rungis')
+        ]
+        for entrepot in cls.entrepots:
+            StockEntrepot.objects.create(produit=produit, entrepot=entrepot, quantite_disponible=100)
+        for franchise in cls.franchises:
+            commande = CommandeFranchise.objects.create(franchise=franchise, adresse_livraison='1 rue de Paris')
+            commande.ajouter_details([
+                {'produit': produit.id, 'entrepot_livraison': entrepot.id, 'quantite_commandee': 2}
+                for entrepot in cls.entrepots
+            ])
+        CommandeFranchise.objects.filter(franchise=cls.franchises[1]).update(statut='validee')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def exporter(self, nom, **params):
+        reponse = self.client.get(f'/api/exports/{nom}/', params)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.streaming)
+        return b''.join(reponse.streaming_content).decode(), reponse
+
+    def test_csv_filtre(self):
+        contenu, reponse = self.exporter(
+            'ventes', franchise=self.franchises[0].pk, date_debut='2025-03-02', date_fin='2025-03-31'
+        )
+        self.assertEqual(reponse['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="ventes.csv"', reponse['Content-Disposition'])
+        lignes = contenu.splitlines()
+        self.assertEqual(lignes[0], 'franchise,date_vente,chiffre_affaires_jour,redevance_due,nombre_transactions')
+        self.assertEqual(lignes[1:], ['F1,2025-03-15,100.00,4.00,15', 'F1,2025-03-31,100.00,4.00,31'])
+
+        contenu, _ = self.exporter('stocks', entrepot=self.entrepots[1].pk)
+        self.assertEqual([ligne.split(',')[0] for ligne in contenu.splitlines()[1:]], ['Rungis'])
+
+    def test_ndjson_filtre(self):
+        contenu, reponse = self.exporter('commandes', sortie='ndjson', statut='validee')
+        self.assertEqual(reponse['Content-Type'], 'application/x-ndjson')
+        lignes = [json.loads(ligne) for ligne in contenu.splitlines()]
+        self.assertEqual(len(lignes), 2)
+        self.assertEqual({(ligne['franchise'], ligne['statut']) for ligne in lignes}, {('F2', 'validee')})
+        self.assertEqual({ligne['entrepot_livraison'] for ligne in lignes}, {'Ivry', 'Rungis'})
+
+        contenu, _ = self.exporter('commandes', sortie='ndjson', franchise=self.franchises[0].pk, date_fin='2000-01-01')
+        self.assertEqual(contenu, '')
+
+    def test_parametres_invalides(self):
+        for nom, params in (
+            ('ventes', {'date_debut': '2025-02-30'}),
+            ('ventes', {'date_fin': 'hier'}),
+            ('commandes', {'franchise': 'F1'}),
+            ('stocks', {'entrepot': 'Ivry'}),
+            ('stocks', {'date_debut': '03/2025'}),
+            ('ventes', {'sortie': 'xml'}),
+        ):
+            reponse = self.client.get(f'/api/exports/{nom}/', params)
+            self.assertEqual(reponse.status_code, 400, params)
+            self.assertFalse(reponse.streaming)
+            self.assertIn('error', reponse.data)
+
+        self.client.force_authenticate(self.franchises[0].user)
+        self.assertEqual(self.client.get('/api/exports/ventes/').status_code, 403)
+
+
+class TableauDeBordTests(TestCase):
+    """Tableaux de bord dénormalisés : lus tels quels, recalculés par la commande planifiée"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.franchises = []
+        for numero, statut in enumerate(('paye', 'paye', 'valide', 'suspendu')):
+            user = User.objects.create_user(f'f{numero}', f'f{numero}@drivncook.fr', 'pw', first_name='F', last_name='X')
+            cls.franchises.append(Franchise.objects.create(
+                user=user, nom_franchise=f'F{numero}', date_signature=date(2024, 1, 1), statut=statut
+            ))
+        cls.franchise = cls.franchises[0]
+
+    def a_recalculer(self, franchise=None):
+        return TableauDeBord.objects.get(franchise=franchise).a_recalculer
+
+    def rafraichir(self):
+        call_command('rafraichir_tableaux_de_bord', '--perimes', stdout=mock.Mock())
+
+    def test_franchises_actives(self):
+        self.assertEqual(TableauDeBord.obtenir().franchises_actives, 2)
+        franchise = Franchise.objects.get(pk=self.franchises[2].pk)
+        franchise.statut = 'paye'
+        franchise.save()
+        # Ligne globale servie telle quelle jusqu'au passage de la commande
+        self.assertFalse(self.a_recalculer())
+        self.assertEqual(TableauDeBord.obtenir().franchises_actives, 2)
+        self.rafraichir()
+        self.assertEqual(TableauDeBord.obtenir().franchises_actives, 3)
+
+    def test_invalidation_par_les_ecritures(self):
+        TableauDeBord.obtenir()
+        self.assertEqual(TableauDeBord.obtenir(self.franchise).camions_total, 0)
+        # Lecture d'une ligne déjà calculée : une requête, sans recalcul
+        with self.assertNumQueries(1):
+            TableauDeBord.obtenir(self.franchise)
+
+        with CaptureQueriesContext(connection) as requetes:
+            Camion.objects.create(numero_camion='C1', immatriculation='AA-001-AA', franchise=self.franchise)
+        self.assertTrue(self.a_recalculer(self.franchise))
+        # La ligne globale n'est pas verrouillée par les écritures
+        self.assertFalse(self.a_recalculer())
+        self.assertFalse([q for q in requetes.captured_queries if 'IS NULL' in q['sql']])
+        with self.assertNumQueries(1):
+            self.assertEqual(TableauDeBord.obtenir(self.franchise).camions_total, 0)
+        self.rafraichir()
+        self.assertEqual(TableauDeBord.obtenir(self.franchise).camions_total, 1)
+        self.assertEqual(TableauDeBord.obtenir().camions_total, 1)
+
+        vente = VenteFranchise.objects.create(
+            franchise=self.franchise, date_vente=timezone.now().date(), chiffre_affaires_jour=Decimal('250.00')
+        )
+        self.rafraichir()
+        self.assertEqual(TableauDeBord.obtenir(self.franchise).chiffre_affaires_30j, Decimal('250.00'))
+        vente.delete()
+        self.rafraichir()
+        self.assertEqual(TableauDeBord.obtenir(self.franchise).chiffre_affaires_30j, 0)
+
+        # Conformité mise à jour par update() (enregistrer_montants) : invalidée explicitement
+        commande = CommandeFranchise.objects.create(franchise=self.franchise, adresse_livraison='1 rue de Paris')
+        self.rafraichir()
+        self.assertEqual(TableauDeBord.obtenir(self.franchise).commandes_conformes_80_20, 1)
+        CommandeFranchise.objects.filter(pk=commande.pk).update(conforme_80_20=False)
+        commande.enregistrer_montants()
+        self.assertTrue(self.a_recalculer(self.franchise))
+
+        # Une autre franchise n'est pas touchée
+        TableauDeBord.obtenir(self.franchises[1])
+        Camion.objects.create(numero_camion='C2', immatriculation='AA-002-AA', franchise=self.franchise)
+        self.assertFalse(self.a_recalculer(self.franchises[1]))
+
+    def test_premiere_lecture(self):
+        # Une seule ligne globale, même insérée par deux premières lectures concurrentes
+        TableauDeBord.objects.create()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TableauDeBord.objects.create()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TableauDeBord.objects.bulk_create([TableauDeBord(franchise=self.franchise)] * 2)
+
+        # Une écriture pendant le premier calcul n'est pas perdue
+        recalculer = TableauDeBord.recalculer
+
+        def recalculer_avec_ecriture(tableau):
+            Camion.objects.create(numero_camion='C3', immatriculation='AA-003-AA', franchise=self.franchise)
+            recalculer(tableau)
+
+        with mock.patch.object(TableauDeBord, 'recalculer', autospec=True, side_effect=recalculer_avec_ecriture):
+            TableauDeBord.obtenir(self.franchise)
+        self.assertTrue(self.a_recalculer(self.franchise))
+
+    def test_commande_rafraichir(self):
+        call_command('rafraichir_tableaux_de_bord', stdout=mock.Mock())
+        self.assertEqual(TableauDeBord.objects.filter(a_recalculer=False).count(), len(self.franchises) + 1)
+        self.assertEqual(TableauDeBord.objects.get(franchise=None).franchises_actives, 2)
+
+        # --perimes laisse les lignes de franchise à jour telles quelles, recalcule toujours la globale
+        TableauDeBord.objects.filter(franchise=self.franchise).update(camions_total=99)
+        TableauDeBord.objects.filter(franchise=None).update(camions_total=99)
+        self.rafraichir()
+        self.assertEqual(TableauDeBord.objects.get(franchise=self.franchise).camions_total, 99)
+        self.assertEqual(TableauDeBord.objects.get(franchise=None).camions_total, 0)
+        TableauDeBord.objects.filter(franchise=self.franchise).update(date_calcul=date(2020, 1, 1))
+        self.rafraichir()
+        self.assertEqual(TableauDeBord.objects.get(franchise=self.franchise).camions_total, 0)
+
+        # Franchise sans ligne : créée par --perimes
+        TableauDeBord.objects.filter(franchise=self.franchises[1]).delete()
+        self.rafraichir()
+        self.assertFalse(self.a_recalculer(self.franchises[1]))
+
+        TableauDeBord.objects.filter(franchise=self.franchise).update(camions_total=99)
+        call_command('rafraichir_tableaux_de_bord', stdout=mock.Mock())
+        self.assertEqual(TableauDeBord.objects.get(franchise=self.franchise).camions_total, 0)
+
+
+def cumuls_depuis_ventes():
+    """Cumuls attendus, recalculés en Python depuis toutes les ventes"""
+    attendus = {}
+    for vente in VenteFranchise.objects.all():
+        for periode in CumulVentes.TRONCATURES:
+            cle = (vente.franchise_id, periode, debut_periode(periode, vente.date_vente))
+            ca, redevance, transactions, jours = attendus.get(cle, (0, 0, 0, 0))
+            attendus[cle] = (
+                ca + vente.chiffre_affaires_jour, redevance + vente.redevance_due,
+                transactions + vente.nombre_transactions, jours + 1
+            )
+    return attendus
+
+
+def cumuls_enregistres():
+    return {
+        (cumul.franchise_id, cumul.periode, cumul.debut): (
+            cumul.chiffre_affaires, cumul.redevance, cumul.nombre_transactions, cumul.nombre_jours
+        )
+        for cumul in CumulVentes.objects.all()
+    }
+
+
+class ImportVentesTests(TestCase):
+    """Import en masse : ventes remplacées, cumuls et tableaux de bord remis à jour ensemble"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw', first_name='A', last_name='B')
+        cls.franchises = []
+        for nom in ('F1', 'F2'):
+            user = User.objects.create_user(nom, f'{nom}@drivncook.fr', 'pw', first_name=nom, last_name='X')
+            cls.franchises.append(Franchise.objects.create(user=user, nom_franchise=nom, date_signature=date(2024, 1, 1)))
+        for franchise, jour in ((cls.franchises[0], date(2025, 3, 10)), (cls.franchises[1], date(2025, 1, 15))):
+            VenteFranchise.objects.create(
+                franchise=franchise, date_vente=jour, chiffre_affaires_jour=Decimal('100.00'), nombre_transactions=10
+            )
+
+    def importer(self, ventes, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.admin)
+        return client.post('/api/ventes/import/', {'ventes': ventes}, format='json')
+
+    def test_cumuls_apres_import(self):
+        f1, f2 = self.franchises
+        janvier_f2 = CumulVentes.objects.get(franchise=f2, periode='mois', debut=date(2025, 1, 1))
+        TableauDeBord.obtenir(f1)
+
+        reponse = self.importer([
+            {'franchise': f1.pk, 'date_vente': '2025-03-10', 'chiffre_affaires_jour': '250.00', 'nombre_transactions': 20},
+            {'franchise': f1.pk, 'date_vente': '2025-03-11', 'chiffre_affaires_jour': '50.00'},
+            {'franchise': f2.pk, 'date_vente': '2025-12-31', 'chiffre_affaires_jour': '80.00', 'nombre_transactions': 4},
+        ])
+        self.assertEqual((reponse.status_code, reponse.data['ventes_importees']), (201, 3))
+
+        # Vente du 10 mars remplacée, pas dupliquée
+        self.assertEqual(VenteFranchise.objects.filter(franchise=f1).count(), 2)
+        self.assertEqual(cumuls_enregistres(), cumuls_depuis_ventes())
+        self.assertEqual(
+            CumulVentes.objects.get(franchise=f1, periode='mois', debut=date(2025, 3, 1)).chiffre_affaires,
+            Decimal('300.00')
+        )
+        # Bornes propres à chaque franchise : le mois de janvier de F2 n'est pas réécrit
+        self.assertTrue(CumulVentes.objects.filter(pk=janvier_f2.pk).exists())
+        self.assertTrue(TableauDeBord.objects.get(franchise=f1).a_recalculer)
+
+    def test_doublon_franchise_date(self):
+        avant = cumuls_enregistres()
+        f1 = self.franchises[0]
+        reponse = self.importer([
+            {'date_vente': '2025-03-12', 'chiffre_affaires_jour': '10.00'},
+            {'date_vente': '2025-03-12', 'chiffre_affaires_jour': '20.00'},
+        ], user=f1.user)
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('Même franchise et même date que la ligne 1', str(reponse.data))
+        self.assertFalse(VenteFranchise.objects.filter(date_vente=date(2025, 3, 12)).exists())
+        self.assertEqual(cumuls_enregistres(), avant)
+
+        # Franchisé : lignes rattachées à sa franchise
+        reponse = self.importer([{'date_vente': '2025-03-12', 'chiffre_affaires_jour': '10.00'}], user=f1.user)
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(VenteFranchise.objects.get(date_vente=date(2025, 3, 12)).franchise_id, f1.pk)
+        self.assertEqual(cumuls_enregistres(), cumuls_depuis_ventes())
+
+    def test_import_annule_si_les_cumuls_echouent(self):
+        avant = cumuls_enregistres()
+        vente = VenteFranchise(
+            franchise_id=self.franchises[0].pk, date_vente=date(2025, 3, 10),
+            chiffre_affaires_jour=Decimal('999.00'), nombre_transactions=1
+        )
+        with mock.patch.object(CumulVentes, 'reconstruire_bornes', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            VenteFranchise.importer([vente])
+        self.assertEqual(
+            VenteFranchise.objects.get(franchise=self.franchises[0]).chiffre_affaires_jour, Decimal('100.00')
+        )
+        self.assertEqual(cumuls_enregistres(), avant)
+
+
+class CoherenceCumulsVentesTests(TestCase):
+    """Cumuls toujours égaux à l'agrégat des ventes, quel que soit le chemin d'écriture"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.franchises = []
+        for nom in ('F1', 'F2'):
+            user = User.objects.create_user(nom, f'{nom}@drivncook.fr', 'pw', first_name=nom, last_name='X')
+            cls.franchises.append(Franchise.objects.create(user=user, nom_franchise=nom, date_signature=date(2024, 1, 1)))
+        jours = [date(2024, 12, 30), date(2025, 1, 2), date(2025, 1, 31), date(2025, 2, 3), date(2025, 6, 15)]
+        for rang, franchise in enumerate(cls.franchises):
+            for numero, jour in enumerate(jours):
+                VenteFranchise.objects.create(
+                    franchise=franchise, date_vente=jour,
+                    chiffre_affaires_jour=Decimal(100 * (numero + 1) + rang), nombre_transactions=numero + 1
+                )
+
+    def assertCumulsCoherents(self):
+        # Chaque cumul contre un agrégat SQL des ventes de sa période...
+        for cumul in CumulVentes.objects.all():
+            agregat = VenteFranchise.objects.filter(
+                franchise_id=cumul.franchise_id, date_vente__gte=cumul.debut,
+                date_vente__lt=periode_suivante(cumul.periode, cumul.debut)
+            ).aggregate(
+                ca=Sum('chiffre_affaires_jour'), redevance=Sum('redevance_due'),
+                transactions=Sum('nombre_transactions'), jours=Count('id')
+            )
+            self.assertEqual(
+                (cumul.chiffre_affaires, cumul.redevance, cumul.nombre_transactions, cumul.nombre_jours),
+                (agregat['ca'], agregat['redevance'], agregat['transactions'], agregat['jours']),
+                f"{cumul.periode} du {cumul.debut}, franchise {cumul.franchise_id}"
+            )
+        # ... et aucune période vendue sans cumul
+        self.assertEqual(cumuls_enregistres(), cumuls_depuis_ventes())
+
+    def test_update_de_queryset(self):
+        f1, f2 = self.franchises
+        TableauDeBord.obtenir(f1)
+        VenteFranchise.objects.filter(franchise=f1, date_vente__year=2025).update(
+            chiffre_affaires_jour=F('chiffre_affaires_jour') * 2
+        )
+        vente = VenteFranchise.objects.get(franchise=f1, date_vente=date(2025, 1, 2))
+        self.assertEqual(vente.redevance_due, Decimal('16.00'))
+        self.assertTrue(TableauDeBord.objects.get(franchise=f1).a_recalculer)
+        self.assertCumulsCoherents()
+
+        # Changement de date et de franchise : anciennes et nouvelles périodes recalculées
+        VenteFranchise.objects.filter(franchise=f1, date_vente=date(2025, 6, 15)).update(date_vente=date(2025, 3, 1))
+        VenteFranchise.objects.filter(franchise=f2, date_vente=date(2024, 12, 30)).update(
+            franchise=f1, date_vente=date(2024, 12, 1)
+        )
+        self.assertFalse(CumulVentes.objects.filter(franchise=f1, periode='mois', debut=date(2025, 6, 1)).exists())
+        self.assertCumulsCoherents()
+
+    def test_delete_de_queryset(self):
+        f1, f2 = self.franchises
+        VenteFranchise.objects.filter(date_vente__month=1).delete()
+        f2.ventes.filter(date_vente__year=2024).delete()
+        self.assertFalse(CumulVentes.objects.filter(franchise=f2, periode='annee', debut=date(2024, 1, 1)).exists())
+        self.assertCumulsCoherents()
+
+        with CaptureQueriesContext(connection) as requetes:
+            VenteFranchise.objects.filter(franchise=f1).delete()
+        # Invalidation groupée : pas une requête par vente supprimée
+        invalidations = [q for q in requetes.captured_queries if 'gestion_camions_tableaudebord' in q['sql']]
+        self.assertEqual(len(invalidations), 1)
+        self.assertFalse(CumulVentes.objects.filter(franchise=f1).exists())
+        self.assertCumulsCoherents()
+
+    def test_franchises_verrouillees_avant_l_agregat(self):
+        f1, f2 = self.franchises
+        appels = []
+        verrouiller, remplacer = CumulVentes.verrouiller, CumulVentes._remplacer
+
+        def verrou(franchise_ids=None):
+            appels.append(('verrou', None if franchise_ids is None else set(franchise_ids)))
+            verrouiller(franchise_ids)
+
+        def agregat(periode, ventes, cumuls):
+            appels.append(('agregat', periode))
+            return remplacer(periode, ventes, cumuls)
+
+        with mock.patch.object(CumulVentes, 'verrouiller', side_effect=verrou), \
+                mock.patch.object(CumulVentes, '_remplacer', side_effect=agregat):
+            VenteFranchise.objects.filter(franchise=f1).update(nombre_transactions=1)
+            self.assertEqual(appels[0], ('verrou', {f1.pk}))
+            self.assertIn(('agregat', 'semaine'), appels)
+            appels.clear()
+            VenteFranchise.objects.filter(franchise=f1, date_vente__year=2024).update(
+                franchise=f2, date_vente=date(2024, 12, 1)
+            )
+            self.assertEqual(appels[0], ('verrou', {f1.pk, f2.pk}))
+            appels.clear()
+            CumulVentes.reconstruire()
+            self.assertEqual(appels[0], ('verrou', None))
+            appels.clear()
+            vente = VenteFranchise.objects.get(franchise=f2, date_vente=date(2025, 6, 15))
+            vente.franchise, vente.date_vente = f1, date(2025, 7, 1)
+            vente.save()
+            self.assertEqual(appels, [('verrou', {f1.pk, f2.pk})])
+        self.assertCumulsCoherents()
+
+    def test_rapport_filtres_invalides(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', 'admin@drivncook.fr', 'pw'))
+        url = '/api/rapport/chiffre-affaires/'
+        for parametres in ({'franchise': 'abc'}, {'date_debut': 'hier'}, {'date_fin': '2025-02-30'}):
+            reponse = client.get(url, parametres)
+            self.assertEqual(reponse.status_code, 400, parametres)
+            self.assertIn('invalide', reponse.data['error'])
+
+        f1 = self.franchises[0]
+        reponse = client.get(url, {'franchise': f1.pk, 'date_debut': '2025-01-01', 'date_fin': '2025-02-01'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual([ligne['debut'] for ligne in reponse.data['cumuls']], [date(2025, 1, 1), date(2025, 2, 1)])
+        self.assertEqual(reponse.data['totaux']['chiffre_affaires'], Decimal('900.00'))
+
+    def test_ecritures_mixtes(self):
+        f1, f2 = self.franchises
+        vente = VenteFranchise.objects.get(franchise=f1, date_vente=date(2025, 2, 3))
+        vente.chiffre_affaires_jour = Decimal('42.00')
+        vente.save()
+        VenteFranchise.objects.get(franchise=f2, date_vente=date(2025, 1, 31)).delete()
+        VenteFranchise.importer([
+            VenteFranchise(franchise_id=f2.pk, date_vente=date(2025, 2, 4), chiffre_affaires_jour=Decimal('7.00')),
+            VenteFranchise(franchise_id=f1.pk, date_vente=date(2024, 12, 30), chiffre_affaires_jour=Decimal('9.00')),
+        ])
+        VenteFranchise.objects.filter(date_vente__gte=date(2025, 2, 1)).update(nombre_transactions=3)
+        self.assertCumulsCoherents()
+
+
+class ConnexionSequencesTests(TestCase):
+    """Connexion dédiée aux compteurs, hors du gestionnaire connections : fermée explicitement"""
+
+    def test_fermee_en_fin_de_requete_et_hors_requete(self):
+        connexion = connexion_sequences()
+        self.assertIs(connexion_sequences(), connexion)
+        self.assertNotIn(connexion, connections.all())
+
+        # Fin de requête : même règle que les connexions de Django (CONN_MAX_AGE)
+        with mock.patch.object(connexion, 'close_if_unusable_or_obsolete') as perimee, \
+                mock.patch.object(connexion, 'close') as fermer:
+            request_finished.send(sender=self.__class__)
+            perimee.assert_called_once_with()
+            fermer.assert_not_called()
+
+            # Hors requête (threads du benchmark) : fermeture inconditionnelle
+            fermer_connexion_sequences()
+            fermer.assert_called_once_with()
+
+
+@skipUnless(connection.vendor == 'postgresql', "Verrous FOR UPDATE : PostgreSQL uniquement")
+class CumulsVentesConcurrenceTests(TransactionTestCase):
+    """Une vente enregistrée pendant une reconstruction attend sa fin et n'est pas écrasée"""
+
+    def test_vente_pendant_reconstruction(self):
+        user = User.objects.create_user('F1', 'f1@drivncook.fr', 'pw', first_name='F', last_name='X')
+        franchise = Franchise.objects.create(user=user, nom_franchise='F1', date_signature=date(2024, 1, 1))
+        VenteFranchise.objects.create(franchise=franchise, date_vente=date(2025, 3, 10), chiffre_affaires_jour=100)
+        verrou_pris, liberer, enregistree = threading.Event(), threading.Event(), threading.Event()
+        remplacer = CumulVentes._remplacer
+
+        def remplacer_lentement(periode, ventes, cumuls):
+            verrou_pris.set()
+            liberer.wait(10)
+            return remplacer(periode, ventes, cumuls)
+
+        def reconstruire():
+            try:
+                with mock.patch.object(CumulVentes, '_remplacer', side_effect=remplacer_lentement):
+                    CumulVentes.reconstruire_bornes({franchise.pk: (date(2025, 3, 1), date(2025, 3, 31))})
+            finally:
+                connection.close()
+
+        def vendre():
+            try:
+                VenteFranchise.objects.create(
+                    franchise=franchise, date_vente=date(2025, 3, 11), chiffre_affaires_jour=50
+                )
+                enregistree.set()
+            finally:
+                connection.close()
+
+        fils = [threading.Thread(target=reconstruire)]
+        fils[0].start()
+        try:
+            self.assertTrue(verrou_pris.wait(10))
+            fils.append(threading.Thread(target=vendre))
+            fils[1].start()
+            self.assertFalse(enregistree.wait(1))
+        finally:
+            liberer.set()
+            for fil in fils:
+                fil.join()
+        self.assertTrue(enregistree.is_set())
+        self.assertEqual(cumuls_enregistres(), cumuls_depuis_ventes())
+
+
+@skipUnless(connection.vendor == 'postgresql', "Connexion dédiée aux compteurs : PostgreSQL uniquement")
+class SequenceCommandeConcurrenceTests(TransactionTestCase):
+    """Un numéro pris dans une transaction longue ne bloque pas les autres créations du jour"""
+
+    def test_compteur_non_verrouille_jusqu_au_commit(self):
+        jour = date(2000, 1, 1)
+        pris = threading.Event()
+        liberer = threading.Event()
+
+        def transaction_longue():
+            try:
+                with transaction.atomic():
+                    SequenceCommande.prochain_numero(jour)
+                    pris.set()
+                    liberer.wait(10)
+            finally:
+                connection.close()
+
+        fil = threading.Thread(target=transaction_longue)
+        fil.start()
+        try:
+            self.assertTrue(pris.wait(10))
+            debut = monotonic()
+            with transaction.atomic():
+                self.assertEqual(SequenceCommande.prochain_numero(jour), 2)
+            self.assertLess(monotonic() - debut, 2)
+        finally:
+            liberer.set()
+            fil.join()
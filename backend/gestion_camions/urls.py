@@ -19,6 +19,7 @@ urlpatterns = [
     # EMPLACEMENTS (Lecture tous, Écriture admin)
     # ===============================================
     path('emplacements/', views.EmplacementListCreateView.as_view(), name='emplacement-list-create'),
+    path('emplacements/disponibilites/', views.disponibilites_emplacements, name='emplacement-disponibilites'),
     path('emplacements/<int:pk>/', views.EmplacementDetailView.as_view(), name='emplacement-detail'),
     
     # ===============================================
@@ -38,6 +39,8 @@ urlpatterns = [
     # ===============================================
     path('affectations/', views.AffectationListCreateView.as_view(), name='affectation-list-create'),
     path('affectations/<int:pk>/', views.AffectationDetailView.as_view(), name='affectation-detail'),
+    path('affectations/planning/', views.planning_affectations, name='affectation-planning'),
+    path('affectations/planificateur/', views.planificateur_affectations, name='affectation-planificateur'),
     
     # ===============================================
     # CATÉGORIES PRODUITS (Admin uniquement)
@@ -71,11 +74,17 @@ urlpatterns = [
     path('commandes/<int:pk>/preparer/', views.admin_marquer_preparee, name='admin-marquer-preparee'),
     path('commandes/<int:pk>/livrer/', views.admin_marquer_livree, name='admin-marquer-livree'),
     
+    # Mêmes actions sur une liste de commandes ({"ids": [...]})
+    path('commandes/valider/', views.admin_valider_commandes, name='admin-valider-commandes'),
+    path('commandes/preparer/', views.admin_preparer_commandes, name='admin-preparer-commandes'),
+    path('commandes/livrer/', views.admin_livrer_commandes, name='admin-livrer-commandes'),
+    
     
     # ===============================================
     # GESTION DES VENTES ET REDEVANCES (4%)
     # ===============================================
     path('ventes/', views.VenteFranchiseViewSet.as_view({'get': 'list', 'post': 'create'}), name='ventes'),
+    path('ventes/import/', views.import_ventes, name='ventes-import'),
     path('ventes/<int:pk>/', views.VenteFranchiseViewSet.as_view({'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}), name='vente-detail'),
     
     # ===============================================
@@ -83,6 +92,15 @@ urlpatterns = [
     # ===============================================
     path('dashboard/stats/', views.DashboardViewSet.as_view({'get': 'stats_generales'}), name='dashboard-stats'),
     path('rapport/conformite-80-20/', views.rapport_conformite_80_20, name='rapport-conformite-80-20'),
+    path('rapport/chiffre-affaires/', views.rapport_chiffre_affaires, name='rapport-chiffre-affaires'),
+    path('rapport/ventes-mensuels/', views.rapports_ventes_mensuels, name='rapports-ventes-mensuels'),
+    
+    # ===============================================
+    # EXPORTS COMPTABLES (CSV / NDJSON)
+    # ===============================================
+    path('exports/commandes/', views.export_commandes, name='export-commandes'),
+    path('exports/ventes/', views.export_ventes, name='export-ventes'),
+    path('exports/stocks/', views.export_stocks, name='export-stocks'),
     
     # ===============================================
     # ENDPOINTS SPÉCIALISÉS POUR FRANCHISÉS
@@ -90,6 +108,12 @@ urlpatterns = [
     
     # Mes ventes et redevances
     path('mes-ventes/', views.VenteFranchiseViewSet.as_view({'get': 'list', 'post': 'create'}), name='mes-ventes'),
+    path('mes-ventes/import/', views.import_ventes, name='mes-ventes-import'),
+    
+    # Mon planning d'affectations
+    path('mes-affectations/planning/', views.planning_affectations, name='mes-affectations-planning'),
+    path('mes-affectations/planificateur/', views.planificateur_affectations, name='mes-affectations-planificateur'),
+    path('mes-emplacements/disponibilites/', views.disponibilites_emplacements, name='mes-emplacements-disponibilites'),
     
     # Mes statistiques personnelles
     path('mes-stats/', views.DashboardViewSet.as_view({'get': 'stats_generales'}), name='mes-stats'),
@@ -4,12 +4,14 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db.models import Sum, F
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from .models import (
     Entrepot, Franchise, Emplacement, Camion, MaintenanceCamion,
     AffectationEmplacement, CategorieProduit, Produit, StockEntrepot,
-    CommandeFranchise, VenteFranchise
+    CommandeFranchise, DetailCommande, VenteFranchise, TableauDeBord, CumulVentes,
+    analyser_regle_80_20
 )
 from rest_framework.decorators import action
 from rest_framework.decorators import api_view, permission_classes
@@ -20,13 +22,27 @@ from .serializers import (
     CategorieProduitSerializer, ProduitSerializer, StockEntrepotSerializer,
     VenteFranchiseSerializer, EntrepotSimpleSerializer,
     AdminCommandeFranchiseMultiEntrepotSerializer, AdminCommandeCreateSerializer,
-    AdminCommandeUpdateSerializer,
-    
+    AdminCommandeUpdateSerializer, VenteImportSerializer, AffectationPlanningSerializer, PlanificateurSerializer,
+    CommandesLotSerializer,
 
 )
 from rest_framework import generics
 from django.shortcuts import get_object_or_404
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, StreamingHttpResponse
+import csv
+import io
+import itertools
+import json
+import tempfile
+from collections import Counter
+from datetime import date, timedelta
+from .cache import CacheReferenceMixin, invalider, reponse_en_cache
+from .rapports import demander_rapports_du_mois, rapports_des_taches, zipper_rapports
+from backend.pagination import (
+    AffectationPagination, CommandePagination, StockPagination, VentePagination
+)
 
 User = get_user_model()
 
@@ -93,9 +109,11 @@ class EntrepotDetailView(generics.RetrieveUpdateDestroyAPIView):
 @permission_classes([permissions.IsAuthenticated])
 def entrepots_disponibles(request):
     """Liste des entrepôts disponibles pour les commandes (actifs uniquement)"""
-    entrepots = Entrepot.objects.filter(statut='actif').order_by('type_entrepot', 'nom_entrepot')
-    serializer = EntrepotSimpleSerializer(entrepots, many=True)
-    return Response(serializer.data)
+    def construire():
+        entrepots = Entrepot.objects.filter(statut='actif').order_by('type_entrepot', 'nom_entrepot')
+        return EntrepotSimpleSerializer(entrepots, many=True).data
+    
+    return reponse_en_cache(request, ['entrepots'], construire)
 
 
 class EmplacementListCreateView(generics.ListCreateAPIView):
@@ -120,6 +138,138 @@ class EmplacementDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
 
 
+def _conflits_planning(erreur):
+    """Conflits [{ligne, message}] d'une ValidationError levée par AffectationEmplacement.planifier"""
+    if not hasattr(erreur, 'error_dict'):
+        return [{'ligne': None, 'message': message} for message in erreur.messages]
+    return [
+        {'ligne': int(index) + 1, 'message': messages[0]}
+        for index, messages in sorted(erreur.message_dict.items(), key=lambda item: int(item[0]))
+    ]
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def planificateur_affectations(request):
+    """Répartition automatique des camions sur leurs emplacements autorisés pour une période
+    
+    Préférences : types_zone (ordre de préférence), tarif_max, créneau horaire commun.
+    Sans "enregistrer", renvoie la proposition ; avec "enregistrer": true, toutes les
+    affectations proposées sont créées en une transaction. Franchisé : ses camions.
+    """
+    if request.user.is_staff:
+        franchise = None
+    elif hasattr(request.user, 'franchise'):
+        franchise = request.user.franchise
+    else:
+        return Response(
+            {'error': 'Utilisateur non associé à une franchise'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    serializer = PlanificateurSerializer(data=request.data, context={'franchise': franchise})
+    serializer.is_valid(raise_exception=True)
+    affectations, sans_emplacement = serializer.proposer()
+    
+    reponse = {
+        'affectations': AffectationEmplacementSerializer(affectations, many=True).data,
+        'sans_emplacement': [
+            {'camion': camion.id, 'numero_camion': camion.numero_camion, 'date': jour}
+            for camion, jour in sans_emplacement
+        ],
+    }
+    if not serializer.validated_data['enregistrer'] or not affectations:
+        return Response(reponse)
+    
+    try:
+        affectations = AffectationEmplacement.planifier(affectations)
+    except DjangoValidationError as e:
+        # Affectation concurrente enregistrée entre la proposition et l'insertion : conflits par
+        # ligne (409), ou rejet de la contrainte d'exclusion sans ligne identifiable (400)
+        return Response({
+            'error': 'Le planning est en conflit avec des affectations enregistrées entre-temps',
+            'conflits': _conflits_planning(e)
+        }, status=status.HTTP_409_CONFLICT if hasattr(e, 'error_dict') else status.HTTP_400_BAD_REQUEST)
+    
+    reponse['message'] = f'{len(affectations)} affectation(s) créée(s)'
+    reponse['affectations'] = AffectationEmplacementSerializer(affectations, many=True).data
+    return Response(reponse, status=status.HTTP_201_CREATED)
+
+
+# Période maximale d'un calendrier de disponibilités (un trimestre)
+JOURS_MAX_CALENDRIER = 93
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def disponibilites_emplacements(request):
+    """Calendrier d'occupation emplacements × jours (?date_debut=, ?date_fin=, 7 jours par défaut)
+    
+    Deux requêtes quelle que soit la période : les emplacements, puis toutes les affectations
+    actives qui recouvrent la période. Franchisé : emplacements autorisés uniquement, le
+    camion n'est indiqué que pour ses propres affectations. Filtres : ?type_zone=, ?ville=.
+    """
+    date_debut = request.query_params.get('date_debut')
+    date_fin = request.query_params.get('date_fin')
+    try:
+        date_debut = date.fromisoformat(date_debut) if date_debut else timezone.now().date()
+        date_fin = date.fromisoformat(date_fin) if date_fin else date_debut + timedelta(days=6)
+    except ValueError:
+        return Response(
+            {'error': 'Format de date invalide (format: YYYY-MM-DD)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if date_fin < date_debut or (date_fin - date_debut).days >= JOURS_MAX_CALENDRIER:
+        return Response(
+            {'error': f'Période invalide (au plus {JOURS_MAX_CALENDRIER} jours)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    emplacements = Emplacement.objects.order_by('nom_emplacement')
+    franchise = None
+    if not request.user.is_staff:
+        franchise = getattr(request.user, 'franchise', None)
+        if not franchise:
+            return Response({'error': 'Utilisateur non associé à une franchise'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        emplacements = emplacements.filter(franchises_autorisees=franchise)
+    if request.query_params.get('type_zone'):
+        emplacements = emplacements.filter(type_zone=request.query_params.get('type_zone'))
+    if request.query_params.get('ville'):
+        emplacements = emplacements.filter(ville__iexact=request.query_params.get('ville'))
+    emplacements = list(emplacements.values(
+        'id', 'nom_emplacement', 'ville', 'type_zone', 'tarif_journalier', 'horaires_autorises'
+    ))
+    
+    calendrier = Emplacement.calendrier_occupation(
+        [emplacement['id'] for emplacement in emplacements], date_debut, date_fin
+    )
+    
+    def creneau(affectation):
+        visible = franchise is None or affectation.camion.franchise_id == franchise.id
+        return {
+            'affectation': affectation.id if visible else None,
+            'camion': affectation.camion.numero_camion if visible else None,
+            'horaire_debut': affectation.horaire_debut,
+            'horaire_fin': affectation.horaire_fin,
+            'statut': affectation.statut,
+        }
+    
+    return Response({
+        'date_debut': date_debut,
+        'date_fin': date_fin,
+        'jours': [date_debut + timedelta(days=i) for i in range((date_fin - date_debut).days + 1)],
+        'emplacements': [
+            {
+                **emplacement,
+                'jours_libres': sum(1 for jour in calendrier[emplacement['id']] if not jour),
+                'occupation': [[creneau(a) for a in jour] for jour in calendrier[emplacement['id']]],
+            }
+            for emplacement in emplacements
+        ]
+    })
+
+
 class CamionListCreateView(generics.ListCreateAPIView):
     """Liste et création des camions"""
     queryset = Camion.objects.all()
@@ -153,6 +303,7 @@ class AffectationListCreateView(generics.ListCreateAPIView):
     queryset = AffectationEmplacement.objects.all()
     serializer_class = AffectationEmplacementSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    pagination_class = AffectationPagination
 
 
 class AffectationDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -162,15 +313,57 @@ class AffectationDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
 
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def planning_affectations(request):
+    """Contrôle d'un planning d'affectations (plusieurs camions, plusieurs jours) en un passage
+    
+    Renvoie les lignes en conflit (emplacement ou camion déjà occupé, franchise non
+    autorisée, période incohérente). Avec "enregistrer": true, le planning est créé en
+    une transaction s'il ne contient aucun conflit. Franchisé : ses camions uniquement.
+    """
+    if request.user.is_staff:
+        franchise = None
+    elif hasattr(request.user, 'franchise'):
+        franchise = request.user.franchise
+    else:
+        return Response(
+            {'error': 'Utilisateur non associé à une franchise'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    serializer = AffectationPlanningSerializer(data=request.data, context={'franchise': franchise})
+    serializer.is_valid(raise_exception=True)
+    
+    nombre = len(serializer.validated_data['affectations'])
+    if serializer.validated_data['enregistrer']:
+        try:
+            affectations = serializer.save()
+        except DjangoValidationError as e:
+            return Response({
+                'valide': False,
+                'affectations': nombre,
+                'conflits': _conflits_planning(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'message': f'{len(affectations)} affectation(s) créée(s)',
+            'affectations': AffectationEmplacementSerializer(affectations, many=True).data
+        }, status=status.HTTP_201_CREATED)
+    
+    conflits = serializer.conflits()
+    return Response({'valide': not conflits, 'affectations': nombre, 'conflits': conflits})
+
+
 # ===============================================
 # GESTION DES PRODUITS ET STOCKS (Admin)
 # ===============================================
 
-class CategorieListCreateView(generics.ListCreateAPIView):
+class CategorieListCreateView(CacheReferenceMixin, generics.ListCreateAPIView):
     """Liste et création des catégories"""
     queryset = CategorieProduit.objects.all()
     serializer_class = CategorieProduitSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    ressources_cache = ['categories']
 
 
 class CategorieDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -180,11 +373,12 @@ class CategorieDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
 
 
-class ProduitListCreateView(generics.ListCreateAPIView):
+class ProduitListCreateView(CacheReferenceMixin, generics.ListCreateAPIView):
     """Liste et création des produits"""
     queryset = Produit.objects.all()
     serializer_class = ProduitSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ressources_cache = ['produits']
 
 
 class ProduitDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -199,6 +393,7 @@ class StockEntrepotListCreateView(generics.ListCreateAPIView):
     queryset = StockEntrepot.objects.all()
     serializer_class = StockEntrepotSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StockPagination
     
     def get_queryset(self):
         """Filtrage par entrepôt et alertes"""
@@ -250,6 +445,7 @@ class VenteFranchiseViewSet(viewsets.ModelViewSet):
     queryset = VenteFranchise.objects.all().select_related('franchise')
     serializer_class = VenteFranchiseSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminOrOwner]
+    pagination_class = VentePagination
     
     def get_queryset(self):
         queryset = self.queryset
@@ -261,12 +457,71 @@ class VenteFranchiseViewSet(viewsets.ModelViewSet):
         return queryset.order_by('-date_vente')
 
 
+def _lire_csv_ventes(fichier):
+    """Lignes d'un export de caisse CSV (séparateur , ou ;, décimales . ou ,)"""
+    contenu = fichier.read().decode('utf-8-sig')
+    try:
+        dialecte = csv.Sniffer().sniff(contenu.split('\n', 1)[0], delimiters=',;')
+    except csv.Error:
+        dialecte = csv.excel
+    
+    lignes = []
+    for ligne in csv.DictReader(io.StringIO(contenu), dialect=dialecte):
+        ligne = {cle.strip(): valeur.strip() for cle, valeur in ligne.items() if cle and valeur and valeur.strip()}
+        if 'chiffre_affaires_jour' in ligne:
+            ligne['chiffre_affaires_jour'] = ligne['chiffre_affaires_jour'].replace(',', '.')
+        lignes.append(ligne)
+    return lignes
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def import_ventes(request):
+    """Import en masse des ventes quotidiennes (fichier CSV 'fichier' ou JSON)
+    
+    Admin : chaque ligne indique sa franchise. Franchisé : toutes les lignes sont
+    rattachées à sa franchise. Une vente existante pour le même jour est remplacée.
+    """
+    if request.user.is_staff:
+        franchise = None
+    elif hasattr(request.user, 'franchise'):
+        franchise = request.user.franchise
+    else:
+        return Response(
+            {'error': 'Utilisateur non associé à une franchise'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    if 'fichier' in request.FILES:
+        try:
+            ventes = _lire_csv_ventes(request.FILES['fichier'])
+        except (UnicodeDecodeError, csv.Error):
+            return Response(
+                {'error': 'Fichier CSV illisible (encodage UTF-8 attendu)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    elif isinstance(request.data, list):
+        ventes = request.data
+    else:
+        ventes = request.data.get('ventes')
+    
+    serializer = VenteImportSerializer(data={'ventes': ventes}, context={'franchise': franchise})
+    serializer.is_valid(raise_exception=True)
+    nombre = serializer.save()
+    
+    return Response({
+        'message': f'{nombre} vente(s) importée(s)',
+        'ventes_importees': nombre
+    }, status=status.HTTP_201_CREATED)
+
+
 # ===============================================
 # VUES UTILITAIRES ET RAPPORTS
 # ===============================================
 class AdminCommandesListCreateView(generics.ListCreateAPIView):
     """Liste et création des commandes multi-entrepôts (admin uniquement)"""
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CommandePagination
     
     def get_queryset(self):
         # Vérifier que l'utilisateur est admin
@@ -274,11 +529,7 @@ class AdminCommandesListCreateView(generics.ListCreateAPIView):
             return CommandeFranchise.objects.none()
         
         # Retourner toutes les commandes avec tous les détails
-        queryset = CommandeFranchise.objects.all().prefetch_related(
-            'details__produit',
-            'details__entrepot_livraison',
-            'franchise'
-        )
+        queryset = CommandeFranchise.objects.avec_details_complets()
         
         # Filtres optionnels
         statut = self.request.query_params.get('statut')
@@ -291,15 +542,9 @@ class AdminCommandesListCreateView(generics.ListCreateAPIView):
         
         # Filtre par conformité 80/20
         conforme_80_20 = self.request.query_params.get('conforme_80_20')
-        if conforme_80_20 is not None:
-            # Appliquer le filtre après avoir récupéré les objets
-            # car la conformité est calculée dynamiquement
-            queryset_list = list(queryset)
-            if conforme_80_20 == 'false':
-                queryset_list = [cmd for cmd in queryset_list if not cmd.respecte_regle_80_20()[0]]
-            elif conforme_80_20 == 'true':
-                queryset_list = [cmd for cmd in queryset_list if cmd.respecte_regle_80_20()[0]]
-            return queryset_list
+        if conforme_80_20 in ('true', 'false'):
+            # La conformité est stockée (et indexée) sur la commande
+            queryset = queryset.filter(conforme_80_20=(conforme_80_20 == 'true'))
         
         return queryset.order_by('-date_commande')
     
@@ -328,11 +573,7 @@ class AdminCommandesDetailView(generics.RetrieveUpdateDestroyAPIView):
             return CommandeFranchise.objects.none()
         
         # Retourner toutes les commandes avec tous les détails
-        return CommandeFranchise.objects.all().prefetch_related(
-            'details__produit',
-            'details__entrepot_livraison',
-            'franchise'
-        )
+        return CommandeFranchise.objects.avec_details_complets()
     
     def get_serializer_class(self):
         """Utiliser différents serializers selon l'action"""
@@ -377,7 +618,8 @@ from django.db import transaction
 @transaction.atomic
 def admin_valider_commande(request, pk):
     """Valider une commande (admin ou franchisé propriétaire)"""
-    commande = get_object_or_404(CommandeFranchise, pk=pk)
+    # Verrou sur la commande : deux validations concurrentes ne réservent pas deux fois
+    commande = get_object_or_404(CommandeFranchise.objects.select_for_update(), pk=pk)
     
     # Vérifier l'accès
     if hasattr(request.user, 'franchise') and commande.franchise != request.user.franchise:
@@ -395,8 +637,7 @@ def admin_valider_commande(request, pk):
         )
     
     # Recalculer et vérifier la règle 80/20
-    commande.calculer_montants()
-    commande.save()
+    commande.enregistrer_montants()
     
     conforme, pourcentage_drivn, message = commande.respecte_regle_80_20()
     if not conforme:
@@ -412,27 +653,23 @@ def admin_valider_commande(request, pk):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    # Verrouiller en une requête les stocks de toutes les lignes (SELECT ... FOR UPDATE)
+    details = list(commande.details.select_related('produit', 'entrepot_livraison'))
+    stocks = StockEntrepot.verrouiller(
+        [(detail.produit_id, detail.entrepot_livraison_id) for detail in details]
+    )
+    
     # Vérifier les stocks pour chaque entrepôt de livraison
     stocks_insuffisants = []
-    for detail in commande.details.all():
-        try:
-            stock = StockEntrepot.objects.get(
-                produit=detail.produit,
-                entrepot=detail.entrepot_livraison
-            )
-            if stock.quantite_disponible < detail.quantite_commandee:
-                stocks_insuffisants.append({
-                    'produit': detail.produit.nom_produit,
-                    'entrepot': detail.entrepot_livraison.nom_entrepot,
-                    'demande': detail.quantite_commandee,
-                    'disponible': stock.quantite_disponible
-                })
-        except StockEntrepot.DoesNotExist:
+    for detail in details:
+        stock = stocks.get((detail.produit_id, detail.entrepot_livraison_id))
+        disponible = stock.quantite_disponible if stock else 0
+        if disponible < detail.quantite_commandee:
             stocks_insuffisants.append({
                 'produit': detail.produit.nom_produit,
                 'entrepot': detail.entrepot_livraison.nom_entrepot,
                 'demande': detail.quantite_commandee,
-                'disponible': 0
+                'disponible': disponible
             })
     
     if stocks_insuffisants:
@@ -446,17 +683,25 @@ def admin_valider_commande(request, pk):
     
     # Validation réussie : diminuer les stocks et passer en validée
     commande.statut = 'validee'
-    commande.save()
+    commande.save(update_fields=['statut', 'updated_at'])
     
-    # Diminuer les stocks disponibles dans chaque entrepôt
-    for detail in commande.details.all():
-        stock = StockEntrepot.objects.get(
-            produit=detail.produit,
-            entrepot=detail.entrepot_livraison
-        )
+    # Réserver les quantités sur les lignes verrouillées : un seul UPDATE groupé
+    maintenant = timezone.now()
+    reserves = []
+    for detail in details:
+        stock = stocks.get((detail.produit_id, detail.entrepot_livraison_id))
+        if stock is None:
+            # Sans ligne de stock, seule une quantité nulle passe le contrôle : rien à réserver
+            continue
         stock.quantite_disponible -= detail.quantite_commandee
         stock.quantite_reservee += detail.quantite_commandee
-        stock.save()
+        stock.updated_at = maintenant
+        reserves.append(stock)
+    StockEntrepot.objects.bulk_update(
+        reserves, ['quantite_disponible', 'quantite_reservee', 'updated_at']
+    )
+    # bulk_update ne déclenche pas post_save : invalider le cache des stocks
+    invalider('stocks')
     
     return Response({
         'message': 'Commande validée avec succès',
@@ -498,38 +743,96 @@ def admin_marquer_livree(request, pk):
         return Response({'error': 'Seuls les admins peuvent marquer les commandes comme livrées'}, 
                        status=status.HTTP_403_FORBIDDEN)
     
-    commande = get_object_or_404(CommandeFranchise, pk=pk)
+    # 🎯 LIBÉRER LES STOCKS RÉSERVÉS : verrou de la commande, changement de statut et un seul
+    # UPDATE groupé des réservations (nombre de requêtes indépendant du nombre de lignes)
+    resultat, = CommandeFranchise.livrer_en_lot([pk])
+    if resultat['statut'] is None:
+        return Response({'error': resultat['error']}, status=status.HTTP_404_NOT_FOUND)
+    if not resultat['succes']:
+        return Response({'error': resultat['error']}, status=status.HTTP_400_BAD_REQUEST)
     
-    if commande.statut != 'preparee':
-        return Response(
-            {'error': 'Seules les commandes préparées peuvent être marquées comme livrées'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    return Response({'message': 'Commande marquée comme livrée'})
+
+
+def _traiter_commandes_en_lot(request, traitement):
+    """Applique un traitement en lot (CommandeFranchise.*_en_lot) aux commandes demandées"""
+    if not request.user.is_staff:
+        return Response({'error': 'Seuls les admins peuvent traiter les commandes en lot'},
+                       status=status.HTTP_403_FORBIDDEN)
     
-    # 🎯 LIBÉRER LES STOCKS RÉSERVÉS (SI GÉRÉ)
-    for detail in commande.details.all():
-        try:
-            stock = StockEntrepot.objects.get(
-                produit=detail.produit,
-                entrepot=detail.entrepot_livraison
-            )
-            # Diminuer la quantité réservée si ce champ est géré
-            if hasattr(stock, 'quantite_reservee'):
-                stock.quantite_reservee -= detail.quantite_commandee
-            stock.save()
-        except StockEntrepot.DoesNotExist:
-            pass
-    
-    commande.statut = 'livree'
-    commande.save()
+    serializer = CommandesLotSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
     
-    return Response({'message': 'Commande marquée comme livrée'})
+    resultats = traitement(serializer.validated_data['ids'])
+    reussies = sum(1 for resultat in resultats if resultat['succes'])
+    return Response({
+        'traitees': reussies,
+        'echecs': len(resultats) - reussies,
+        'resultats': resultats
+    })
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_valider_commandes(request):
+    """Valider une liste de commandes : 80/20 et stocks contrôlés ensemble, résultat par commande"""
+    return _traiter_commandes_en_lot(request, CommandeFranchise.valider_en_lot)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_preparer_commandes(request):
+    """Marquer une liste de commandes validées comme préparées"""
+    return _traiter_commandes_en_lot(request, CommandeFranchise.preparer_en_lot)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_livrer_commandes(request):
+    """Marquer une liste de commandes préparées comme livrées (réservations libérées)"""
+    return _traiter_commandes_en_lot(request, CommandeFranchise.livrer_en_lot)
+
+# Nombre maximum de commandes listées par groupe dans la réponse JSON du rapport 80/20
+LIMITE_RAPPORT_80_20 = 200
+
+
+def _lignes_rapport_80_20(queryset, limite=None):
+    """Lignes du rapport 80/20 (les plus récentes d'abord), lues par paquets sans instancier les commandes"""
+    lignes = queryset.avec_nombre_entrepots().values_list(
+        'numero_commande', 'franchise__nom_franchise', 'date_commande', 'montant_total',
+        'montant_drivn_cook', 'montant_fournisseur_libre', 'conforme_80_20',
+        'nb_entrepots_drivn_cook', 'nb_entrepots_fournisseur_libre'
+    ).order_by('-date_commande', '-id')
+    if limite is not None:
+        lignes = lignes[:limite]
+    
+    for (numero, franchise, date_commande, total, drivn_cook, fournisseur_libre, conforme,
+         nb_drivn_cook, nb_fournisseur_libre) in lignes.iterator(chunk_size=2000):
+        _, pourcentage_drivn, message = analyser_regle_80_20(
+            total, drivn_cook, fournisseur_libre, nb_drivn_cook, nb_fournisseur_libre
+        )
+        yield {
+            'numero_commande': numero,
+            'franchise': franchise,
+            'date_commande': date_commande,
+            'montant_total': float(total),
+            'pourcentage_drivn_cook': float(pourcentage_drivn),
+            'conforme': conforme,
+            'message': message
+        }
+
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def rapport_conformite_80_20(request):
-    """Rapport de conformité à la règle 80/20 sur une période"""
-    queryset = CommandeFranchise.objects.select_related('franchise').prefetch_related('details')
+    """Rapport de conformité à la règle 80/20 sur une période
+    
+    Les statistiques viennent d'une seule requête d'agrégat sur la conformité enregistrée
+    sur chaque commande. En JSON, chaque groupe de commandes est limité (?limite=N, de 1 à 200,
+    200 par défaut) et signalé dans « tronque » s'il est incomplet ; avec ?sortie=ndjson toutes les commandes sont envoyées en flux, une par ligne,
+    après une première ligne contenant période et statistiques.
+    """
+    queryset = CommandeFranchise.objects.all()
     
     # Filtrage pour franchisés
     if hasattr(request.user, 'franchise'):
@@ -543,47 +846,170 @@ def rapport_conformite_80_20(request):
     if date_fin:
         queryset = queryset.filter(date_commande__lte=date_fin)
     
-    # Analyse
-    commandes_conformes = []
-    commandes_non_conformes = []
+    entete = {
+        'periode': {
+            'date_debut': date_debut,
+            'date_fin': date_fin
+        },
+        'statistiques': queryset.statistiques_80_20()
+    }
     
-    for commande in queryset:
-        commande.calculer_montants()
-        conforme, message = commande.respecte_regle_80_20()
-        
-        data = {
-            'numero_commande': commande.numero_commande,
-            'franchise': commande.franchise.nom_franchise,
-            'date_commande': commande.date_commande,
-            'montant_total': float(commande.montant_total),
-            'pourcentage_drivn_cook': commande.pourcentage_drivn_cook,
-            'message': message
-        }
+    if request.query_params.get('sortie') == 'ndjson':
+        def flux():
+            yield json.dumps(entete, cls=DjangoJSONEncoder) + '\n'
+            for ligne in _lignes_rapport_80_20(queryset):
+                yield json.dumps(ligne, cls=DjangoJSONEncoder) + '\n'
         
-        if conforme:
-            commandes_conformes.append(data)
-        else:
-            commandes_non_conformes.append(data)
+        return StreamingHttpResponse(flux(), content_type='application/x-ndjson')
     
-    total_commandes = len(commandes_conformes) + len(commandes_non_conformes)
-    taux_conformite = (len(commandes_conformes) / total_commandes * 100) if total_commandes > 0 else 0
+    try:
+        limite = min(int(request.query_params.get('limite', LIMITE_RAPPORT_80_20)), LIMITE_RAPPORT_80_20)
+    except ValueError:
+        limite = 0
+    if limite < 1:
+        return Response(
+            {'error': f'Paramètre limite invalide (entier de 1 à {LIMITE_RAPPORT_80_20})'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
+    statistiques = entete['statistiques']
     return Response({
-        'periode': {
-            'date_debut': date_debut,
-            'date_fin': date_fin
-        },
-        'statistiques': {
-            'total_commandes': total_commandes,
-            'commandes_conformes': len(commandes_conformes),
-            'commandes_non_conformes': len(commandes_non_conformes),
-            'taux_conformite': round(taux_conformite, 2)
+        **entete,
+        'limite': limite,
+        # Groupes incomplets : totaux dans statistiques, liste complète avec ?sortie=ndjson
+        'tronque': {
+            'commandes_conformes': statistiques['commandes_conformes'] > limite,
+            'commandes_non_conformes': statistiques['commandes_non_conformes'] > limite
         },
-        'commandes_conformes': commandes_conformes,
-        'commandes_non_conformes': commandes_non_conformes
+        'commandes_conformes': list(_lignes_rapport_80_20(queryset.filter(conforme_80_20=True), limite)),
+        'commandes_non_conformes': list(_lignes_rapport_80_20(queryset.filter(conforme_80_20=False), limite))
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def rapport_chiffre_affaires(request):
+    """Chiffre d'affaires et redevances par semaine, mois ou année (?periode=, mois par défaut)
+    
+    Lu dans les cumuls de ventes : une ligne par franchise et par période, quel que soit
+    le nombre de jours couverts. Filtres : ?franchise= (admin), ?date_debut=, ?date_fin=.
+    """
+    periode = request.query_params.get('periode', 'mois')
+    if periode not in dict(CumulVentes.PERIODE_CHOICES):
+        return Response(
+            {'error': 'Paramètre periode invalide (semaine, mois ou annee)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    queryset = CumulVentes.objects.filter(periode=periode)
+    
+    # Filtrage pour franchisés
+    if not request.user.is_staff:
+        if not hasattr(request.user, 'franchise'):
+            return Response({'error': 'Utilisateur non associé à une franchise'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.filter(franchise=request.user.franchise)
+    
+    # ?franchise= (admin) et bornes sur le premier jour de chaque période, contrôlés comme les exports
+    try:
+        queryset = _filtrer_export(
+            queryset, request, 'debut', champ_franchise='franchise_id' if request.user.is_staff else None
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    lignes = list(queryset.order_by('debut', 'franchise__nom_franchise').values(
+        'franchise', 'franchise__nom_franchise', 'debut', 'chiffre_affaires', 'redevance',
+        'nombre_transactions', 'nombre_jours'
+    ))
+    totaux = queryset.aggregate(
+        chiffre_affaires=Sum('chiffre_affaires'),
+        redevance=Sum('redevance'),
+        nombre_transactions=Sum('nombre_transactions')
+    )
+    
+    return Response({
+        'periode': periode,
+        'totaux': {cle: valeur or 0 for cle, valeur in totaux.items()},
+        'cumuls': [
+            {
+                'franchise': ligne['franchise'],
+                'franchise_nom': ligne['franchise__nom_franchise'],
+                'debut': ligne['debut'],
+                'chiffre_affaires': ligne['chiffre_affaires'],
+                'redevance': ligne['redevance'],
+                'nombre_transactions': ligne['nombre_transactions'],
+                'nombre_jours': ligne['nombre_jours'],
+            }
+            for ligne in lignes
+        ]
     })
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, permissions.IsAdminUser])
+def rapports_ventes_mensuels(request):
+    """Archive zip des rapports de ventes PDF du mois pour toutes les franchises (?mois=YYYY-MM)
+    
+    Aucun PDF n'est rendu dans la requête : chaque rapport passe par la file des tâches
+    TacheRapportPDF (worker traiter_rapports_pdf, ou pool du processus web). Tant qu'un
+    rapport est en attente, réponse 202 avec l'avancement : rappeler la même URL. Quand
+    tous sont traités, l'archive est assemblée depuis le cache disque ; les rapports en
+    erreur sont listés dans erreurs.txt. ?franchise= (répétable) limite la liste. Pour
+    une clôture de mois complète hors HTTP : commande generer_rapports_mensuels.
+    """
+    try:
+        annee, mois = request.query_params.get('mois', '').split('-')
+        premier_jour = date(int(annee), int(mois), 1)
+    except ValueError:
+        return Response(
+            {'error': 'Paramètre mois requis (format: YYYY-MM)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    franchises = None
+    if request.query_params.getlist('franchise'):
+        try:
+            franchise_ids = [int(pk) for pk in request.query_params.getlist('franchise')]
+        except ValueError:
+            return Response(
+                {'error': 'Paramètre franchise invalide'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        franchises = Franchise.objects.filter(pk__in=franchise_ids)
+    
+    taches = demander_rapports_du_mois(premier_jour, franchises)
+    statuts = Counter(tache.statut for tache in taches)
+    if statuts['en_attente'] or statuts['en_cours']:
+        return Response({
+            'mois': f'{premier_jour:%Y-%m}',
+            'total': len(taches),
+            'termines': statuts['termine'],
+            'en_erreur': statuts['erreur'],
+            'taches': [
+                {'id': tache.id, 'franchise': tache.franchise_id, 'franchise_nom': tache.franchise.nom_franchise,
+                 'statut': tache.statut}
+                for tache in taches
+            ],
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    rapports = list(rapports_des_taches(taches))
+    erreurs = [tache for tache in taches if tache.statut == 'erreur']
+    if erreurs:
+        rapports.append((None, 'erreurs.txt', '\n'.join(
+            f'{tache.franchise.nom_franchise} ({tache.franchise_id}) : {tache.erreur}' for tache in erreurs
+        ).encode()))
+    archive = tempfile.TemporaryFile()
+    zipper_rapports(rapports, archive)
+    archive.seek(0)
+    return FileResponse(
+        archive,
+        as_attachment=True,
+        filename=f'rapports_ventes_{premier_jour:%Y-%m}.zip',
+        content_type='application/zip'
+    )
+
+
 class DashboardViewSet(viewsets.ViewSet):
     """Tableau de bord et statistiques"""
     permission_classes = [permissions.IsAuthenticated]
@@ -592,25 +1018,19 @@ class DashboardViewSet(viewsets.ViewSet):
     def stats_generales(self, request):
         """Statistiques générales (Admin) ou personnelles (Franchisé)"""
         if request.user.is_superuser:
-            # Stats admin globales
-            total_commandes = CommandeFranchise.objects.count()
-            commandes_conformes = sum(
-                1 for cmd in CommandeFranchise.objects.all() 
-                if cmd.respecte_regle_80_20()[0]
-            )
+            # Stats admin globales (ligne globale des tableaux de bord)
+            tableau = TableauDeBord.obtenir()
             
             stats = {
-                'franchises_actives': Franchise.objects.filter(statut='actif').count(),
-                'entrepots_drivn_cook': Entrepot.objects.filter(type_entrepot='drivn_cook', statut='actif').count(),
-                'fournisseurs_libres': Entrepot.objects.filter(type_entrepot='fournisseur_libre', statut='actif').count(),
-                'camions_disponibles': Camion.objects.filter(statut='disponible').count(),
-                'commandes_en_attente': CommandeFranchise.objects.filter(statut='en_attente').count(),
-                'alertes_stock': StockEntrepot.objects.filter(
-                    quantite_disponible__lte=F('seuil_alerte')
-                ).count(),
-                'total_commandes': total_commandes,
-                'commandes_conformes_80_20': commandes_conformes,
-                'taux_conformite_80_20': round((commandes_conformes / total_commandes * 100), 2) if total_commandes > 0 else 0
+                'franchises_actives': tableau.franchises_actives,
+                'entrepots_drivn_cook': tableau.entrepots_drivn_cook,
+                'fournisseurs_libres': tableau.fournisseurs_libres,
+                'camions_disponibles': tableau.camions_disponibles,
+                'commandes_en_attente': tableau.commandes_en_attente,
+                'alertes_stock': tableau.alertes_stock,
+                'total_commandes': tableau.commandes_total,
+                'commandes_conformes_80_20': tableau.commandes_conformes_80_20,
+                'taux_conformite_80_20': tableau.taux_conformite_80_20
             }
         else:
             # Stats franchisé
@@ -619,22 +1039,171 @@ class DashboardViewSet(viewsets.ViewSet):
                 return Response({'error': 'Utilisateur non associé à une franchise'}, 
                               status=status.HTTP_400_BAD_REQUEST)
             
-            mes_commandes = CommandeFranchise.objects.filter(franchise=franchise)
-            commandes_conformes = sum(1 for cmd in mes_commandes if cmd.respecte_regle_80_20()[0])
+            tableau = TableauDeBord.obtenir(franchise)
             
             stats = {
-                'mes_camions': Camion.objects.filter(franchise=franchise).count(),
-                'mes_commandes_en_cours': CommandeFranchise.objects.filter(
-                    franchise=franchise, statut__in=['en_attente', 'validee', 'preparee']
-                ).count(),
-                'mes_commandes_total': mes_commandes.count(),
-                'mes_commandes_conformes': commandes_conformes,
-                'mon_taux_conformite_80_20': round((commandes_conformes / mes_commandes.count() * 100), 2) if mes_commandes.count() > 0 else 0,
-                'ca_mois_courant': VenteFranchise.objects.filter(
+                'mes_camions': tableau.camions_total,
+                'mes_commandes_en_cours': tableau.commandes_en_cours,
+                'mes_commandes_total': tableau.commandes_total,
+                'mes_commandes_conformes': tableau.commandes_conformes_80_20,
+                'mon_taux_conformite_80_20': tableau.taux_conformite_80_20,
+                'ca_mois_courant': CumulVentes.objects.filter(
                     franchise=franchise,
-                    date_vente__month=timezone.now().month,
-                    date_vente__year=timezone.now().year
-                ).aggregate(total=Sum('chiffre_affaires_jour'))['total'] or 0,
+                    periode='mois',
+                    debut=timezone.now().date().replace(day=1)
+                ).values_list('chiffre_affaires', flat=True).first() or 0,
             }
         
-        return Response(stats)
\ No newline at end of file
+        return Response(stats)
+
+# ===============================================
+# EXPORTS COMPTABLES (CSV / NDJSON en flux)
+# ===============================================
+
+class _TamponEcho:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne écrite au lieu de la stocker"""
+    def write(self, valeur):
+        return valeur
+
+
+def _reponse_export(request, nom_fichier, colonnes, lignes):
+    """Réponse en flux : les lignes sont écrites au fur et à mesure de leur lecture
+    
+    ?sortie=csv (défaut) ou ?sortie=ndjson. lignes est un itérable de tuples dans
+    l'ordre des colonnes (values_list(...).iterator()).
+    """
+    sortie = request.query_params.get('sortie', 'csv')
+    
+    if sortie == 'ndjson':
+        flux = (
+            json.dumps(dict(zip(colonnes, ligne)), cls=DjangoJSONEncoder) + '\n'
+            for ligne in lignes
+        )
+        reponse = StreamingHttpResponse(flux, content_type='application/x-ndjson')
+        extension = 'ndjson'
+    elif sortie == 'csv':
+        writer = csv.writer(_TamponEcho())
+        flux = itertools.chain([writer.writerow(colonnes)], (writer.writerow(ligne) for ligne in lignes))
+        reponse = StreamingHttpResponse(flux, content_type='text/csv; charset=utf-8')
+        extension = 'csv'
+    else:
+        return Response(
+            {'error': 'Paramètre sortie invalide (csv ou ndjson)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    reponse['Content-Disposition'] = f'attachment; filename="{nom_fichier}.{extension}"'
+    return reponse
+
+
+def _entier_export(request, nom):
+    """Identifiant passé en filtre d'export (None si absent) ; ValueError si invalide"""
+    valeur = request.query_params.get(nom)
+    if not valeur:
+        return None
+    try:
+        return int(valeur)
+    except ValueError:
+        raise ValueError(f'Paramètre {nom} invalide')
+
+
+def _filtrer_export(queryset, request, champ_date, champ_franchise='franchise_id', champ_statut=None):
+    """Filtres communs des exports : ?franchise=, ?date_debut=, ?date_fin=, ?statut=
+    
+    Les paramètres sont contrôlés ici, avant l'envoi du flux : une erreur levée pendant
+    l'itération couperait une réponse 200 déjà commencée. ValueError si un filtre est invalide.
+    """
+    franchise_id = _entier_export(request, 'franchise')
+    if franchise_id is not None and champ_franchise:
+        queryset = queryset.filter(**{champ_franchise: franchise_id})
+    
+    for nom, operateur in (('date_debut', 'gte'), ('date_fin', 'lte')):
+        valeur = request.query_params.get(nom)
+        if not valeur:
+            continue
+        try:
+            jour = parse_date(valeur)
+        except ValueError:
+            jour = None
+        if jour is None:
+            raise ValueError(f'Paramètre {nom} invalide (format: YYYY-MM-DD)')
+        queryset = queryset.filter(**{f'{champ_date}__{operateur}': jour})
+    
+    statut = request.query_params.get('statut')
+    if statut and champ_statut:
+        queryset = queryset.filter(**{champ_statut: statut})
+    
+    return queryset
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, permissions.IsAdminUser])
+def export_commandes(request):
+    """Export des commandes, une ligne par ligne de commande"""
+    colonnes = [
+        'numero_commande', 'franchise', 'date_commande', 'date_livraison_prevue', 'statut',
+        'montant_total', 'montant_drivn_cook', 'montant_fournisseur_libre', 'conforme_80_20',
+        'produit', 'entrepot_livraison', 'type_entrepot', 'quantite_commandee',
+        'prix_unitaire', 'sous_total'
+    ]
+    try:
+        queryset = _filtrer_export(
+            DetailCommande.objects.all(), request,
+            champ_date='commande__date_commande',
+            champ_franchise='commande__franchise_id',
+            champ_statut='commande__statut'
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    lignes = queryset.order_by('commande_id', 'id').values_list(
+        'commande__numero_commande', 'commande__franchise__nom_franchise', 'commande__date_commande',
+        'commande__date_livraison_prevue', 'commande__statut', 'commande__montant_total',
+        'commande__montant_drivn_cook', 'commande__montant_fournisseur_libre',
+        'commande__conforme_80_20', 'produit__nom_produit', 'entrepot_livraison__nom_entrepot',
+        'entrepot_livraison__type_entrepot', 'quantite_commandee', 'prix_unitaire', 'sous_total'
+    )
+    return _reponse_export(request, 'commandes', colonnes, lignes.iterator(chunk_size=2000))
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, permissions.IsAdminUser])
+def export_ventes(request):
+    """Export des ventes quotidiennes et redevances"""
+    colonnes = [
+        'franchise', 'date_vente', 'chiffre_affaires_jour', 'redevance_due', 'nombre_transactions'
+    ]
+    try:
+        queryset = _filtrer_export(VenteFranchise.objects.all(), request, champ_date='date_vente')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    lignes = queryset.order_by('date_vente', 'id').values_list(
+        'franchise__nom_franchise', 'date_vente', 'chiffre_affaires_jour', 'redevance_due',
+        'nombre_transactions'
+    )
+    return _reponse_export(request, 'ventes', colonnes, lignes.iterator(chunk_size=2000))
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, permissions.IsAdminUser])
+def export_stocks(request):
+    """Export des stocks par entrepôt (?entrepot=, période sur la dernière mise à jour)"""
+    colonnes = [
+        'entrepot', 'type_entrepot', 'produit', 'quantite_disponible', 'quantite_reservee',
+        'seuil_alerte', 'updated_at'
+    ]
+    try:
+        queryset = _filtrer_export(
+            StockEntrepot.objects.all(), request,
+            champ_date='updated_at__date',
+            champ_franchise=None
+        )
+        entrepot_id = _entier_export(request, 'entrepot')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if entrepot_id is not None:
+        queryset = queryset.filter(entrepot_id=entrepot_id)
+    lignes = queryset.order_by('entrepot_id', 'produit_id').values_list(
+        'entrepot__nom_entrepot', 'entrepot__type_entrepot', 'produit__nom_produit',
+        'quantite_disponible', 'quantite_reservee', 'seuil_alerte', 'updated_at'
+    )
+    return _reponse_export(request, 'stocks', colonnes, lignes.iterator(chunk_size=2000))
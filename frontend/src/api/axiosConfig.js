@@ -104,4 +104,23 @@ apiClient.interceptors.response.use(
   }
 );
 
+// Listes paginées par curseur ({ next, previous, results }) : toutes les pages, dans l'ordre.
+// Seul le curseur du lien "next" est repris, l'URL de base reste celle d'apiClient.
+export const PAGE_SIZE_MAX = 500;
+
+export const chargerToutesLesPages = async (url, config = {}) => {
+  const resultats = [];
+  let cursor;
+  do {
+    const { data } = await apiClient.get(url, {
+      ...config,
+      params: { ...config.params, page_size: PAGE_SIZE_MAX, ...(cursor ? { cursor } : {}) },
+    });
+    if (Array.isArray(data)) return data;
+    resultats.push(...(data?.results ?? []));
+    cursor = data?.next ? new URL(data.next).searchParams.get('cursor') : null;
+  } while (cursor);
+  return resultats;
+};
+
 export default apiClient;
\ No newline at end of file
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from "react";
 import { Navigation, Plus, Edit, Trash2, Search, Filter } from "lucide-react";
 import "./GestionAffectations.module.css";
-import apiClient from "../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../api/axiosConfig";
 
 const initialForm = {
   camion: "",
@@ -39,8 +39,7 @@ export default function GestionAffectations() {
     setLoading(true);
     setError(null);
     try {
-      const response = await apiClient.get("api/affectations/");
-      setAffectations(Array.isArray(response.data) ? response.data : []);
+      setAffectations(await chargerToutesLesPages("api/affectations/"));
     } catch (err) {
       setError("Erreur lors du chargement des affectations");
       setAffectations([]);
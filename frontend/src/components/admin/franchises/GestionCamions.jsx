@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from "react";
 import { Truck, Plus, Edit, Trash2, Search, Filter } from "lucide-react";
 import { useNavigate } from "react-router-dom";
-import apiClient from "../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../api/axiosConfig";
 import useAuthStore from "../../../store/authStore";
 import "./GestionCamions.css";
 
@@ -64,8 +64,7 @@ export default function GestionCamions() {
 
   const fetchFranchises = async () => {
     try {
-      const response = await apiClient.get("api/franchises/");
-      setFranchises(Array.isArray(response.data) ? response.data : []);
+      setFranchises(await chargerToutesLesPages("api/franchises/"));
     } catch (err) {
       console.error("Erreur lors du chargement des franchises");
     }
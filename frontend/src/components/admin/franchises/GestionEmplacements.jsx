@@ -15,7 +15,7 @@ import {
   ChevronUp,
 } from "lucide-react";
 import { useNavigate } from "react-router-dom";
-import apiClient from "../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../api/axiosConfig";
 import useAuthStore from "../../../store/authStore";
 import "./GestionEmplacements.css";
 
@@ -172,15 +172,13 @@ export default function GestionEmplacements() {
     try {
       const [emplacementsRes, franchisesRes] = await Promise.all([
         apiClient.get("api/emplacements/"),
-        apiClient.get("api/franchises/"),
+        chargerToutesLesPages("api/franchises/"),
       ]);
 
       setEmplacements(
         Array.isArray(emplacementsRes.data) ? emplacementsRes.data : []
       );
-      setFranchises(
-        Array.isArray(franchisesRes.data) ? franchisesRes.data : []
-      );
+      setFranchises(franchisesRes);
     } catch (err) {
       setError("Erreur lors du chargement des données");
       setEmplacements([]);
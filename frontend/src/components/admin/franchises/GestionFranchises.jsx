@@ -15,7 +15,7 @@ import {
   RefreshCw,
 } from "lucide-react";
 import { useNavigate } from "react-router-dom";
-import apiClient from "../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../api/axiosConfig";
 import useAuthStore from "../../../store/authStore";
 import "./GestionFranchises.css";
 
@@ -182,8 +182,7 @@ export default function GestionFranchises() {
     setLoading(true);
     setError(null);
     try {
-      const response = await apiClient.get("api/franchises/");
-      setFranchises(response.data);
+      setFranchises(await chargerToutesLesPages("api/franchises/"));
     } catch (err) {
       setError("Erreur lors du chargement des franchises");
       setFranchises([]);
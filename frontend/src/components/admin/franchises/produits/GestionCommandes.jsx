@@ -25,7 +25,7 @@ import {
 import { useNavigate } from "react-router-dom";
 import "./GestionCommandes.css";
 import useAuthStore from "../../../../store/authStore";
-import apiClient from "../../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../../api/axiosConfig";
 
 const initialCommandeForm = {
   franchise: "",
@@ -152,8 +152,7 @@ export default function GestionCommandes() {
     setLoading(true);
     setError(null);
     try {
-      const response = await apiClient.get("api/commandes/");
-      setCommandes(Array.isArray(response.data) ? response.data : []);
+      setCommandes(await chargerToutesLesPages("api/commandes/"));
     } catch (err) {
       setError("Erreur lors du chargement des commandes");
       setCommandes([]);
@@ -164,8 +163,7 @@ export default function GestionCommandes() {
 
   const fetchFranchises = async () => {
     try {
-      const response = await apiClient.get("api/franchises/");
-      setFranchises(Array.isArray(response.data) ? response.data : []);
+      setFranchises(await chargerToutesLesPages("api/franchises/"));
     } catch (err) {
       console.error("Erreur lors du chargement des franchises");
     }
@@ -191,8 +189,7 @@ export default function GestionCommandes() {
 
   const fetchStocks = async () => {
     try {
-      const response = await apiClient.get("api/stocks/");
-      setStocks(Array.isArray(response.data) ? response.data : []);
+      setStocks(await chargerToutesLesPages("api/stocks/"));
     } catch (err) {
       console.error("Erreur lors du chargement des stocks");
     }
@@ -12,7 +12,7 @@ import {
 import { useNavigate } from "react-router-dom";
 import "./GestionProduits.css";
 import useAuthStore from "../../../../store/authStore";
-import apiClient from "../../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../../api/axiosConfig";
 
 const initialForm = {
   nom_produit: "",
@@ -112,8 +112,7 @@ export default function GestionProduits() {
 
   const fetchStocks = async () => {
     try {
-      const response = await apiClient.get("api/stocks/");
-      setStocks(Array.isArray(response.data) ? response.data : []);
+      setStocks(await chargerToutesLesPages("api/stocks/"));
     } catch (err) {
       console.error("Erreur lors du chargement des stocks");
     }
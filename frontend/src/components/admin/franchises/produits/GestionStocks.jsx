@@ -11,7 +11,7 @@ import {
 import { useNavigate } from "react-router-dom";
 import "./GestionStocks.css";
 import useAuthStore from "../../../../store/authStore";
-import apiClient from "../../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../../api/axiosConfig";
 
 const initialForm = {
   produit: "",
@@ -51,8 +51,7 @@ export default function GestionStocks() {
     setLoading(true);
     setError(null);
     try {
-      const response = await apiClient.get("api/stocks/");
-      setStocks(Array.isArray(response.data) ? response.data : []);
+      setStocks(await chargerToutesLesPages("api/stocks/"));
     } catch (err) {
       setError("Erreur lors du chargement des stocks");
       setStocks([]);
@@ -16,7 +16,7 @@ import {
 import { useLocation } from "react-router-dom";
 import "./MesAffectations.css";
 import useAuthStore from "../../../store/authStore";
-import apiClient from "../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../api/axiosConfig";
 
 const MesAffectations = () => {
   const [affectations, setAffectations] = useState([]);
@@ -135,8 +135,7 @@ const MesAffectations = () => {
   // ===== FONCTIONS DE CHARGEMENT DES DONNÉES =====
   const fetchAffectations = async () => {
     try {
-      const response = await apiClient.get("/api_user/affectations/");
-      setAffectations(Array.isArray(response.data) ? response.data : []);
+      setAffectations(await chargerToutesLesPages("/api_user/affectations/"));
     } catch (err) {
       console.error("Erreur lors du chargement des affectations:", err);
     }
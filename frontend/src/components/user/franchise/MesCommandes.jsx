@@ -20,7 +20,7 @@ import {
 } from "lucide-react";
 import "./MesCommandes.css";
 import useAuthStore from "../../../store/authStore";
-import apiClient from "../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../api/axiosConfig";
 import FranchiseNavigation from "./FranchiseNavigation";
 
 const initialCommandeForm = {
@@ -133,8 +133,7 @@ export default function MesCommandes() {
     setLoading(true);
     setError(null);
     try {
-      const response = await apiClient.get("api_user/mes-commandes/");
-      setCommandes(Array.isArray(response.data) ? response.data : []);
+      setCommandes(await chargerToutesLesPages("api_user/mes-commandes/"));
     } catch (err) {
       setError("Erreur lors du chargement de vos commandes");
       setCommandes([]);
@@ -163,8 +162,7 @@ export default function MesCommandes() {
 
   const fetchStocks = async () => {
     try {
-      const response = await apiClient.get("api/stocks/");
-      setStocks(Array.isArray(response.data) ? response.data : []);
+      setStocks(await chargerToutesLesPages("api/stocks/"));
     } catch (err) {
       console.error("Erreur lors du chargement des stocks");
     }
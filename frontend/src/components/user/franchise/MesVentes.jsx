@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import {
   DollarSign,
   TrendingUp,
@@ -16,7 +16,11 @@ import {
 } from "lucide-react";
 import "./MesVentes.css";
 import useAuthStore from "../../../store/authStore";
-import apiClient from "../../../api/axiosConfig";
+import apiClient, { chargerToutesLesPages } from "../../../api/axiosConfig";
+
+// Suivi d'une tâche de rapport PDF : intervalle de scrutation et durée maximale
+const RAPPORT_INTERVALLE_MS = 1000;
+const RAPPORT_DUREE_MAX_MS = 2 * 60 * 1000;
 
 const MesVentes = () => {
   const [ventes, setVentes] = useState([]);
@@ -43,6 +47,8 @@ const MesVentes = () => {
     nombre_transactions: "",
   });
   const isAuthenticated = useAuthStore((state) => state.isAuthenticated);
+  // Annule le suivi du rapport en cours si le composant est démonté
+  const rapportAbortRef = useRef(null);
 
   // ===== FONCTIONS UTILITAIRES =====
   const formatDate = (dateString) => {
@@ -121,17 +127,14 @@ const MesVentes = () => {
   // ===== FONCTIONS DE CHARGEMENT DES DONNÉES =====
   const fetchVentes = async (params = {}) => {
     try {
-      const queryParams = new URLSearchParams();
+      const filtres = {};
 
-      if (params.date_debut)
-        queryParams.append("date_debut", params.date_debut);
-      if (params.date_fin) queryParams.append("date_fin", params.date_fin);
+      if (params.date_debut) filtres.date_debut = params.date_debut;
+      if (params.date_fin) filtres.date_fin = params.date_fin;
 
-      const url = `/api_user/ventes/${
-        queryParams.toString() ? "?" + queryParams.toString() : ""
-      }`;
-      const response = await apiClient.get(url);
-      const ventesData = Array.isArray(response.data) ? response.data : [];
+      const ventesData = await chargerToutesLesPages("/api_user/ventes/", {
+        params: filtres,
+      });
 
       setVentes(ventesData);
       setStats(calculerStats(ventesData));
@@ -169,6 +172,10 @@ const MesVentes = () => {
     }
   }, [isAuthenticated]);
 
+  useEffect(() => {
+    return () => rapportAbortRef.current?.abort();
+  }, []);
+
   // ===== GESTION DU FORMULAIRE =====
   const handleChange = (e) => {
     const { name, value } = e.target;
@@ -327,17 +334,57 @@ const MesVentes = () => {
 
   // ===== GÉNÉRATION DE RAPPORT =====
   const genererRapport = async () => {
+    if (!dateFilter) {
+      setError("Veuillez sélectionner un mois pour générer le rapport");
+      return;
+    }
+
+    // Un seul suivi à la fois : le précédent est abandonné
+    rapportAbortRef.current?.abort();
+    const controller = new AbortController();
+    rapportAbortRef.current = controller;
+    const { signal } = controller;
+
+    const attendre = (ms) =>
+      new Promise((resolve, reject) => {
+        const timer = setTimeout(resolve, ms);
+        signal.addEventListener("abort", () => {
+          clearTimeout(timer);
+          reject(new DOMException("Suivi annulé", "AbortError"));
+        });
+      });
+
     try {
-      if (!dateFilter) {
-        setError("Veuillez sélectionner un mois pour générer le rapport");
-        return;
+      // Mettre le rendu du PDF en file d'attente côté serveur
+      let { data: tache } = await apiClient.post(
+        "/api_user/rapports/ventes/taches/",
+        { mois: dateFilter },
+        { signal }
+      );
+      setMessage("Génération du rapport en cours...");
+
+      // Suivre la tâche jusqu'à ce que le PDF soit prêt, sans dépasser la durée maximale
+      const limite = Date.now() + RAPPORT_DUREE_MAX_MS;
+      while (tache.statut === "en_attente" || tache.statut === "en_cours") {
+        if (Date.now() >= limite) {
+          throw new Error("Délai de génération du rapport dépassé");
+        }
+        await attendre(RAPPORT_INTERVALLE_MS);
+        ({ data: tache } = await apiClient.get(
+          `/api_user/rapports/ventes/taches/${tache.id}/`,
+          { signal }
+        ));
+      }
+      if (tache.statut !== "termine") {
+        throw new Error(tache.erreur || "Échec de la génération du rapport");
       }
 
-      // Demander le PDF au serveur
+      // Télécharger le PDF produit
       const response = await apiClient.get(
-        `/api_user/rapports/ventes/?mois=${dateFilter}`,
+        `/api_user/rapports/ventes/taches/${tache.id}/pdf/`,
         {
           responseType: "blob", // Important pour recevoir le PDF
+          signal,
         }
       );
 
@@ -362,8 +409,14 @@ const MesVentes = () => {
 
       setMessage("Rapport PDF généré avec succès !");
     } catch (err) {
+      // Composant démonté ou nouvelle demande : rien à afficher
+      if (signal.aborted) return;
       console.error("Erreur lors de la génération du rapport:", err);
       setError("Erreur lors de la génération du rapport PDF");
+    } finally {
+      if (rapportAbortRef.current === controller) {
+        rapportAbortRef.current = null;
+      }
     }
   };
 